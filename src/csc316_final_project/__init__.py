@@ -1,17 +1,75 @@
+import importlib.util
+import json
+import os
+import subprocess
+import sys
 from time import sleep
 import click
-import torch
 
-from csc316_final_project.keyboard_emulation import HollowKnightController
-from csc316_final_project.neural import HollowNN, train_model
-from csc316_final_project.object_detection import load_yolo_model
-from csc316_final_project.obs import OBSBridge
-from csc316_final_project.util import IdleLock
+# everything heavy (torch, ultralytics, opencv, pynput, obs) is imported inside the commands that
+# need it, so `--help` and `python -m csc316_final_project.monitor` don't pay for it.
+# the option choices below mirror the modules' own lists (named in the comments).
+DETECTOR_BACKENDS = ('ultralytics', 'onnx', 'openvino') # detector.BACKENDS
+ACTOR_BACKENDS = ('eager', 'compile', 'int8-dynamic') # learner.ACTOR_BACKENDS
+EXPORT_FORMATS = ('torchscript', 'int8-dynamic', 'int8-static', 'onnx') # inference.EXPORT_FORMATS
+BENCH_SUITES = ('perception', 'model', 'monitor', 'overlay') # bench.SUITES
+OVERRUN_POLICIES = ('skip', 'downshift', 'frameskip') # pacing.OVERRUN_POLICIES
+LINK_MODES = ('hardlink', 'symlink', 'copy') # model_training.LINK_MODES
+VECTOR_MODES = ('sync', 'thread') # vector_env.VECTOR_MODES
+
+def _load_or_create_model(previous, frame_stack):
+    # returns (model, frame_stack), taking the stack depth from the checkpoint if there is one
+    from csc316_final_project.neural import HollowNN, load_model
+    if previous:
+        model, saved_frame_stack = load_model(previous)
+        if frame_stack is not None and frame_stack != saved_frame_stack:
+            raise click.UsageError(f"{previous} was trained with --frame-stack {saved_frame_stack}, not {frame_stack}")
+        print(f"Loaded model from {previous}")
+        return model, saved_frame_stack
+    frame_stack = frame_stack or 1
+    return HollowNN((3 * frame_stack, 84, 84)), frame_stack
+
+def _import_time_report(args, top=15):
+    # runs the command again under `python -X importtime` and sums up where the startup time went
+    command = [sys.executable, '-X', 'importtime', '-c', 'from csc316_final_project import cli; cli()', *args]
+    process = subprocess.run(command, stderr=subprocess.PIPE, text=True)
+    by_package = {}
+    total = 0
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:'):
+            sys.stderr.write(line + '\n') # the command's own stderr
+            continue
+        if 'self [us]' in line:
+            continue # the header
+        self_us, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        by_package[package] = by_package.get(package, 0) + int(self_us)
+        total += int(self_us)
+    print(f"\nImport time: {total / 1e6:.3f} s total, by top-level package:", file=sys.stderr)
+    for package, us in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {package:<30} {us / 1e6:8.3f} s  ({us / max(total, 1):5.1%})", file=sys.stderr)
+    sys.exit(process.returncode)
+
+def _import_time(ctx, param, value):
+    # eager, so it also covers `--import-time --help` (help exits before the group itself runs)
+    if value and not ctx.resilient_parsing:
+        _import_time_report([arg for arg in sys.argv[1:] if arg != '--import-time'])
 
 @click.group()
+@click.option('--import-time', is_flag=True, is_eager=True, expose_value=False, callback=_import_time, help='Run the command (or --help, if it comes after this), then report which imports its startup time went to')
 def cli() -> None:
     """Entry point for the csc316_final_project package."""
-    pass
+
+def _parse_min_hold(values):
+    # ('jump=0.2', ...) -> {'jump': 0.2}
+    min_hold = {}
+    for value in values:
+        action, _, seconds = value.partition('=')
+        try:
+            min_hold[action] = float(seconds)
+        except ValueError:
+            raise click.BadParameter(f"expected ACTION=SECONDS, got '{value}'", param_hint='--min-hold')
+    return min_hold
 
 @cli.command()
 @click.option('--previous', type=click.Path(exists=True, dir_okay=False), help='Path to a previously saved model to continue training from', required=False)
@@ -19,16 +77,112 @@ def cli() -> None:
 @click.option('--start-episode', default=0, help='Start at episode number (for continuing training from a saved model)')
 @click.option('--obs', is_flag=True, help='Run with automatic OBS recordings')
 @click.option('--obs-every-n', default=5, help='Record to OBS every N episodes')
+@click.option('--obs-host', default='localhost', help="OBS websocket server's host")
+@click.option('--obs-port', default=4455, help="OBS websocket server's port (python -m csc316_final_project.obs_stub runs a fake one)")
+@click.option('--obs-password', default='password', help="OBS websocket server's password")
 @click.option('--monitor-panel', is_flag=True, help='Show the monitor panel during training')
-def train(previous: str, episodes: int = 1000, start_episode: int = 0, obs=False, obs_every_n=5, monitor_panel=False) -> None:
-    input_shape = (3, 84, 84)
-    model = HollowNN(input_shape)
-    if previous:
-        model.load_state_dict(torch.load(str(previous)))
-        print(f"Loaded model from {previous}")
-    controller = HollowKnightController()
-    fk_detect_model = load_yolo_model()
-    obs_bridge = OBSBridge(record_every_n=obs_every_n) if obs else None
+@click.option('--run-id', help='Name for this run on the monitor panel (default: the process id)')
+@click.option('--env', 'env_backend', type=click.Choice(['live', 'replay']), default='live', help='Play the real game, or replay a recording headless (for benchmarking the loop)')
+@click.option('--replay-source', type=click.Path(exists=True), help='Video file or frame directory for --env replay')
+@click.option('--max-episode-steps', type=int, help='End episodes after this many steps')
+@click.option('--capture-backend', type=click.Choice(['sync', 'imagegrab', 'x11']), default='sync', help='How to grab frames; anything but sync captures on a background thread (x11 needs the x11 extra)')
+@click.option('--capture-fps', default=0, help='Cap the background capture rate (0 = as fast as possible)')
+@click.option('--window-poll', default=2.0, help='Re-check the game window position every N seconds (0 = only on window manager events)')
+@click.option('--no-boss-detection', is_flag=True, help="Don't run YOLO at all (enemy_damaged is always False), e.g. without best.pt")
+@click.option('--detector', 'detector_backend', type=click.Choice(DETECTOR_BACKENDS), default='ultralytics', help='How to run the boss detector; onnx/openvino export best.pt on first use')
+@click.option('--detector-imgsz', type=int, help='Boss detector input size [default: 640 for ultralytics, 320 otherwise]')
+@click.option('--yolo-every-n', default=5, help='Run YOLO every N frames and track False Knight in between (1 = every frame)')
+@click.option('--track-max-missed', default=10, help='Drop the tracker after this many frames without a YOLO detection')
+@click.option('--track-max-scale-change', default=0.5, help='Re-detect if the tracked box changes area by more than this fraction')
+@click.option('--perception-workers', default=3, help='Threads for health CV, boss detection and preprocessing (1 = run them in sequence)')
+@click.option('--train-mode', type=click.Choice(['online', 'replay']), default='online', help='Learn from each step as it happens, or from minibatches sampled from a replay buffer')
+@click.option('--replay-capacity', default=100_000, help='Replay buffer size, in transitions')
+@click.option('--batch-size', default=32, help='Minibatch size in replay mode')
+@click.option('--learning-starts', default=1000, help='Transitions to collect before replay training starts')
+@click.option('--async-learner', is_flag=True, help='Train on a separate thread, acting with a periodically synced copy of the model')
+@click.option('--sync-every', default=50, help='With --async-learner, refresh the acting model every N optimizer steps')
+@click.option('--actor-backend', type=click.Choice(ACTOR_BACKENDS), default='eager', help='With --async-learner, how the acting model runs (int8-dynamic: CPU only)')
+@click.option('--frame-stack', type=int, help='Number of recent frames the model sees at once [default: 1, or whatever --previous was trained with]')
+@click.option('--record-dir', type=click.Path(file_okay=False), help='Record every step to this directory, for train-offline')
+@click.option('--step-hz', type=float, help='Control rate to hold steps to [default: 35 live, unpaced with --env replay]')
+@click.option('--overrun', type=click.Choice(OVERRUN_POLICIES), default='skip', help="When a step overruns its slot: skip the missed slots, or also lower the rate (downshift) or raise the action repeat (frameskip) if it keeps happening")
+@click.option('--action-repeat', default=1, type=click.IntRange(min=1), help='Hold each decision for N steps, only running the model every N steps')
+@click.option('--min-hold', multiple=True, metavar='ACTION=SECONDS', help='Keep ACTION down for at least this long once pressed, e.g. jump=0.2 for full jumps (repeatable)')
+@click.option('--profile', is_flag=True, help='Time every stage of the control loop; summaries go to the monitor and --profile-log')
+@click.option('--profile-log', default='profile.jsonl', type=click.Path(dir_okay=False), help='With --profile, append per-episode timing summaries here')
+@click.option('--checkpoint-dir', default='checkpoints', type=click.Path(file_okay=False), help='Save the whole training state (model, optimizer, RNG, replay buffer) here, in the background')
+@click.option('--checkpoint-every', default=10, type=click.IntRange(min=1), help='Checkpoint every N episodes (and whenever training crashes or is interrupted)')
+@click.option('--keep-checkpoints', default=3, type=click.IntRange(min=1), help='How many of the most recently written checkpoints to keep')
+@click.option('--resume', is_flag=True, help='Carry on from the latest checkpoint in --checkpoint-dir (instead of --previous/--start-episode)')
+@click.option('--checkpoint-replay/--no-checkpoint-replay', default=True, help='Include the replay buffer in checkpoints (only what changed since the last one gets written, and only the newest checkpoint has it)')
+def train(previous: str, episodes: int = 1000, start_episode: int = 0, obs=False, obs_every_n=5, obs_host='localhost', obs_port=4455, obs_password='password', monitor_panel=False, run_id=None, env_backend='live', replay_source=None, max_episode_steps=None, capture_backend='sync', capture_fps=0, window_poll=2.0, no_boss_detection=False, detector_backend='ultralytics', detector_imgsz=None, yolo_every_n=5, track_max_missed=10, track_max_scale_change=0.5, perception_workers=3, train_mode='online', replay_capacity=100_000, batch_size=32, learning_starts=1000, async_learner=False, sync_every=50, actor_backend='eager', frame_stack=None, record_dir=None, step_hz=None, overrun='skip', action_repeat=1, min_hold=(), profile=False, profile_log='profile.jsonl', checkpoint_dir='checkpoints', checkpoint_every=10, keep_checkpoints=3, resume=False, checkpoint_replay=True) -> None:
+    from csc316_final_project.checkpoint import CheckpointManager
+    from csc316_final_project.dataset import EpisodeRecorder
+    from csc316_final_project.env import live_env, replay_env
+    from csc316_final_project.keyboard_emulation import ActionScheduler, NullController
+    from csc316_final_project.neural import model_from_checkpoint, train_model
+    from csc316_final_project.object_detection import FalseKnightTracker
+    from csc316_final_project.perception import Perception
+    from csc316_final_project.profiling import profiler
+    from csc316_final_project.replay import ReplayBuffer
+
+    if env_backend == 'replay' and not replay_source:
+        raise click.UsageError("--env replay needs --replay-source")
+    if actor_backend != 'eager' and not async_learner:
+        raise click.UsageError("--actor-backend needs --async-learner (otherwise the model acts and learns in one)")
+    if capture_backend == 'x11' and importlib.util.find_spec('mss') is None:
+        raise click.UsageError("--capture-backend x11 needs mss; install the x11 extra (`uv sync --extra x11`)")
+    min_hold = _parse_min_hold(min_hold)
+    if run_id is not None:
+        from csc316_final_project.monitor import default_client
+        default_client(run_id=run_id)
+    if profile:
+        profiler.enable()
+    checkpoints = CheckpointManager(checkpoint_dir, keep=keep_checkpoints)
+    resume_state = None
+    if resume:
+        if previous or start_episode:
+            raise click.UsageError("--resume picks the model and episode up from the checkpoint; drop --previous/--start-episode (or --resume)")
+        resume_state = checkpoints.load()
+        if resume_state is None:
+            print(f"No checkpoints in {checkpoint_dir} yet, starting from scratch")
+    elif checkpoints.latest() is not None:
+        # a new run would rotate them away and take over their replay/
+        raise click.UsageError(f"{checkpoint_dir} already has another run's checkpoints (up to {os.path.basename(checkpoints.latest())}); pass --resume to carry on from them, or pick another --checkpoint-dir")
+    if resume_state is not None:
+        model, saved_frame_stack = model_from_checkpoint(resume_state)
+        if frame_stack is not None and frame_stack != saved_frame_stack:
+            raise click.UsageError(f"{checkpoints.latest()} was trained with --frame-stack {saved_frame_stack}, not {frame_stack}")
+        frame_stack = saved_frame_stack
+        print(f"Resuming from {checkpoints.latest()}")
+    else:
+        model, frame_stack = _load_or_create_model(previous, frame_stack)
+    fk_tracker = None
+    if not no_boss_detection:
+        from csc316_final_project.detector import load_detector
+        fk_tracker = FalseKnightTracker(load_detector(detector_backend, detector_imgsz), detect_every_n=yolo_every_n, max_missed_frames=track_max_missed, max_scale_change=track_max_scale_change)
+    perception = Perception(fk_tracker, workers=perception_workers)
+    replay = ReplayBuffer(replay_capacity, (3, 84, 84), frame_stack=frame_stack) if train_mode == 'replay' else None
+    recorder = EpisodeRecorder(record_dir) if record_dir else None
+    train_kwargs = dict(start_episode=start_episode, replay=replay, batch_size=batch_size, learning_starts=learning_starts, async_learner=async_learner, sync_every=sync_every, frame_stack=frame_stack, recorder=recorder, profile_log=profile_log if profile else None, actor_backend=actor_backend, checkpoints=checkpoints, checkpoint_every=checkpoint_every, checkpoint_replay=checkpoint_replay, resume_state=resume_state)
+
+    if env_backend == 'replay':
+        # headless: no game, no keyboard, no waiting for anyone
+        controller = ActionScheduler(NullController(), repeat=action_repeat, min_hold=min_hold)
+        env = replay_env(replay_source, perception, controller=controller, max_episode_steps=max_episode_steps, step_hz=step_hz or 0, overrun=overrun)
+        try:
+            train_model(model, env, None, episodes, **train_kwargs)
+        finally:
+            checkpoints.close()
+            perception.close()
+        return
+
+    from csc316_final_project.capture import FrameGrabber, make_backend
+    from csc316_final_project.keyboard_emulation import HollowKnightController
+    from csc316_final_project.obs import OBSBridge
+    from csc316_final_project.util import IdleLock, WindowTracker
+    controller = ActionScheduler(HollowKnightController(), repeat=action_repeat, min_hold=min_hold)
+    obs_bridge = OBSBridge(obs_host, obs_port, obs_password, record_every_n=obs_every_n) if obs else None
 
     input("Press Enter to start training...")
     print("Starting in 5 seconds!")
@@ -38,8 +192,183 @@ def train(previous: str, episodes: int = 1000, start_episode: int = 0, obs=False
         spawn_kitty_panel()
     sleep(2)
 
-    with IdleLock():
-        train_model(model, controller, obs_bridge, fk_detect_model, episodes, start_episode=start_episode)
+    # the game should be focused by now, so this is the window we'll keep tracking
+    window = WindowTracker(poll_interval=window_poll).start()
+    grabber = None
+    if capture_backend != 'sync':
+        grabber = FrameGrabber(make_backend(capture_backend), bbox_fn=window, max_fps=capture_fps).start()
+    pacing = {'step_hz': step_hz} if step_hz is not None else {}
+    env = live_env(perception, controller, grabber, window, max_episode_steps=max_episode_steps, overrun=overrun, **pacing)
+
+    try:
+        with IdleLock():
+            train_model(model, env, obs_bridge, episodes, **train_kwargs)
+    finally:
+        checkpoints.close()
+        if obs_bridge is not None:
+            obs_bridge.close()
+        if grabber is not None:
+            grabber.stop()
+        perception.close()
+        window.stop()
+
+@cli.command('train-offline')
+@click.argument('record_dir', type=click.Path(exists=True, file_okay=False))
+@click.option('--previous', type=click.Path(exists=True, dir_okay=False), help='Path to a previously saved model to continue training from', required=False)
+@click.option('--steps', default=10_000, help='Number of minibatches to train on')
+@click.option('--batch-size', default=64, help='Minibatch size')
+@click.option('--lr', default=1e-4, help='Learning rate')
+@click.option('--frame-stack', type=int, help='Number of recent frames the model sees at once [default: 1, or whatever --previous was trained with]')
+@click.option('--save-every', default=1000, help='Save a checkpoint every N steps')
+def train_offline_command(record_dir, previous=None, steps=10_000, batch_size=64, lr=1e-4, frame_stack=None, save_every=1000) -> None:
+    """Train on play recorded with `train --record-dir`, without the game running."""
+    from csc316_final_project.dataset import OfflineDataset
+    from csc316_final_project.neural import train_offline
+    model, frame_stack = _load_or_create_model(previous, frame_stack)
+    dataset = OfflineDataset(record_dir, frame_stack=frame_stack)
+    train_offline(model, dataset, steps, batch_size=batch_size, lr=lr, frame_stack=frame_stack, save_every=save_every)
+
+@cli.command()
+@click.argument('model_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--output-dir', default='exported', type=click.Path(file_okay=False), help='Where to write the exported models')
+@click.option('--format', 'formats', multiple=True, type=click.Choice(EXPORT_FORMATS), help='Formats to export (repeatable) [default: all]')
+@click.option('--calibration', type=click.Path(exists=True), help='Recorded play (from train --record-dir), a video or a frame directory, for int8-static and the accuracy check [default: random pixels]')
+@click.option('--samples', default=512, help='Screens to calibrate and check accuracy on')
+def export(model_path, output_dir='exported', formats=(), calibration=None, samples=512) -> None:
+    """Export a trained model for fast CPU inference, and check its decisions against the original."""
+    from csc316_final_project import inference
+    from csc316_final_project.neural import load_model
+    model, frame_stack = load_model(model_path, map_location='cpu')
+    if calibration is None:
+        print("No --calibration given, using random pixels (int8-static scales will be off)")
+    screens = inference.calibration_screens(calibration, samples, frame_stack)
+    # calibrate on half, check on the other half
+    calibration_set, check_set = screens[:len(screens) // 2], screens[len(screens) // 2:]
+    artifacts = inference.export_artifacts(model, output_dir, formats or inference.EXPORT_FORMATS, calibration_set)
+
+    candidates = {}
+    for fmt, artifact in artifacts.items():
+        if isinstance(artifact, Exception):
+            print(f"{fmt}: not exported ({type(artifact).__name__}: {artifact})")
+        else:
+            candidates[fmt] = inference.load_artifact(artifact)
+    report = inference.check_accuracy(model, candidates, check_set)
+    print(f"fp32: batch-1 latency {inference.latency_ms(model.eval(), check_set[0]):.2f} ms")
+    for fmt, stats in report.items():
+        stats['path'] = artifacts[fmt]
+        stats['latency_ms'] = inference.latency_ms(candidates[fmt], check_set[0])
+        print(f"{fmt}: {stats['path']}, same decisions on {stats['decision_agreement']:.1%} of screens ({stats['action_agreement']:.1%} of actions), max logit diff {stats['max_abs_logit_diff']:.4f}, batch-1 latency {stats['latency_ms']:.2f} ms")
+    report_path = os.path.join(output_dir, 'report.json')
+    with open(report_path, 'w') as f:
+        json.dump({'model': model_path, 'calibration': calibration, 'samples': len(check_set), 'formats': report}, f, indent=2)
+    print(f"Report saved to {report_path}")
+
+@cli.command('build-dataset')
+@click.argument('sprite_dir', type=click.Path(exists=True, file_okay=False))
+@click.argument('background_dir', type=click.Path(exists=True, file_okay=False))
+@click.argument('output_dir', type=click.Path(file_okay=False))
+@click.option('--num-images', default=10_000, help='Number of composite images')
+@click.option('--split-ratio', default=0.8, help='Fraction of images that go to the train split')
+@click.option('--seed', default=0, help='Seed for placement and the split; the same seed gives the same dataset')
+@click.option('--workers', type=int, help='Processes to draw images with [default: all cores]')
+@click.option('--compress-level', default=6, type=click.IntRange(0, 9), help='PNG compression level (lower: bigger files, faster)')
+@click.option('--link', type=click.Choice(LINK_MODES), default='hardlink', help='How images get into the train/val directories')
+def build_dataset_command(sprite_dir, background_dir, output_dir, num_images=10_000, split_ratio=0.8, seed=0, workers=None, compress_level=6, link='hardlink') -> None:
+    """Generate, label and split the boss detector dataset in one pass; re-runs only redo what changed."""
+    from csc316_final_project.model_training import build_dataset
+    build_dataset(sprite_dir, background_dir, output_dir, num_images=num_images, split_ratio=split_ratio, seed=seed, workers=workers, compress_level=compress_level, link=link)
+
+@cli.command('train-detector')
+@click.argument('data', type=click.Path(exists=True, dir_okay=False))
+@click.argument('sprite_dir', type=click.Path(exists=True, file_okay=False))
+@click.argument('background_dir', type=click.Path(exists=True, file_okay=False))
+@click.option('--model', 'model_path', default='yolov8n.pt', help='Weights (or model .yaml) to start from')
+@click.option('--epochs', default=50, help='Number of epochs')
+@click.option('--images-per-epoch', default=10_000, help='Synthetic images per epoch (each epoch gets new ones)')
+@click.option('--imgsz', default=640, help='Training image size')
+@click.option('--batch', default=16, help='Batch size')
+@click.option('--workers', default=8, help='Data loader workers compositing images')
+@click.option('--scale', nargs=2, type=float, default=(0.5, 0.5), show_default=True, help='Range of sprite sizes, as a fraction of the background')
+@click.option('--device', help='Device to train on [default: whatever Ultralytics picks]')
+def train_detector_command(data, sprite_dir, background_dir, model_path='yolov8n.pt', epochs=50, images_per_epoch=10_000, imgsz=640, batch=16, workers=8, scale=(0.5, 0.5), device=None) -> None:
+    """Train the boss detector on composites made in memory as it trains, validating on DATA's val split (e.g. build-dataset's dataset.yaml)."""
+    from csc316_final_project.synthetic import SyntheticDetectionDataset, train_detector
+    dataset = SyntheticDetectionDataset(sprite_dir, background_dir, imgsz=imgsz, length=images_per_epoch, scale=scale)
+    device_args = {'device': device} if device else {}
+    train_detector(data, dataset, model_path, epochs=epochs, batch=batch, workers=workers, **device_args)
+
+@cli.command('eval-detector')
+@click.argument('dataset_dir', type=click.Path(exists=True, file_okay=False))
+@click.option('--split', default='val', help='Which split of DATASET_DIR (images/<split>, labels/<split>) to evaluate on')
+@click.option('--backend', 'backends', multiple=True, type=click.Choice(DETECTOR_BACKENDS), help='Backends to compare (repeatable) [default: all that are installed]')
+@click.option('--imgsz', 'sizes', multiple=True, type=int, default=(640, 480, 416, 320, 256), show_default=True, help='Input sizes to compare (repeatable)')
+@click.option('--weights', type=click.Path(exists=True, dir_okay=False), help='Model to evaluate [default: best.pt]')
+@click.option('--limit', type=int, help='Only use the first N images')
+@click.option('--output', default='detector_eval.json', type=click.Path(dir_okay=False), help='Where to write the results (JSON)')
+def eval_detector(dataset_dir, split='val', backends=(), sizes=(640, 480, 416, 320, 256), weights=None, limit=None, output='detector_eval.json') -> None:
+    """Compare the boss detector's mAP and latency across backends and input sizes, on a held-out set."""
+    from csc316_final_project import detector
+    images_dir, labels_dir = os.path.join(dataset_dir, 'images', split), os.path.join(dataset_dir, 'labels', split)
+    results = []
+    for backend in backends or detector.BACKENDS:
+        for imgsz in sizes:
+            try:
+                fk_detector = detector.load_detector(backend, imgsz, path=weights)
+            except RuntimeError as e: # backend not installed
+                print(f"{backend}: skipped ({e})")
+                break
+            result = {'backend': backend, 'imgsz': imgsz, **detector.evaluate(fk_detector, images_dir, labels_dir, limit)}
+            results.append(result)
+            print(f"{backend:<12} {imgsz:>4}px  mAP50 {result['map50']:.3f}  mAP50-95 {result['map50_95']:.3f}  p50 {result['latency_p50_ms']:7.1f} ms  p95 {result['latency_p95_ms']:7.1f} ms")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+@cli.command('bench')
+@click.option('--output', default='bench.json', type=click.Path(dir_okay=False), help='Where to write the results (JSON)')
+@click.option('--compare', 'baseline', type=click.Path(exists=True, dir_okay=False), help='Earlier results to compare against')
+@click.option('--threshold', default=0.1, help='With --compare, fail if a case got more than this fraction slower')
+@click.option('--suite', 'suites', multiple=True, type=click.Choice(BENCH_SUITES), help='Only run these suites (repeatable) [default: all]')
+@click.option('--only', help='Only run cases whose name contains this')
+@click.option('--min-time', default=1.0, help='Seconds to spend timing each case')
+def bench_command(output='bench.json', baseline=None, threshold=0.1, suites=(), only=None, min_time=1.0) -> None:
+    """Time the perception, model and monitor hot paths on synthetic data (no game needed)."""
+    from csc316_final_project import bench as benchmarks
+    results = benchmarks.run_benchmarks(suites, only=only, min_time=min_time)
+    benchmarks.save_results(output, results)
+    print(f"Results saved to {output}")
+    if baseline:
+        print(f"\nCompared with {baseline}:")
+        regressions = benchmarks.compare(benchmarks.load_results(baseline), results, threshold)
+        if regressions:
+            print(f"{len(regressions)} case(s) more than {threshold:.0%} slower")
+            sys.exit(1)
+
+@cli.command('bench-vector')
+@click.option('--replay-source', type=click.Path(exists=True), help='Video file or frame directory for the envs to replay [default: a synthetic frame]')
+@click.option('--envs', 'counts', default='1,2,4,8,16', help='Comma-separated numbers of envs to try')
+@click.option('--mode', type=click.Choice(VECTOR_MODES), default='sync', help='Step the envs one after another, or each on its own thread')
+@click.option('--steps', default=100, help='Vector steps to time for each number of envs')
+@click.option('--previous', type=click.Path(exists=True, dir_okay=False), help='Act with this saved model [default: an untrained one]')
+@click.option('--output', type=click.Path(dir_okay=False), help='Also write the report here (JSON)')
+def bench_vector_command(replay_source=None, counts='1,2,4,8,16', mode='sync', steps=100, previous=None, output=None) -> None:
+    """Aggregate steps/sec of N headless envs acting through one batched forward pass."""
+    import torch
+    from csc316_final_project.vector_env import scaling_report
+    try:
+        counts = [int(n) for n in counts.split(',')]
+    except ValueError:
+        raise click.BadParameter(f"expected numbers like 1,2,4, got '{counts}'", param_hint='--envs')
+    model, frame_stack = _load_or_create_model(previous, None)
+    if frame_stack != 1:
+        raise click.UsageError(f"{previous} was trained with --frame-stack {frame_stack}; bench-vector only runs single frames")
+    device = torch.accelerator.current_accelerator().type if torch.accelerator.is_available() else "cpu"
+    print(f"Using {device} device, {mode} mode, {steps} steps per run")
+    report = scaling_report(counts, replay_source, mode=mode, steps=steps, model=model, device=device)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {output}")
 
 def run():
     pass
@@ -0,0 +1,243 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import datetime
+from importlib import resources
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+# everything here runs without the game: frames are synthetic (seeded, so every run sees the
+# same pixels), the YOLO model is best.pt if it's around and an untrained yolov8n otherwise.
+
+RESOLUTIONS = [(1280, 720), (1920, 1080), (2560, 1440)]
+BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+def synthetic_frame(width, height, health=5, seed=0):
+    """A noisy dark RGB frame with `health` masks in the HUD and a bright blob where a boss would be."""
+    from csc316_final_project.cv import HealthDetector
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 60, (height, width, 3), dtype=np.uint8)
+    template = cv2.cvtColor(HealthDetector().template, cv2.COLOR_GRAY2RGB)
+    th, tw = template.shape[:2]
+    x0, y0 = width // 12, height // 12
+    for i in range(health):
+        x = x0 + i * (tw + tw // 2)
+        frame[y0:y0 + th, x:x + tw] = template
+    bx, by, bw, bh = boss_bbox(width, height)
+    frame[by:by + bh, bx:bx + bw] = rng.integers(150, 256, (bh, bw, 3), dtype=np.uint8)
+    return frame
+
+def boss_bbox(width, height):
+    return (width // 2, height // 3, width // 6, height // 3)
+
+def _best_pt():
+    with resources.path('csc316_final_project', 'best.pt') as path:
+        return path if path.exists() else None
+
+def _yolo_model():
+    from ultralytics import YOLO
+    if (path := _best_pt()) is not None:
+        return YOLO(path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return YOLO('yolov8n.yaml') # same architecture, random weights: fine for timing
+
+# benchmarks: each yields (name, fn) cases, timed as "one call of fn"
+
+def bench_perception():
+    from csc316_final_project.cv import get_player_health
+    from csc316_final_project.object_detection import detect_fk_hit, detect_flash
+    from csc316_final_project.perception import preprocess_frame
+    frames = {res: synthetic_frame(*res) for res in RESOLUTIONS}
+    for (w, h), frame in frames.items():
+        yield f"cv.get_player_health[{w}x{h}]", lambda frame=frame: get_player_health(frame)
+    for (w, h), frame in frames.items():
+        x, y, bw, bh = boss_bbox(w, h)
+        crop = np.ascontiguousarray(frame[y:y + bh, x:x + bw])
+        yield f"object_detection.detect_flash[{w}x{h}]", lambda crop=crop: detect_flash(crop)
+    for (w, h), frame in frames.items():
+        yield f"perception.preprocess_frame[{w}x{h}]", lambda frame=frame: preprocess_frame(frame)
+    model = _yolo_model()
+    for (w, h), frame in frames.items():
+        yield f"object_detection.detect_fk_hit[{w}x{h}]", lambda frame=frame: detect_fk_hit(frame, model)
+
+def bench_model():
+    import torch
+    from csc316_final_project.neural import HollowNN, action_loss, to_tensor
+    torch.manual_seed(0)
+    model = HollowNN((3, 84, 84))
+    rng = np.random.default_rng(0)
+    for batch_size in BATCH_SIZES:
+        screens = rng.integers(0, 256, (batch_size, 3, 84, 84), dtype=np.uint8)
+        actions = torch.from_numpy(rng.random((batch_size, 7)) < 0.5)
+        rewards = torch.from_numpy(rng.standard_normal(batch_size).astype(np.float32))
+
+        def forward(screens=screens):
+            with torch.inference_mode():
+                model(to_tensor(screens, 'cpu'))
+
+        def forward_backward(screens=screens, actions=actions, rewards=rewards):
+            model.zero_grad(set_to_none=True)
+            action_loss(model(to_tensor(screens, 'cpu')), actions, rewards).backward()
+
+        yield f"neural.HollowNN.forward[batch={batch_size}]", forward
+        yield f"neural.HollowNN.forward_backward[batch={batch_size}]", forward_backward
+
+def bench_monitor():
+    from csc316_final_project.monitor import MessageReader, MonitorClient
+    with tempfile.TemporaryDirectory(prefix='csc316-bench-') as tmp:
+        # a bare-bones panel: tells us when each message has arrived and been decoded
+        socket_path = os.path.join(tmp, 'monitor.sock')
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+        server.listen(1)
+        received = threading.Event()
+
+        def serve():
+            conn, _ = server.accept()
+            reader = MessageReader()
+            while chunk := conn.recv(65536):
+                if reader.feed(chunk):
+                    received.set()
+            conn.close()
+
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        client = MonitorClient(socket_path, rate=1e-3) # flushed by hand below, never by its thread
+        client.flush() # connect
+        controls = {'left': True, 'right': False, 'up': False, 'down': False, 'jump': True, 'attack': False, 'focus': False}
+
+        def round_trip():
+            received.clear()
+            client.publish({'controller_input': controls, 'reward': 1.5})
+            client.flush()
+            received.wait(1.0)
+
+        try:
+            yield "monitor.send_info.publish", lambda: client.publish({'controller_input': controls, 'reward': 1.5})
+            yield "monitor.send_info.round_trip", round_trip
+        finally:
+            client.close()
+            server.close()
+
+def bench_overlay():
+    from PIL import Image
+    from csc316_final_project.model_training import overlay_random_sprite_on_background
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory(prefix='csc316-bench-') as root:
+        folders = {name: os.path.join(root, name) for name in ('sprites', 'backgrounds', 'output')}
+        for folder in folders.values():
+            os.makedirs(folder)
+        for i in range(4):
+            sprite = rng.integers(0, 256, (400, 300, 4), dtype=np.uint8)
+            Image.fromarray(sprite, 'RGBA').save(os.path.join(folders['sprites'], f'sprite_{i}.png'))
+            background = rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8)
+            Image.fromarray(background).save(os.path.join(folders['backgrounds'], f'background_{i}.png'))
+        images = 8
+
+        def overlay():
+            random.seed(0)
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                overlay_random_sprite_on_background(folders['sprites'], folders['backgrounds'], folders['output'], os.path.join(root, 'metadata.jsonl'), num_images=images, workers=1)
+
+        yield f"model_training.overlay_random_sprite_on_background[{images} images]", overlay
+
+SUITES = {
+    'perception': bench_perception,
+    'model': bench_model,
+    'monitor': bench_monitor,
+    'overlay': bench_overlay,
+}
+
+def time_case(fn, min_time=1.0, min_repeats=5, max_repeats=10_000, warmup=2):
+    """Per-call times of fn, in seconds: a couple of warm-up calls, then calls until min_time is up."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    start = perf_counter()
+    while len(times) < max_repeats and (len(times) < min_repeats or perf_counter() - start < min_time):
+        t0 = perf_counter()
+        fn()
+        times.append(perf_counter() - t0)
+    return times
+
+def _summarize(times):
+    times_ms = np.array(times) * 1000
+    return {
+        'median_ms': float(np.median(times_ms)),
+        'mean_ms': float(times_ms.mean()),
+        'min_ms': float(times_ms.min()),
+        'p95_ms': float(np.percentile(times_ms, 95)),
+        'repeats': len(times),
+    }
+
+def _environment():
+    import torch
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'time': datetime.now().isoformat(),
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'torch': torch.__version__,
+        'torch_threads': torch.get_num_threads(),
+        'yolo_model': 'best.pt' if _best_pt() is not None else 'yolov8n.yaml (untrained)',
+    }
+
+def run_benchmarks(suites=None, only=None, min_time=1.0):
+    """Runs the suites (all by default), optionally only cases whose name contains `only`."""
+    results = {}
+    for suite in suites or SUITES:
+        cases = SUITES[suite]()
+        try:
+            for name, fn in cases:
+                if only and only not in name:
+                    continue
+                results[name] = _summarize(time_case(fn, min_time=min_time))
+                print(f"{name:<70} {results[name]['median_ms']:10.3f} ms")
+        finally:
+            cases.close()
+    return {'environment': _environment(), 'results': results}
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Median time ratios (current / baseline) of the cases both runs have.
+    Returns the names of cases that got more than `threshold` slower.
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        before, after = baseline['results'][name]['median_ms'], result['median_ms']
+        ratio = after / before if before > 0 else float('inf')
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{name:<70} {before:10.3f} -> {after:10.3f} ms  ({ratio:5.2f}x){flag}")
+    return regressions
+
+def save_results(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,238 @@
+import os
+import threading
+from time import monotonic, sleep
+
+import cv2
+import numpy as np
+from PIL import ImageGrab
+
+from csc316_final_project.util import get_coords_of_active_window
+
+# all backends hand back RGB uint8 frames, (height, width, 3), same as np.array(ImageGrab.grab())
+# bboxes are (x, y, width, height), same as get_coords_of_active_window
+
+class CaptureBackend:
+    """Something that can produce a frame of the screen (or something pretending to be the screen)."""
+
+    def grab(self, bbox=None) -> np.ndarray:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+class ImageGrabBackend(CaptureBackend):
+    """The original PIL.ImageGrab path. Slow, but works everywhere PIL does."""
+
+    def grab(self, bbox=None):
+        if bbox is not None:
+            x, y, w, h = bbox
+            bbox = (x, y, x + w, y + h) # PIL wants (left, top, right, bottom)
+        return np.asarray(ImageGrab.grab(bbox=bbox).convert('RGB'))
+
+class X11Backend(CaptureBackend):
+    """Grabs through mss (XShm on X11/XWayland); mss is only imported when this is used."""
+
+    def __init__(self):
+        try:
+            import mss
+        except ImportError as e:
+            raise RuntimeError("the x11 capture backend needs mss (`uv sync --extra x11`)") from e
+        self.mss = mss
+        self.sct = None # opened by the first grab, on the thread that does the grabbing
+
+    def grab(self, bbox=None):
+        if self.sct is None:
+            self.sct = self.mss.mss()
+        if bbox is None:
+            region = self.sct.monitors[1] # primary monitor
+        else:
+            x, y, w, h = bbox
+            region = {"left": x, "top": y, "width": w, "height": h}
+        shot = self.sct.grab(region)
+        bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        return cv2.cvtColor(bgra, cv2.COLOR_BGRA2RGB)
+
+    def close(self):
+        if self.sct is not None:
+            self.sct.close()
+
+class ReplayBackend(CaptureBackend):
+    """
+    Frames from a video file or image directory instead of the screen (bbox ignored), looping by default.
+    Paced to `fps` if given, otherwise as fast as they're asked for.
+    """
+
+    IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+    def __init__(self, source, loop=True, fps=None):
+        self.source = str(source)
+        self.loop = loop
+        self.frame_period = 1 / fps if fps else 0
+        self.next_frame_at = 0.0
+        self.index = 0
+        self.cap = None
+        self.files = None
+        if os.path.isdir(self.source):
+            self.files = sorted(
+                os.path.join(self.source, f) for f in os.listdir(self.source)
+                if f.lower().endswith(self.IMAGE_EXTENSIONS)
+            )
+            if not self.files:
+                raise RuntimeError(f"no frames found in '{self.source}'")
+        else:
+            self.cap = cv2.VideoCapture(self.source)
+            if not self.cap.isOpened():
+                raise RuntimeError(f"could not open video '{self.source}'")
+
+    def _read_bgr(self):
+        if self.files is not None:
+            if self.index >= len(self.files):
+                if not self.loop:
+                    return None
+                self.index = 0
+            frame = cv2.imread(self.files[self.index], cv2.IMREAD_COLOR)
+            self.index += 1
+            return frame
+        ok, frame = self.cap.read()
+        if not ok and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read()
+        return frame if ok else None
+
+    def grab(self, bbox=None):
+        if self.frame_period:
+            now = monotonic()
+            if now < self.next_frame_at:
+                sleep(self.next_frame_at - now)
+            self.next_frame_at = max(now, self.next_frame_at) + self.frame_period
+        frame = self._read_bgr()
+        if frame is None:
+            raise EOFError(f"replay source '{self.source}' is exhausted")
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def close(self):
+        if self.cap is not None:
+            self.cap.release()
+
+BACKENDS = {
+    'imagegrab': ImageGrabBackend,
+    'x11': X11Backend,
+    'replay': ReplayBackend,
+}
+
+def make_backend(name, **kwargs) -> CaptureBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"unknown capture backend '{name}' (expected one of {', '.join(BACKENDS)})")
+    return BACKENDS[name](**kwargs)
+
+class FrameRing:
+    """A preallocated ring of frame buffers: one writer fills slots in order, readers copy out the newest one."""
+
+    def __init__(self, slots=3):
+        assert slots >= 2, "need at least two slots so the writer never touches the newest frame"
+        self.num_slots = slots
+        self.buffers = None
+        self.shape = None
+        self.write_index = 0
+        self.latest_index = -1
+        self.frame_id = 0 # number of frames written so far
+        self.frame_time = 0.0 # monotonic time the newest frame was written
+        self.error = None # set by the writer if it dies, so readers stop waiting
+        self.cond = threading.Condition()
+
+    def _allocate(self, shape):
+        # called with self.cond held; readers get nothing until the first frame in the new buffers
+        self.buffers = np.empty((self.num_slots, *shape), dtype=np.uint8)
+        self.shape = shape
+        self.write_index = 0
+        self.latest_index = -1
+
+    def write(self, frame: np.ndarray) -> None:
+        if frame.shape != self.shape:
+            with self.cond:
+                self._allocate(frame.shape)
+        # the slot being written is never the one readers copy from, so this can happen unlocked
+        np.copyto(self.buffers[self.write_index], frame)
+        with self.cond:
+            self.latest_index = self.write_index
+            self.write_index = (self.write_index + 1) % self.num_slots
+            self.frame_id += 1
+            self.frame_time = monotonic()
+            self.cond.notify_all()
+
+    def latest(self, after=0, timeout=None, out=None):
+        """Wait for a frame newer than frame id `after`; returns (frame_id, copy of the frame), or (frame_id, None) on timeout."""
+        with self.cond:
+            has_frame = lambda: self.frame_id > after and self.latest_index >= 0
+            ready = self.cond.wait_for(lambda: has_frame() or self.error is not None, timeout=timeout)
+            if not ready or not has_frame():
+                return self.frame_id, None
+            src = self.buffers[self.latest_index]
+            if out is None or out.shape != src.shape:
+                out = np.empty_like(src)
+            np.copyto(out, src)
+            return self.frame_id, out
+
+class FrameGrabber:
+    """Captures frames into a FrameRing on a background thread. `bbox_fn` finds the window before every grab."""
+
+    def __init__(self, backend: CaptureBackend, bbox_fn=get_coords_of_active_window, slots=3, max_fps=None):
+        self.backend = backend
+        self.bbox_fn = bbox_fn
+        self.ring = FrameRing(slots)
+        self.min_period = 1 / max_fps if max_fps else 0
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_id = 0
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="frame-grabber", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                started = monotonic()
+                bbox = self.bbox_fn() if self.bbox_fn else None
+                self.ring.write(self.backend.grab(bbox))
+                if self.min_period:
+                    remaining = self.min_period - (monotonic() - started)
+                    if remaining > 0:
+                        self._stop.wait(remaining)
+        except Exception as e:
+            # hand the error over to whoever is waiting on a frame
+            self.error = e
+            with self.ring.cond:
+                self.ring.error = e
+                self.ring.cond.notify_all()
+
+    def latest(self, fresh=True, timeout=5.0, out=None) -> np.ndarray:
+        """
+        Return the newest frame. With fresh=True (default), waits for a frame captured after the
+        last one returned, so you never see the same frame twice.
+        """
+        after = self._last_id if fresh else 0
+        frame_id, frame = self.ring.latest(after=after, timeout=timeout, out=out)
+        if frame is None:
+            if self.error is not None:
+                raise RuntimeError("frame capture thread died") from self.error
+            raise TimeoutError(f"no new frame within {timeout}s")
+        self._last_id = frame_id
+        return frame
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        self.backend.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
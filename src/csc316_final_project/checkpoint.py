@@ -0,0 +1,268 @@
+import json
+import os
+import random
+import re
+import threading
+import uuid
+
+import numpy as np
+import torch
+
+from csc316_final_project.replay import REPLAY_ARRAYS
+
+# training checkpoints: everything needed to carry on where a run stopped (weights, optimizer,
+# RNG, the next episode, and the replay buffer if there is one), written in the background.
+# the model part is laid out like save_model's files, so neural.model_from_checkpoint reads them.
+# the replay buffer lives next to them in replay/, one memmapped .npy per array, and each
+# checkpoint only copies and writes the slots that changed since the last one: first to a delta
+# file, then the .pt (which is what commits it), then into the arrays. a crash part way through
+# leaves the delta behind, to be applied again next time. replay/ only ever matches one
+# checkpoint write (replay/owner.json says which), so only that one restores the replay buffer.
+
+_NAME = re.compile(r'checkpoint_(\d+)\.pt$')
+
+def _to_cpu(value):
+    # a detached CPU copy of any tensors in (nested) optimizer state
+    if isinstance(value, torch.Tensor):
+        return value.detach().to('cpu', copy=True)
+    if isinstance(value, dict):
+        return {k: _to_cpu(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_to_cpu(v) for v in value)
+    return value
+
+def snapshot_state(model, optimizer, episode, frame_stack=1, replay=None):
+    """A CPU copy of the training state (replay: only what changed), to resume at `episode`. Take it between updates."""
+    state = {
+        'state_dict': _to_cpu(model.state_dict()),
+        'input_shape': model.input_shape,
+        'frame_stack': frame_stack,
+        'optimizer': _to_cpu(optimizer.state_dict()),
+        'episode': episode,
+        'rng': {
+            'python': random.getstate(),
+            'numpy': np.random.get_state(),
+            'torch': torch.get_rng_state(),
+            'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+        },
+    }
+    if replay is not None:
+        state['replay'] = replay.state_dict(changed_only=True)
+    return state
+
+def _merge_replay(old, new):
+    # new's changes on top of old's, for when a snapshot replaces one that was never written
+    keep = ~np.isin(old['indices'], new['indices'])
+    arrays = {name: np.concatenate([old['arrays'][name][keep], new['arrays'][name]]) for name in new['arrays']}
+    return {**new, 'arrays': arrays, 'indices': np.concatenate([old['indices'][keep], new['indices']])}
+
+def restore(state, optimizer, replay=None):
+    """Puts the optimizer, RNG and replay buffer back how they were (the weights go in with load_model). Returns the episode to start from."""
+    optimizer.load_state_dict(state['optimizer'])
+    rng = state['rng']
+    random.setstate(rng['python'])
+    np.random.set_state(rng['numpy'])
+    torch.set_rng_state(rng['torch'])
+    if rng['cuda'] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(rng['cuda'])
+    if replay is not None and 'replay' in state:
+        try:
+            replay.load_state_dict(state['replay'])
+            print(f"Restored {len(replay)} transitions into the replay buffer")
+        except ValueError as e:
+            print(f"Not restoring the replay buffer: {e}")
+    return state['episode']
+
+def _fsync_replace(tmp, path):
+    with open(tmp, 'rb+') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class CheckpointManager:
+    """Writes checkpoint_<episode>.pt files to `directory` on a background thread, keeping the last `keep` written."""
+
+    def __init__(self, directory='checkpoints', keep=3):
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+        self.replay_dir = os.path.join(directory, 'replay')
+        self._recover()
+        # rotation goes by write order, not episode number: whatever was here before counts as older
+        self.history = self.checkpoints()
+        self.condition = threading.Condition()
+        self.pending = None
+        self.writing = False
+        self.error = None
+        self.saved = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="checkpoints", daemon=True)
+        self._thread.start()
+
+    def checkpoints(self):
+        """Paths of the checkpoints in the directory, oldest first."""
+        found = []
+        for name in os.listdir(self.directory):
+            if (match := _NAME.match(name)):
+                found.append((int(match.group(1)), os.path.join(self.directory, name)))
+        return [path for _, path in sorted(found)]
+
+    def latest(self):
+        checkpoints = self.checkpoints()
+        return checkpoints[-1] if checkpoints else None
+
+    def load(self, path=None, map_location=None):
+        """A checkpoint's state (the latest by default), or None if there isn't one."""
+        path = path or self.latest()
+        if path is None:
+            return None
+        # our own files: they hold numpy arrays and RNG states, not just tensors
+        state = torch.load(path, map_location=map_location, weights_only=False)
+        replay = state.get('replay')
+        if replay is not None and replay.get('arrays') is None:
+            owner = self._replay_owner()
+            arrays = self._replay_arrays(replay['capacity'], replay['obs_shape'], create=False)
+            if owner != replay.get('delta') or arrays is None:
+                # replay/ is gone, or has moved on since: start with an empty buffer
+                if owner is not None:
+                    print(f"Not restoring the replay buffer: {self.replay_dir} has moved on since {os.path.basename(path)} (only the newest checkpoint has it)")
+                del state['replay']
+            else:
+                replay['arrays'] = {name: array[:replay['filled']] for name, array in arrays.items()}
+        return state
+
+    def submit(self, state):
+        if self.error is not None:
+            raise RuntimeError("checkpoint writer died") from self.error
+        with self.condition:
+            if self.pending is not None and 'replay' in self.pending and 'replay' in state:
+                state['replay'] = _merge_replay(self.pending['replay'], state['replay'])
+            self.pending = state
+            self.condition.notify_all()
+
+    def save(self, model, optimizer, episode, frame_stack=1, replay=None):
+        self.submit(snapshot_state(model, optimizer, episode, frame_stack, replay))
+
+    def _replay_arrays(self, capacity, obs_shape, create=True):
+        # the memmapped replay arrays in replay/, made (or remade, if they don't fit) with create
+        folder = self.replay_dir
+        shapes = {'obs': (capacity, *obs_shape)}
+        dtypes = {'obs': np.uint8, 'actions': np.uint8, 'rewards': np.float32}
+        arrays = {}
+        for name in REPLAY_ARRAYS:
+            path = os.path.join(folder, f'{name}.npy')
+            shape, dtype = shapes.get(name, (capacity,)), dtypes.get(name, np.bool_)
+            array = np.load(path, mmap_mode='r+') if os.path.exists(path) else None
+            if array is None or array.shape != tuple(shape):
+                if not create:
+                    return None
+                os.makedirs(folder, exist_ok=True)
+                array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=tuple(shape))
+            arrays[name] = array
+        return arrays
+
+    # deltas are named <checkpoint>.<random>, so rewriting a checkpoint never picks up the old one's
+
+    def _delta_path(self, delta):
+        return os.path.join(self.replay_dir, f'{delta}.delta.npz')
+
+    def _replay_owner(self):
+        try:
+            with open(os.path.join(self.replay_dir, 'owner.json')) as f:
+                return json.load(f)['delta']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_delta(self, replay, checkpoint):
+        delta = f'{checkpoint}.{uuid.uuid4().hex[:8]}'
+        os.makedirs(self.replay_dir, exist_ok=True)
+        tmp = self._delta_path(delta) + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, indices=replay['indices'], **replay['arrays'])
+        _fsync_replace(tmp, self._delta_path(delta))
+        # the checkpoint itself only keeps where the buffer was up to
+        return {**replay, 'arrays': None, 'indices': None, 'delta': delta}
+
+    def _apply_delta(self, replay):
+        # idempotent, so it's fine to redo after a crash part way through
+        arrays = self._replay_arrays(replay['capacity'], replay['obs_shape'])
+        with np.load(self._delta_path(replay['delta'])) as delta:
+            for name, array in arrays.items():
+                array[delta['indices']] = delta[name]
+                array.flush()
+        tmp = os.path.join(self.replay_dir, 'owner.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'delta': replay['delta']}, f)
+        _fsync_replace(tmp, os.path.join(self.replay_dir, 'owner.json'))
+        os.remove(self._delta_path(replay['delta']))
+
+    def _recover(self):
+        # finish a delta whose checkpoint made it to disk, drop any whose checkpoint didn't
+        if not os.path.isdir(self.replay_dir):
+            return
+        for name in os.listdir(self.replay_dir):
+            if name.endswith('.tmp'):
+                os.remove(os.path.join(self.replay_dir, name))
+            if not name.endswith('.delta.npz'):
+                continue
+            delta = name[:-len('.delta.npz')]
+            path = os.path.join(self.directory, delta.split('.')[0] + '.pt')
+            replay = torch.load(path, map_location='cpu', weights_only=False).get('replay') if os.path.exists(path) else None
+            if replay is not None and replay.get('delta') == delta:
+                self._apply_delta(replay)
+            else:
+                os.remove(os.path.join(self.replay_dir, name))
+
+    def _write(self, state):
+        checkpoint = f"checkpoint_{state['episode']:06}"
+        if state.get('replay') is not None and state['replay']['indices'] is not None:
+            state = {**state, 'replay': self._write_delta(state['replay'], checkpoint)}
+        path = os.path.join(self.directory, checkpoint + '.pt')
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            torch.save(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path) # commits the delta, if there is one
+        if state.get('replay') is not None and state['replay'].get('delta') is not None:
+            self._apply_delta(state['replay'])
+        if path in self.history:
+            self.history.remove(path)
+        self.history.append(path)
+        while len(self.history) > self.keep:
+            old = self.history.pop(0)
+            if os.path.exists(old):
+                os.remove(old)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self._closed:
+                    self.condition.wait()
+                if self.pending is None:
+                    return
+                state, self.pending = self.pending, None
+                self.writing = True
+            try:
+                self._write(state)
+                self.saved += 1
+            except Exception as e:
+                self.error = e
+            finally:
+                with self.condition:
+                    self.writing = False
+                    self.condition.notify_all()
+
+    def flush(self):
+        """Wait until everything submitted so far is on disk."""
+        with self.condition:
+            while self.pending is not None or self.writing:
+                self.condition.wait()
+        if self.error is not None:
+            raise RuntimeError("checkpoint writer died") from self.error
+
+    def close(self):
+        self.flush()
+        with self.condition:
+            self._closed = True
+            self.condition.notify_all()
+        self._thread.join()
@@ -9,40 +9,113 @@ def _get_template_path():
     with resources.path('csc316_final_project', 'hk-mask.png') as p:
         return str(p)
 
-def get_player_health(frame):
-    """
-    frame: np.ndarray (BGR image to search in)
-    """
-    # assert isinstance(frame, np.ndarray), "frame must be a NumPy array"
+def _as_array(frame):
     if isinstance(frame, Image.Image):
         frame = np.array(frame)  # Convert PIL Image to NumPy array
     assert isinstance(frame, np.ndarray), "frame must be a NumPy array or PIL Image"
-    
-    img_rgb = frame.copy()
-    img_gray = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
+    return frame
+
+class HealthDetector:
+    """Counts the health masks in the HUD by template matching, only inside `roi` (fractions of the window)."""
+
+    def __init__(self, template_path=None, threshold=0.7, nms_threshold=0.1, roi=(0.0, 0.0, 0.5, 0.3)):
+        template_path = template_path or _get_template_path()
+        self.template = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
+        assert self.template is not None, f"Template file '{template_path}' could not be read"
+        self.template_h, self.template_w = self.template.shape
+        self.threshold = threshold  # Higher threshold for more confident matches
+        self.nms_threshold = nms_threshold  # Lower threshold = more aggressive suppression
+        self.roi = roi
+        self._roi_cache = {}
+
+    def roi_for(self, width, height):
+        """Pixel (x0, y0, x1, y1) of the HUD region for a window of this size."""
+        if (width, height) not in self._roi_cache:
+            fx0, fy0, fx1, fy1 = self.roi
+            x0, y0 = int(fx0 * width), int(fy0 * height)
+            # never smaller than the template, or matchTemplate has nothing to slide over
+            x1 = min(width, max(int(round(fx1 * width)), x0 + self.template_w))
+            y1 = min(height, max(int(round(fy1 * height)), y0 + self.template_h))
+            self._roi_cache[(width, height)] = (x0, y0, x1, y1)
+        return self._roi_cache[(width, height)]
+
+    def count(self, frame) -> int:
+        """
+        frame: np.ndarray or PIL Image (RGB)
+        """
+        frame = _as_array(frame)
+        height, width = frame.shape[:2]
+        x0, y0, x1, y1 = self.roi_for(width, height)
+        if x1 - x0 < self.template_w or y1 - y0 < self.template_h:
+            return 0 # window's smaller than a mask, nothing to find
+
+        hud_gray = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_RGB2GRAY)
+        res = cv2.matchTemplate(hud_gray, self.template, cv2.TM_CCOEFF_NORMED)
+
+        # every above-threshold position is a candidate box, in the same (row-major) order as before,
+        # and NMSBoxes picks out the peaks. boxes are relative to the ROI, which doesn't change any IoU
+        ys, xs = np.nonzero(res >= self.threshold)
+        if len(xs) == 0:
+            return 0
+        rectangles = np.empty((len(xs), 4), dtype=np.int32)
+        rectangles[:, 0] = xs
+        rectangles[:, 1] = ys
+        rectangles[:, 2] = self.template_w
+        rectangles[:, 3] = self.template_h
+        scores = res[ys, xs]
+        indices = cv2.dnn.NMSBoxes(rectangles, scores, score_threshold=self.threshold, nms_threshold=self.nms_threshold)
+        return len(indices)
+
+    __call__ = count
 
-    template_path = _get_template_path()
-    template = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
-    assert template is not None, f"Template file '{template_path}' could not be read"
+@cache
+def _default_health_detector():
+    return HealthDetector()
+
+def get_player_health(frame):
+    """
+    frame: np.ndarray (RGB image to search in)
+    """
+    return _default_health_detector().count(frame)
+
+def _get_player_health_full_frame(frame):
+    # the original full-window implementation, kept around to check HealthDetector against
+    frame = _as_array(frame)
+    img_gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+    template = _default_health_detector().template
     w, h = template.shape[::-1]
-    
+
     res = cv2.matchTemplate(img_gray, template, cv2.TM_CCOEFF_NORMED)
-    threshold = 0.7  # Higher threshold for more confident matches
+    threshold = 0.7
     loc = np.where(res >= threshold)
-    
+
     rectangles = []
     scores = []
     for pt in zip(*loc[::-1]):
-        rect = [int(pt[0]), int(pt[1]), int(w), int(h)]
-        rectangles.append(rect)
-        # Get the actual confidence score for this detection
-        score = res[pt[1], pt[0]]
-        scores.append(float(score))
+        rectangles.append([int(pt[0]), int(pt[1]), int(w), int(h)])
+        scores.append(float(res[pt[1], pt[0]]))
 
     if len(rectangles) > 0:
-        # Use more aggressive NMS to reduce jitter
-        nms_threshold = 0.1  # Lower threshold = more aggressive suppression
-        indices = cv2.dnn.NMSBoxes(rectangles, scores, score_threshold=threshold, nms_threshold=nms_threshold)
+        indices = cv2.dnn.NMSBoxes(rectangles, scores, score_threshold=threshold, nms_threshold=0.1)
     else:
         indices = []
     return len(indices)
+
+if __name__ == "__main__":
+    # check the detector against the original implementation on a folder of recorded frames:
+    #   python -m csc316_final_project.cv path/to/frames
+    import os
+    import sys
+
+    frames_dir = sys.argv[1]
+    mismatches = 0
+    files = sorted(f for f in os.listdir(frames_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg')))
+    for filename in files:
+        frame = np.array(Image.open(os.path.join(frames_dir, filename)).convert('RGB'))
+        expected = _get_player_health_full_frame(frame)
+        got = get_player_health(frame)
+        if got != expected:
+            mismatches += 1
+            print(f"{filename}: expected {expected}, got {got}")
+    print(f"{len(files) - mismatches}/{len(files)} frames match")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,230 @@
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+
+from csc316_final_project.replay import pack_actions, unpack_actions
+
+# on disk, a recording is a directory of chunks (chunk_00000, chunk_00001, ...), each holding one
+# .npy file per field below, preallocated to chunk_size rows, plus a meta.json saying how many rows
+# are actually filled in. each row is one frame: the state the game was in, and (if `valid`) the
+# action taken from there, the reward it earned and whether that ended the episode. the next
+# frame is always the next row (possibly in the next chunk); an episode's last frame has valid=False.
+FIELDS = {
+    'actions': np.uint8, # bit mask, see replay.pack_actions
+    'rewards': np.float32,
+    'health': np.int8,
+    'hits': np.bool_,
+    'dones': np.bool_,
+    'first': np.bool_, # first frame of an episode
+    'valid': np.bool_, # there's a transition from this frame to the next row
+}
+
+def _write_meta(chunk_dir, meta):
+    # atomic, so a reader never sees half a file
+    tmp_path = os.path.join(chunk_dir, 'meta.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(chunk_dir, 'meta.json'))
+
+class EpisodeRecorder:
+    """
+    Appends every step to a chunked, memory-mapped dataset on a background thread.
+    Used like ReplayBuffer: `start_episode(frame, state)`, `add(...)` every step, `close()` at the end.
+    """
+
+    def __init__(self, root, chunk_size=4096, frame_shape=(3, 84, 84), flush_every=256):
+        self.root = str(root)
+        self.chunk_size = chunk_size
+        self.frame_shape = tuple(frame_shape)
+        self.flush_every = flush_every
+        os.makedirs(self.root, exist_ok=True)
+        # never append to someone else's chunk, start a new one after whatever's there
+        existing = [d for d in os.listdir(self.root) if d.startswith('chunk_')]
+        self.chunk_index = max((int(d.split('_')[1]) for d in existing), default=-1) + 1
+        self.chunk = None
+        self.rows = 0 # rows written to the current chunk
+        self.pending = None # the current frame, waiting for the action taken from it
+        self.queue = queue.Queue()
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name="episode-recorder", daemon=True)
+        self._thread.start()
+
+    # control loop side
+
+    def _put(self, row):
+        if self.error is not None:
+            raise RuntimeError("episode recorder died") from self.error
+        self.queue.put(row)
+
+    def _end_episode(self):
+        # the final frame, with no transition out of it
+        if self.pending is not None:
+            self._put(self.pending)
+            self.pending = None
+
+    def start_episode(self, frame, state):
+        self._end_episode() # in case the last one didn't end with done
+        self.pending = {'obs': frame, 'health': state['player_health'], 'hits': state['enemy_damaged'], 'first': True}
+
+    def add(self, actions, reward, done, next_frame, next_state):
+        row = self.pending
+        row.update(actions=pack_actions(actions), rewards=reward, dones=done, valid=True)
+        self._put(row)
+        self.pending = {'obs': next_frame, 'health': next_state['player_health'], 'hits': next_state['enemy_damaged'], 'first': False}
+        if done:
+            self._end_episode()
+
+    def close(self):
+        self._end_episode()
+        self.queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise RuntimeError("episode recorder died") from self.error
+
+    # writer side
+
+    def _open_chunk(self):
+        chunk_dir = os.path.join(self.root, f"chunk_{self.chunk_index:05}")
+        os.makedirs(chunk_dir, exist_ok=True)
+        self.chunk_dir = chunk_dir
+        self.chunk = {'obs': np.lib.format.open_memmap(os.path.join(chunk_dir, 'obs.npy'), mode='w+', dtype=np.uint8, shape=(self.chunk_size, *self.frame_shape))}
+        for name, dtype in FIELDS.items():
+            self.chunk[name] = np.lib.format.open_memmap(os.path.join(chunk_dir, f'{name}.npy'), mode='w+', dtype=dtype, shape=(self.chunk_size,))
+        self.rows = 0
+        self._flush()
+
+    def _flush(self):
+        for array in self.chunk.values():
+            array.flush()
+        _write_meta(self.chunk_dir, {'length': self.rows, 'frame_shape': list(self.frame_shape)})
+
+    def _close_chunk(self):
+        self._flush()
+        self.chunk = None
+        self.chunk_index += 1
+
+    def _run(self):
+        try:
+            while True:
+                row = self.queue.get()
+                if row is None:
+                    break
+                if self.chunk is None:
+                    self._open_chunk()
+                i = self.rows
+                for name, value in row.items():
+                    self.chunk[name][i] = value
+                self.rows += 1
+                if self.rows == self.chunk_size:
+                    self._close_chunk()
+                elif self.rows % self.flush_every == 0 or self.queue.empty():
+                    self._flush()
+            if self.chunk is not None:
+                self._close_chunk()
+        except Exception as e:
+            self.error = e
+
+class OfflineDataset:
+    """Reads what EpisodeRecorder wrote (frames memory-mapped); `sample()` returns ReplayBuffer.sample-style minibatches."""
+
+    def __init__(self, root, frame_stack=1, num_actions=7):
+        self.root = str(root)
+        self.frame_stack = frame_stack
+        self.num_actions = num_actions
+        self.chunks = []
+        lengths = []
+        for name in sorted(os.listdir(self.root)):
+            meta_path = os.path.join(self.root, name, 'meta.json')
+            if not name.startswith('chunk_') or not os.path.exists(meta_path):
+                continue
+            with open(meta_path) as f:
+                length = json.load(f)['length']
+            if length == 0:
+                continue
+            chunk_dir = os.path.join(self.root, name)
+            chunk = {field: np.load(os.path.join(chunk_dir, f'{field}.npy'), mmap_mode='r') for field in ('obs', *FIELDS)}
+            self.chunks.append(chunk)
+            lengths.append(length)
+        if not self.chunks:
+            raise RuntimeError(f"no recorded chunks in '{self.root}'")
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)])
+        # the small per-row fields fit in memory just fine, only the frames stay on disk
+        small = {field: np.concatenate([chunk[field][:n] for chunk, n in zip(self.chunks, lengths)]) for field in FIELDS}
+        self.actions, self.rewards, self.dones, self.first = small['actions'], small['rewards'], small['dones'], small['first']
+        # a transition is only usable if its next frame made it to disk too
+        # (not the case for the very last row, or if a recording died mid-episode)
+        valid = small['valid'].copy()
+        valid[-1] = False
+        valid[:-1] &= ~self.first[1:]
+        self.transitions = np.flatnonzero(valid)
+
+    def __len__(self):
+        return len(self.transitions)
+
+    def _frames(self, rows):
+        # global row numbers -> frames, reading each chunk's rows in one go
+        chunk_ids = np.searchsorted(self.offsets, rows, side='right') - 1
+        frames = np.empty((len(rows), *self.chunks[0]['obs'].shape[1:]), dtype=np.uint8)
+        for chunk_id in np.unique(chunk_ids):
+            mask = chunk_ids == chunk_id
+            frames[mask] = self.chunks[chunk_id]['obs'][rows[mask] - self.offsets[chunk_id]]
+        return frames
+
+    def _gather(self, rows):
+        if self.frame_stack == 1:
+            return self._frames(rows)
+        stack = [rows]
+        current = rows
+        for _ in range(self.frame_stack - 1):
+            current = np.where(self.first[current] | (current == 0), current, current - 1)
+            stack.append(current)
+        stacked = np.stack(stack[::-1], axis=1) # [batch, k], oldest first
+        frames = self._frames(stacked.reshape(-1))
+        return frames.reshape(len(rows), -1, *frames.shape[2:])
+
+    def sample(self, batch_size, rng: np.random.Generator | None = None):
+        rng = rng if rng is not None else np.random.default_rng()
+        rows = np.sort(rng.choice(self.transitions, size=batch_size)) # sorted, so reads go front to back
+        return {
+            'obs': self._gather(rows),
+            'actions': unpack_actions(self.actions[rows], self.num_actions),
+            'rewards': self.rewards[rows],
+            'dones': self.dones[rows],
+            'next_obs': self._gather(rows + 1),
+        }
+
+    def minibatches(self, batch_size, count, prefetch=4, seed=None):
+        """Yields `count` minibatches, reading up to `prefetch` ahead on a background thread."""
+        batches = queue.Queue(maxsize=prefetch)
+        rng = np.random.default_rng(seed)
+        stop = threading.Event()
+
+        def read():
+            try:
+                for _ in range(count):
+                    if stop.is_set():
+                        return
+                    batches.put(self.sample(batch_size, rng))
+            except Exception as e:
+                batches.put(e)
+                return
+            batches.put(None)
+
+        thread = threading.Thread(target=read, name="offline-prefetch", daemon=True)
+        thread.start()
+        try:
+            while (batch := batches.get()) is not None:
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            stop.set()
+            # unblock the reader if it's waiting on a full queue
+            while thread.is_alive():
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    thread.join(timeout=0.1)
@@ -0,0 +1,234 @@
+import os
+import shutil
+from importlib import resources
+from time import perf_counter
+
+import cv2
+import numpy as np
+
+# False Knight detectors that skip Ultralytics' general-purpose predict(): the frame is letterboxed
+# down to `imgsz` (optionally after cropping to the arena, `roi`), run through an exported model
+# on the CPU, and decoded straight to the single best box, since there's one class and one boss.
+# they all have `find(frame) -> (x, y, w, h) | None`, which object_detection.find_false_knight
+# uses instead of predict() when it's there, and `detect(frame)`, which also returns the confidence.
+
+BACKENDS = ('ultralytics', 'onnx', 'openvino')
+
+def _best_pt():
+    with resources.path('csc316_final_project', 'best.pt') as path:
+        return str(path)
+
+def letterbox(image, imgsz):
+    """Resize to fit an imgsz x imgsz square, padded with grey like Ultralytics. Returns (square, scale, (pad_x, pad_y))."""
+    h, w = image.shape[:2]
+    scale = min(imgsz / h, imgsz / w)
+    new_w, new_h = round(w * scale), round(h * scale)
+    pad_x, pad_y = (imgsz - new_w) // 2, (imgsz - new_h) // 2
+    square = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    square[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    return square, scale, (pad_x, pad_y)
+
+class UltralyticsDetector:
+    """The .pt model through Ultralytics, but at `imgsz` and keeping only the best box."""
+
+    def __init__(self, model=None, imgsz=640, conf=0.5, warmup=True):
+        from ultralytics import YOLO
+        self.model = model if model is not None else YOLO(_best_pt())
+        self.imgsz = imgsz
+        self.conf = conf
+        if warmup:
+            self.find(np.zeros((imgsz, imgsz, 3), dtype=np.uint8))
+
+    def detect(self, frame):
+        results = self.model.predict(frame, imgsz=self.imgsz, conf=self.conf, max_det=1, verbose=False)
+        boxes = results[0].boxes
+        if len(boxes) == 0:
+            return None, 0.0
+        x1, y1, x2, y2 = map(int, boxes.xyxy[0])
+        return (x1, y1, x2 - x1, y2 - y1), boxes.conf[0].item()
+
+    def find(self, frame):
+        return self.detect(frame)[0]
+
+class ExportedDetector:
+    """Runs an exported YOLOv8 model (see `export_detector`) and decodes its output, only inside `roi`."""
+
+    def __init__(self, imgsz=320, conf=0.5, roi=None, class_id=0, warmup=True):
+        self.imgsz = imgsz
+        self.conf = conf
+        self.roi = roi
+        self.class_id = class_id
+        if warmup:
+            self.find(np.zeros((imgsz, imgsz, 3), dtype=np.uint8))
+
+    def _infer(self, blob):
+        # [1, 3, imgsz, imgsz] float32 in [0, 1] -> [1, 4 + classes, anchors]
+        raise NotImplementedError
+
+    def find(self, frame):
+        return self.detect(frame)[0]
+
+    def detect(self, frame):
+        frame = np.asarray(frame)
+        x_off = y_off = 0
+        if self.roi is not None:
+            h, w = frame.shape[:2]
+            fx0, fy0, fx1, fy1 = self.roi
+            x_off, y_off = int(fx0 * w), int(fy0 * h)
+            frame = frame[y_off:int(fy1 * h), x_off:int(fx1 * w)]
+        square, scale, (pad_x, pad_y) = letterbox(frame, self.imgsz)
+        blob = np.ascontiguousarray(square[..., ::-1].transpose(2, 0, 1)[None], dtype=np.float32)
+        blob *= 1 / 255
+        output = self._infer(blob)[0] # [4 + classes, anchors]
+
+        # one class, one boss: the best-scoring anchor is the answer, no NMS needed
+        scores = output[4 + self.class_id]
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        if score < self.conf:
+            return None, score
+        # back to frame pixels, clipped to the frame like Ultralytics does
+        cx, cy, bw, bh = output[:4, best]
+        h, w = frame.shape[:2]
+        x1 = min(max((cx - bw / 2 - pad_x) / scale, 0), w)
+        y1 = min(max((cy - bh / 2 - pad_y) / scale, 0), h)
+        x2 = min(max((cx + bw / 2 - pad_x) / scale, 0), w)
+        y2 = min(max((cy + bh / 2 - pad_y) / scale, 0), h)
+        return (int(x1) + x_off, int(y1) + y_off, int(x2) - int(x1), int(y2) - int(y1)), score
+
+def _require(backend):
+    # neither runtime is a hard dependency, so they're only imported when used
+    module = {'onnx': 'onnxruntime', 'openvino': 'openvino'}[backend]
+    try:
+        return __import__(module)
+    except ImportError as e:
+        raise RuntimeError(f"the {backend} detector needs {module} (`uv pip install {module}`)") from e
+
+class OnnxDetector(ExportedDetector):
+    def __init__(self, path, imgsz=320, threads=None, **kwargs):
+        onnxruntime = _require('onnx')
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(str(path), options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        super().__init__(imgsz, **kwargs)
+
+    def _infer(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+class OpenVINODetector(ExportedDetector):
+    def __init__(self, path, imgsz=320, **kwargs):
+        openvino = _require('openvino')
+        core = openvino.Core()
+        if os.path.isdir(path): # Ultralytics exports a directory with the .xml in it
+            path = next(os.path.join(path, f) for f in os.listdir(path) if f.endswith('.xml'))
+        self.compiled = core.compile_model(core.read_model(str(path)), 'CPU', {'PERFORMANCE_HINT': 'LATENCY'})
+        self.request = self.compiled.create_infer_request()
+        super().__init__(imgsz, **kwargs)
+
+    def _infer(self, blob):
+        return self.request.infer({0: blob})[self.compiled.output(0)]
+
+def _export_path(weights, imgsz, backend):
+    # one export per size, next to the weights
+    root, _ = os.path.splitext(str(weights))
+    return f"{root}_{imgsz}.onnx" if backend == 'onnx' else f"{root}_{imgsz}_openvino_model"
+
+def export_detector(weights=None, imgsz=320, backend='onnx'):
+    """Exports the .pt model (best.pt by default) for `backend` at a fixed imgsz, next to it. Returns the path."""
+    from ultralytics import YOLO
+    weights = weights or _best_pt()
+    options = {'simplify': True} if backend == 'onnx' else {}
+    exported = YOLO(weights).export(format=backend, imgsz=imgsz, dynamic=False, verbose=False, **options)
+    # Ultralytics always writes to the same name, move it so exports at different sizes don't clobber each other
+    path = _export_path(weights, imgsz, backend)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(exported, path)
+    return path
+
+def load_detector(backend='ultralytics', imgsz=None, path=None, conf=0.5, roi=None):
+    """A detector for FalseKnightTracker/find_false_knight, from a .pt model (exported on first use) or an exported one."""
+    if backend == 'ultralytics':
+        from ultralytics import YOLO
+        return UltralyticsDetector(YOLO(path or _best_pt()), imgsz=imgsz or 640, conf=conf)
+    imgsz = imgsz or 320
+    _require(backend) # before spending time on an export
+    if path is None or path.endswith('.pt'):
+        weights = path or _best_pt()
+        path = _export_path(weights, imgsz, backend)
+        if not os.path.exists(path):
+            path = export_detector(weights, imgsz=imgsz, backend=backend)
+    detector_class = OnnxDetector if backend == 'onnx' else OpenVINODetector
+    return detector_class(path, imgsz=imgsz, conf=conf, roi=roi)
+
+# evaluation on a held-out set (YOLO format, e.g. model_training.split_dataset's val split)
+
+def _read_labels(label_path, width, height):
+    boxes = []
+    if os.path.exists(label_path):
+        with open(label_path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 5:
+                    continue
+                cx, cy, bw, bh = (float(v) for v in parts[1:5])
+                boxes.append(((cx - bw / 2) * width, (cy - bh / 2) * height, bw * width, bh * height))
+    return boxes
+
+def _iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = max(0.0, min(ax + aw, bx + bw) - max(ax, bx))
+    ih = max(0.0, min(ay + ah, by + bh) - max(ay, by))
+    inter = iw * ih
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+def average_precision(scores, hits, num_targets):
+    """Area under the (all-point interpolated) precision/recall curve."""
+    if num_targets == 0:
+        return 0.0
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind='stable')
+    hits = np.asarray(hits, dtype=np.float64)[order]
+    tp = np.cumsum(hits)
+    precision = tp / np.arange(1, len(hits) + 1)
+    recall = tp / num_targets
+    # precision envelope, then sum precision over each recall step
+    precision = np.concatenate([[0.0], precision, [0.0]])
+    recall = np.concatenate([[0.0], recall, [recall[-1] if len(recall) else 0.0]])
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    steps = np.flatnonzero(recall[1:] != recall[:-1])
+    return float(np.sum((recall[steps + 1] - recall[steps]) * precision[steps + 1]))
+
+def evaluate(detector, images_dir, labels_dir, limit=None):
+    """
+    mAP@0.5, mAP@0.5:0.95 and per-frame latency of `detector.detect` on a YOLO-format set.
+    Only the one best box per image counts, since that's all the detectors return.
+    """
+    files = sorted(f for f in os.listdir(images_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg')))[:limit]
+    thresholds = np.arange(0.5, 0.96, 0.05)
+    scores, ious, latencies = [], [], []
+    num_targets = 0
+    for name in files:
+        frame = cv2.cvtColor(cv2.imread(os.path.join(images_dir, name)), cv2.COLOR_BGR2RGB) # the game's frames are RGB
+        targets = _read_labels(os.path.join(labels_dir, os.path.splitext(name)[0] + '.txt'), frame.shape[1], frame.shape[0])
+        num_targets += len(targets)
+        start = perf_counter()
+        box, score = detector.detect(frame)
+        latencies.append(perf_counter() - start)
+        if box is None:
+            continue
+        scores.append(score)
+        ious.append(max((_iou(box, target) for target in targets), default=0.0))
+    aps = [average_precision(scores, [iou >= t for iou in ious], num_targets) for t in thresholds]
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'images': len(files),
+        'detections': len(scores),
+        'map50': aps[0],
+        'map50_95': float(np.mean(aps)),
+        'latency_p50_ms': float(np.median(latencies_ms)) if len(files) else 0.0,
+        'latency_p95_ms': float(np.percentile(latencies_ms, 95)) if len(files) else 0.0,
+    }
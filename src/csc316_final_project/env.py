@@ -0,0 +1,113 @@
+from functools import cache, partial
+from time import monotonic, sleep
+
+from csc316_final_project.capture import ImageGrabBackend, ReplayBackend
+from csc316_final_project.keyboard_emulation import ActionScheduler, NullController
+from csc316_final_project.neural import reward_function
+from csc316_final_project.pacing import RateScheduler
+from csc316_final_project.perception import Perception
+from csc316_final_project.profiling import TARGET_HZ, profiler
+from csc316_final_project.util import get_coords_of_active_window
+
+@cache
+def _sync_backend():
+    return ImageGrabBackend()
+
+def grab_screen(grabber=None, window=None):
+    # take a screenshot of the game window, as an RGB uint8 array
+    if grabber is not None:
+        return grabber.latest() # newest frame from the background capture thread
+    with profiler.stage('window'):
+        window_bbox = window() if window is not None else get_coords_of_active_window()
+    return _sync_backend().grab(window_bbox)
+
+class HollowKnightEnv:
+    """
+    Gym-style wrapper around the fight: `reset()` starts an episode, `step(controls)` plays one step.
+    Observations are Perception's (frame, state); steps are paced to `step_hz` (0 = unpaced).
+    """
+
+    def __init__(self, perception: Perception, controller, frames, step_hz=TARGET_HZ, overrun='skip', reset_delay=1.0, end_delay=5.0, grace_period=5.0, max_episode_time=300.0, max_episode_steps=None):
+        self.perception = perception
+        self.controller = controller if isinstance(controller, ActionScheduler) else ActionScheduler(controller)
+        self.base_repeat = self.controller.repeat
+        self.frames = frames
+        self.rate = RateScheduler(step_hz, overrun) if step_hz else None
+        self.reset_delay = reset_delay
+        self.end_delay = end_delay
+        self.grace_period = grace_period
+        self.max_episode_time = max_episode_time
+        self.max_episode_steps = max_episode_steps
+        self.state = None
+        self.steps = 0
+        self.start_time = None
+
+    def observe(self):
+        # take a screenshot and process it into the state representation
+        with profiler.stage('capture'): # includes the window lookup, if there is one
+            frame = self.frames()
+        return self.perception.process(frame)
+
+    def reset(self):
+        """Reload the fight (the debug mod's quickslot), and return the first (frame, state)."""
+        self.controller.press_key('load')
+        if self.reset_delay:
+            sleep(self.reset_delay)
+        frame, self.state = self.observe()
+        self.steps = 0
+        self.start_time = monotonic()
+        if self.rate is not None:
+            self.rate.start()
+            self._apply_frame_skip()
+        return frame, self.state
+
+    def step(self, controls: dict):
+        """Apply the controls, let the game run for a bit, and return (frame, reward, done, state)."""
+        with profiler.stage('controller'):
+            self.controller.output(controls)
+
+        # give the game the rest of this step's slot to update, then observe next state
+        if self.rate is not None:
+            self.rate.wait()
+            self._apply_frame_skip()
+        frame, next_state = self.observe()
+        self.steps += 1
+        elapsed = monotonic() - self.start_time
+
+        # fix: if we're in the first 5 seconds, don't punish for health loss (to avoid spawn invincibility issues and ui lag)
+        if elapsed < self.grace_period:
+            next_state['player_health'] = 5
+
+        # check terminal conditions
+        done = elapsed > self.max_episode_time or next_state.get('player_health', 1) <= 0
+        if self.max_episode_steps is not None and self.steps >= self.max_episode_steps:
+            done = True
+
+        reward = reward_function(next_state, self.state)
+        self.state = next_state
+        return frame, reward, done, next_state
+
+    def _apply_frame_skip(self):
+        # the frameskip overrun policy holds each decision for longer rather than slowing down
+        self.controller.repeat = self.base_repeat + self.rate.frame_skip
+
+    def pacing_stats(self):
+        """The RateScheduler's stats for this episode (None if steps aren't paced)."""
+        return self.rate.stats() if self.rate is not None else None
+
+    def end_episode(self):
+        """Let go of everything and wait out the death animation. Returns the episode's perception stats."""
+        self.controller.release_all()
+        stats = self.perception.episode_stats()
+        if self.end_delay:
+            sleep(self.end_delay) # wait for the dying animation to finish
+        return stats
+
+def live_env(perception: Perception, controller, grabber=None, window=None, **kwargs) -> HollowKnightEnv:
+    """The real game, with the real keyboard."""
+    return HollowKnightEnv(perception, controller, partial(grab_screen, grabber, window), **kwargs)
+
+def replay_env(source, perception: Perception, loop=True, controller=None, **kwargs) -> HollowKnightEnv:
+    """A headless env: frames from a recording, controls into a NullController, no waiting."""
+    kwargs = {'step_hz': 0, 'reset_delay': 0, 'end_delay': 0, 'grace_period': 0, **kwargs}
+    return HollowKnightEnv(perception, controller if controller is not None else NullController(), ReplayBackend(source, loop=loop).grab, **kwargs)
@@ -0,0 +1,253 @@
+import copy
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from csc316_final_project.neural import HollowNN, to_tensor
+
+# ways to run HollowNN when we only need its decisions, not its gradients:
+#   eager         the model itself, in inference mode, channels-last
+#   compile       torch.compile'd eager (needs a working compiler toolchain for inductor)
+#   torchscript   traced, frozen and optimized for inference
+#   int8-dynamic  Linear layers quantized to int8 (weights ahead of time, activations on the fly); CPU
+#   int8-static   everything quantized to int8, scales calibrated on real screens; CPU, needs calibration
+#   onnx          exported and run with onnxruntime (optional dependency)
+BACKENDS = ('eager', 'compile', 'torchscript', 'int8-dynamic', 'int8-static', 'onnx')
+EXPORT_FORMATS = ('torchscript', 'int8-dynamic', 'int8-static', 'onnx')
+CPU_ONLY = ('int8-dynamic', 'int8-static', 'onnx')
+
+def _example(model: HollowNN, batch=1):
+    return torch.zeros(batch, *model.input_shape)
+
+def _quantize_dynamic(model: HollowNN):
+    from torch.ao.quantization import quantize_dynamic
+    # the two Linear layers are ~95% of the weights; convs stay fp32
+    return quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+def _quantize_static(model: HollowNN, calibration):
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+    if calibration is None or len(calibration) == 0:
+        raise ValueError("int8-static needs calibration screens")
+    prepared = prepare_fx(model, get_default_qconfig_mapping(torch.backends.quantized.engine), (_example(model),))
+    with torch.inference_mode():
+        for start in range(0, len(calibration), 64):
+            prepared(to_tensor(calibration[start:start + 64], 'cpu'))
+    return convert_fx(prepared)
+
+def _torchscript(model, example, optimize=True):
+    frozen = torch.jit.freeze(torch.jit.trace(model, example))
+    # optimize_for_inference bakes in this machine's kernels (and doesn't survive jit.save), so
+    # saved models get it when they're loaded instead
+    return torch.jit.optimize_for_inference(frozen) if optimize else frozen
+
+class _OnnxModule:
+    # onnxruntime session that takes and returns tensors, like the other backends
+    def __init__(self, path):
+        import onnxruntime
+        self.session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x):
+        return torch.from_numpy(self.session.run(None, {self.input_name: x.numpy()})[0])
+
+def export_onnx(model: HollowNN, path):
+    torch.onnx.export(model, (_example(model),), path, input_names=['screens'], output_names=['logits'], dynamic_axes={'screens': {0: 'batch'}, 'logits': {0: 'batch'}})
+    return path
+
+def build(model: HollowNN, backend='eager', device='cpu', channels_last=True, calibration=None, workdir=None):
+    """
+    A copy of `model`, eval mode and ready for `backend` (see BACKENDS). Takes [B, C, H, W] floats in [0, 1].
+    onnx exports to `workdir` (overwriting the last export), or a temporary directory that's gone once the session has loaded.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown inference backend '{backend}'")
+    model = copy.deepcopy(model).eval()
+    for param in model.parameters():
+        param.requires_grad_(False)
+    if backend in CPU_ONLY:
+        model = model.cpu()
+        if backend == 'int8-dynamic':
+            return _quantize_dynamic(model)
+        if backend == 'int8-static':
+            return _quantize_static(model, calibration)
+        if workdir is not None:
+            return _OnnxModule(export_onnx(model, os.path.join(workdir, 'hollow_nn.onnx')))
+        with tempfile.TemporaryDirectory(prefix='hollow-nn-') as tmp:
+            return _OnnxModule(export_onnx(model, os.path.join(tmp, 'hollow_nn.onnx')))
+
+    model = model.to(device)
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
+    model = model.to(memory_format=memory_format)
+    if backend == 'compile':
+        return torch.compile(model)
+    if backend == 'torchscript':
+        with torch.inference_mode(False), torch.no_grad():
+            return _torchscript(model, _example(model).to(device).contiguous(memory_format=memory_format))
+    return model
+
+class InferencePolicy:
+    """
+    HollowNN for acting: `policy(screen)` gives the logits for a uint8 screen (or batch of them).
+    New weights go straight into eager/compile models; the other backends rebuild in the background.
+    """
+
+    def __init__(self, model: HollowNN, backend='eager', device='cpu', channels_last=True, calibration=None):
+        self.backend = backend
+        self.device = 'cpu' if backend in CPU_ONLY else device
+        self.channels_last = channels_last and backend not in CPU_ONLY
+        self.calibration = calibration
+        self.workdir = tempfile.mkdtemp(prefix='hollow-nn-') if backend == 'onnx' else None # reused by every export
+        self.weights = copy.deepcopy(model).cpu() # fp32 master copy, for rebuilding
+        self.module = build(self.weights, backend, self.device, channels_last, calibration, self.workdir)
+        self.rebuilds = 0
+        self.error = None
+        self._pending = None # newest weights waiting to be built, older ones just get replaced
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = None
+
+    def load_state_dict(self, state_dict):
+        if self.backend in ('eager', 'compile'):
+            # the compiled module shares its parameters with the eager one, it doesn't need recompiling
+            target = self.module._orig_mod if self.backend == 'compile' else self.module
+            target.load_state_dict(state_dict)
+            return
+        # tracing/exporting/quantizing takes far longer than a step, so it happens off the acting thread
+        if self.error is not None:
+            raise RuntimeError("rebuilding the inference model failed") from self.error
+        with self._condition:
+            self._pending = state_dict
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._rebuild, name="inference-rebuild", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def _rebuild(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                state_dict, self._pending = self._pending, None
+            try:
+                self.weights.load_state_dict(state_dict)
+                module = build(self.weights, self.backend, self.device, self.channels_last, self.calibration, self.workdir)
+            except Exception as e:
+                self.error = e
+                return
+            self.module = module # one assignment: the actor gets either the old model or the new one
+            self.rebuilds += 1
+
+    @torch.inference_mode()
+    def __call__(self, screens):
+        x = to_tensor(screens, self.device)
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+        return self.module(x)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            self.workdir = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+def export_artifacts(model: HollowNN, output_dir, formats=EXPORT_FORMATS, calibration=None):
+    """
+    Writes each format in `formats` to output_dir. Returns {format: path}, or {format: exception}
+    for the ones that couldn't be exported (e.g. onnx without the onnx package).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    model = copy.deepcopy(model).cpu().eval()
+    example = _example(model)
+    artifacts = {}
+    for fmt in formats:
+        path = os.path.join(output_dir, 'hollow_nn.onnx' if fmt == 'onnx' else f'hollow_nn.{fmt}.pt')
+        try:
+            with torch.no_grad():
+                if fmt == 'onnx':
+                    export_onnx(model, path)
+                else:
+                    if fmt == 'torchscript':
+                        scripted = _torchscript(model, example, optimize=False)
+                    else:
+                        scripted = torch.jit.trace(build(model, fmt, 'cpu', calibration=calibration), example)
+                    torch.jit.save(scripted, path)
+            artifacts[fmt] = path
+        except Exception as e:
+            artifacts[fmt] = e
+    return artifacts
+
+def load_artifact(path):
+    """A module (or onnxruntime wrapper) from export_artifacts, taking [B, C, H, W] floats in [0, 1]."""
+    if path.endswith('.onnx'):
+        return _OnnxModule(path)
+    module = torch.jit.load(path, map_location='cpu').eval()
+    if path.endswith('.torchscript.pt'):
+        module = torch.jit.optimize_for_inference(module)
+    return module
+
+@torch.inference_mode()
+def check_accuracy(reference: HollowNN, candidates: dict, screens, action_threshold=0.5):
+    """
+    Compares each candidate's action decisions (sigmoid(logit) > action_threshold, like train_model)
+    against the fp32 reference on the same uint8 screens. Returns {name: stats}.
+    """
+    reference = copy.deepcopy(reference).cpu().eval()
+    x = to_tensor(screens, 'cpu')
+    expected_logits = reference(x)
+    expected = torch.sigmoid(expected_logits) > action_threshold
+    report = {}
+    for name, candidate in candidates.items():
+        logits = torch.cat([candidate(x[start:start + 64]) for start in range(0, len(x), 64)]).float()
+        decisions = torch.sigmoid(logits) > action_threshold
+        report[name] = {
+            'decision_agreement': (decisions == expected).all(dim=1).float().mean().item(), # all 7 actions the same
+            'action_agreement': (decisions == expected).float().mean().item(),
+            'max_abs_logit_diff': (logits - expected_logits).abs().max().item(),
+        }
+    return report
+
+def latency_ms(module, screen, min_time=0.5):
+    """Median batch-1 latency of module on one uint8 screen."""
+    from csc316_final_project.bench import time_case
+    x = to_tensor(screen, 'cpu')
+    with torch.inference_mode():
+        return float(np.median(time_case(lambda: module(x), min_time=min_time))) * 1000
+
+def calibration_screens(source, count=256, frame_stack=1, seed=0):
+    """
+    uint8 screens for calibration and accuracy checks: from recorded play (a train --record-dir
+    directory), a video or frame directory, or (source=None) random pixels.
+    """
+    rng = np.random.default_rng(seed)
+    if source is None:
+        return rng.integers(0, 256, (count, 3 * frame_stack, 84, 84), dtype=np.uint8)
+    if os.path.isdir(source) and any(name.startswith('chunk_') for name in os.listdir(source)):
+        from csc316_final_project.dataset import OfflineDataset
+        return OfflineDataset(source, frame_stack=frame_stack).sample(count, rng)['obs']
+    from csc316_final_project.capture import ReplayBackend
+    from csc316_final_project.perception import FrameStack, preprocess_frame
+    backend = ReplayBackend(source, loop=True)
+    stack = FrameStack(frame_stack)
+    screens = [stack.reset(preprocess_frame(backend.grab())).copy()]
+    while len(screens) < count:
+        screens.append(stack.push(preprocess_frame(backend.grab())).copy())
+    return np.stack(screens)
@@ -1,9 +1,11 @@
 import time
-from pynput import keyboard
-from pynput.keyboard import Key
+from time import monotonic
 
 class HollowKnightController:
     def __init__(self):
+        # pynput connects to the display as soon as it's imported, so only import it when we need a keyboard
+        from pynput import keyboard
+        from pynput.keyboard import Key
         self.kb = keyboard.Controller()
         self.pressed_keys = set()
         
@@ -56,6 +58,116 @@ class HollowKnightController:
         self.release_all()
         self.running = False
 
+class NullController:
+    """
+    HollowKnightController without the keyboard, for headless runs.
+    With record=True, keeps every press/release in `events` as (time, 'press'|'release', action).
+    """
+
+    def __init__(self, record=False, clock=monotonic):
+        self.pressed_keys = set()
+        self.running = True
+        self.outputs = 0
+        self.record = record
+        self.clock = clock
+        self.events = []
+
+    def press_key(self, action):
+        if action not in self.pressed_keys:
+            self.pressed_keys.add(action)
+            if self.record:
+                self.events.append((self.clock(), 'press', action))
+
+    def release_key(self, action):
+        if action in self.pressed_keys:
+            self.pressed_keys.discard(action)
+            if self.record:
+                self.events.append((self.clock(), 'release', action))
+
+    def release_all(self):
+        for action in list(self.pressed_keys):
+            self.release_key(action)
+
+    def output(self, nn_output: dict):
+        self.outputs += 1
+        for action, value in nn_output.items():
+            if value:
+                self.press_key(action)
+            else:
+                self.release_key(action)
+
+    def stop(self):
+        self.release_all()
+        self.running = False
+
+class ActionScheduler:
+    """
+    Sits in front of a controller and only presses/releases the keys that changed, releases first.
+    `min_hold` is {action: seconds} to keep keys down at least that long; `repeat` is the action repeat.
+    """
+
+    def __init__(self, controller, repeat=1, min_hold=None, clock=monotonic):
+        if repeat < 1:
+            raise ValueError("repeat has to be at least 1")
+        self.controller = controller
+        self.repeat = repeat
+        self.min_hold = dict(min_hold or {})
+        self.clock = clock
+        self.pressed = {} # action -> when it went down
+        self.last_controls = None
+        self.held_back = [] # released late because of min_hold, still to do
+        self.outputs = 0
+        self.key_events = 0
+
+    @property
+    def running(self):
+        return self.controller.running
+
+    def press_key(self, action):
+        if action not in self.pressed:
+            self.controller.press_key(action)
+            self.pressed[action] = self.clock()
+            self.key_events += 1
+
+    def release_key(self, action):
+        if action in self.pressed:
+            del self.pressed[action]
+            self.controller.release_key(action)
+            self.key_events += 1
+
+    def release_all(self):
+        # ignores min_hold: this is for the end of an episode
+        self.controller.release_all()
+        self.pressed.clear()
+        self.held_back = []
+        self.last_controls = None
+
+    def output(self, controls: dict):
+        """Apply controls ({action: bool}); returns whether any key went down or up."""
+        self.outputs += 1
+        if not self.held_back and controls == self.last_controls:
+            return False
+        now = self.clock()
+        release, press, self.held_back = [], [], []
+        for action, value in controls.items():
+            if value:
+                if action not in self.pressed:
+                    press.append(action)
+            elif action in self.pressed:
+                if now - self.pressed[action] >= self.min_hold.get(action, 0.0):
+                    release.append(action)
+                else:
+                    self.held_back.append(action)
+        for action in release:
+            self.release_key(action)
+        for action in press:
+            self.press_key(action)
+        self.last_controls = dict(controls)
+        return bool(release or press)
+
+    def stop(self):
+        self.release_all()
+        self.controller.stop()
 
 if __name__ == "__main__":
     controller = HollowKnightController()
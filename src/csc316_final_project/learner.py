@@ -0,0 +1,203 @@
+import queue
+import threading
+from time import monotonic
+
+import numpy as np
+import torch
+import torch.optim as optim
+
+from csc316_final_project.inference import InferencePolicy
+from csc316_final_project.neural import HollowNN, action_loss, replay_update, to_tensor
+from csc316_final_project.profiling import profiler
+from csc316_final_project.replay import ReplayBuffer
+
+# actor backends cheap enough to refresh every sync_every updates: eager/compile take the weights in
+# place and int8-dynamic just requantizes two Linear layers. torchscript and onnx re-trace or
+# re-export the whole model on every sync.
+ACTOR_BACKENDS = ('eager', 'compile', 'int8-dynamic')
+
+class Learner:
+    """
+    Trains HollowNN on its own thread; the acting loop uses `actor`, synced every `sync_every` updates.
+    Transitions arrive through a queue and are dropped if it's full (with a replay buffer, along with the rest of their episode).
+    """
+
+    def __init__(self, model: HollowNN, device, lr=1e-4, replay: ReplayBuffer | None = None, batch_size=32, learning_starts=1000, sync_every=50, queue_size=4096, updates_per_step=None, actor_backend='eager'):
+        self.model = model.to(device)
+        self.device = device
+        self.optimizer = optim.Adam(self.model.parameters(), lr=lr)
+        self.replay = replay
+        self.batch_size = batch_size
+        self.learning_starts = learning_starts
+        self.sync_every = sync_every
+        self.updates_per_step = updates_per_step
+
+        if actor_backend not in ACTOR_BACKENDS:
+            raise ValueError(f"actor backend '{actor_backend}' would rebuild the whole model on every sync; use one of {ACTOR_BACKENDS}")
+        self.actor = InferencePolicy(self.model, actor_backend, device)
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock() # held while the learner's weights change (hold it to read them consistently)
+        self.error = None
+        self._published = (None, 0) # (weights, version), replaced whole so the actor can read it without the lock
+        self._actor_version = 0
+        self._thread = None
+
+        self.updates = 0
+        self.actor_steps = 0
+        self.dropped = 0
+        self.broken_episodes = 0
+        self._skipping = False # a replay transition got dropped, so the rest of this episode goes too
+        self._last_stats = (monotonic(), 0, 0)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="learner", daemon=True)
+        self._thread.start()
+        return self
+
+    # actor side
+
+    def _put(self, item):
+        if self.error is not None:
+            raise RuntimeError("learner thread died") from self.error
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.replay is not None:
+                # the buffer links each step to the one before it, so a gap would pair up the wrong
+                # frames; skip to the next episode instead, which starts from a fresh frame
+                self._skipping = True
+                self.broken_episodes += 1
+                print("Learner queue full: dropping the rest of this episode's transitions")
+            return False
+
+    def start_episode(self, obs):
+        self._skipping = False
+        self._put(('start', obs))
+
+    def submit(self, actions, reward, done, next_obs, obs=None):
+        # obs is only needed without a replay buffer (the buffer already has it from the previous step)
+        self.actor_steps += 1
+        if self._skipping:
+            self.dropped += 1
+            return
+        self._put(('step', obs, np.asarray(actions, dtype=np.bool_), float(reward), done, next_obs))
+
+    def call(self, fn):
+        """Run fn() on the learner's thread with the lock held, after everything already queued. False if the queue was full."""
+        if self.error is not None:
+            raise RuntimeError("learner thread died") from self.error
+        try:
+            self.queue.put_nowait(('call', fn))
+            return True
+        except queue.Full:
+            return False
+
+    def sync_actor(self):
+        """Copy the latest published weights into the actor, if there are new ones."""
+        snapshot, version = self._published
+        if version == self._actor_version:
+            return False
+        self.actor.load_state_dict(snapshot)
+        self._actor_version = version
+        return True
+
+    def act(self, screen):
+        return self.actor(screen)
+
+    # learner side
+
+    def _publish(self):
+        # called with self.lock held; the snapshot is never modified once it's published
+        snapshot = {k: v.detach().clone() for k, v in self.model.state_dict().items()}
+        self._published = (snapshot, self._published[1] + 1)
+
+    def _online_update(self, steps):
+        obs = np.stack([step[1] for step in steps])
+        actions = torch.from_numpy(np.stack([step[2] for step in steps])).to(self.device)
+        rewards = torch.tensor([step[3] for step in steps], dtype=torch.float32, device=self.device)
+        loss = action_loss(self.model(to_tensor(obs, self.device)), actions, rewards)
+        self.optimizer.zero_grad()
+        loss.backward()
+        self.optimizer.step()
+
+    def _drain(self, block):
+        items = []
+        try:
+            items.append(self.queue.get(timeout=0.1) if block else self.queue.get_nowait())
+            while True:
+                items.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return items
+
+    def _run(self):
+        try:
+            pending = [] # online mode: steps waiting to be trained on
+            while True:
+                ready = self.replay is not None and len(self.replay) >= max(self.batch_size, self.learning_starts)
+                if ready and self.updates_per_step is not None:
+                    ready = self.updates < self.updates_per_step * self.actor_steps
+                # only wait for transitions when there's nothing to train on in the meantime
+                items = self._drain(block=not ready and not pending)
+                for item in items:
+                    if item is None:
+                        return
+                    if item[0] == 'call':
+                        with self.lock:
+                            item[1]()
+                    elif self.replay is None:
+                        if item[0] == 'step':
+                            pending.append(item)
+                    elif item[0] == 'start':
+                        self.replay.start_episode(item[1])
+                    else:
+                        _, _, actions, reward, done, next_obs = item
+                        self.replay.add(actions, reward, done, next_obs)
+
+                with self.lock, profiler.stage('learner'):
+                    if self.replay is not None:
+                        if not ready:
+                            continue
+                        replay_update(self.model, self.optimizer, self.replay, self.batch_size, self.device)
+                    elif pending:
+                        batch, pending = pending[:self.batch_size], pending[self.batch_size:]
+                        self._online_update(batch)
+                    else:
+                        continue
+                    self.updates += 1
+                    if self.updates % self.sync_every == 0:
+                        self._publish()
+        except Exception as e:
+            self.error = e
+
+    def stats(self):
+        """Actor steps/sec and learner updates/sec since the last call, plus the current queue depth."""
+        now = monotonic()
+        last_time, last_steps, last_updates = self._last_stats
+        elapsed = max(now - last_time, 1e-9)
+        self._last_stats = (now, self.actor_steps, self.updates)
+        return {
+            'actor_steps_per_sec': (self.actor_steps - last_steps) / elapsed,
+            'learner_updates_per_sec': (self.updates - last_updates) / elapsed,
+            'queue_depth': self.queue.qsize(),
+            'dropped': self.dropped,
+            'broken_episodes': self.broken_episodes,
+        }
+
+    def stop(self):
+        if self._thread is not None:
+            # after whatever's queued; don't block on a full queue if the thread's already gone
+            while self._thread.is_alive():
+                try:
+                    self.queue.put(None, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            self._thread.join()
+            self._thread = None
+        self.actor.close()
+        if self.error is not None:
+            raise RuntimeError("learner thread died") from self.error
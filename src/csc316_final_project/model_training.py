@@ -2,70 +2,133 @@ from PIL import Image
 import os
 import glob
 import random
+import hashlib
 import json
 import shutil
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 from tqdm import tqdm
 import numpy as np
 
 
+# decoded assets, per process: backgrounds as RGB, sprites already resized to fit them.
+# bounded, since a folder of 1080p backgrounds is a lot of memory decoded
+@lru_cache(maxsize=64)
+def _load_background(path):
+    return Image.open(path).convert("RGB")
+
+@lru_cache(maxsize=128)
+def _load_sprite(path, size):
+    return Image.open(path).convert("RGBA").resize(size, Image.LANCZOS)
+
+@lru_cache(maxsize=None)
+def _image_size(path):
+    # just the header, no decoding
+    with Image.open(path) as image:
+        return image.size
+
+def _asset_paths(folder):
+    paths = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith('png'))
+    assert paths, f"No images found in '{folder}'!"
+    return paths
+
+def _plan(sprite_paths, background_paths, num_images, seed, chunk_size):
+    # what each image will be (sources, placement), in chunks of chunk_size, without drawing anything.
+    # each chunk has its own seed from `seed`, so image i is the same however the chunks get spread
+    # over workers, and however many images come after it
+    starts = range(0, num_images, chunk_size)
+    seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(len(starts))]
+    chunks = []
+    for start, chunk_seed in zip(starts, seeds):
+        rng = random.Random(chunk_seed)
+        records = []
+        for i in range(start, min(start + chunk_size, num_images)):
+            bg_path = rng.choice(background_paths)
+            sprite_path = rng.choice(sprite_paths)
+
+            bg_w, bg_h = _image_size(bg_path)
+            new_w = bg_w // 2
+            new_h = bg_h // 2
+
+            max_x = bg_w - new_w
+            max_y = bg_h - new_h
+            x = rng.randint(0, max_x)
+            y = rng.randint(0, max_y)
+
+            records.append({
+                "image": f"composite_{i:05}.png",
+                "sprite_source": os.path.basename(sprite_path),
+                "background_source": os.path.basename(bg_path),
+                "bbox": [x, y, x + new_w, y + new_h],
+                "size": [bg_w, bg_h],
+            })
+        chunks.append(records)
+    return chunks
+
+def _render(sprite_folder, background_folder, output_folder, records, compress_level=6):
+    # draws planned images into output_folder; returns the records it drew
+    for record in records:
+        bg = _load_background(os.path.join(background_folder, record["background_source"]))
+        x, y, x_max, y_max = record["bbox"]
+        sprite = _load_sprite(os.path.join(sprite_folder, record["sprite_source"]), (x_max - x, y_max - y))
+
+        bg_copy = bg.copy()
+        bg_copy.paste(sprite, (x, y), sprite)
+        bg_copy.save(os.path.join(output_folder, record["image"]), compress_level=compress_level)
+    return records
+
+def _render_all(render, chunks, workers):
+    # render(chunk) for every chunk, in order, across `workers` processes (1: in this one)
+    if workers == 1:
+        yield from map(render, chunks)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            yield from pool.map(render, chunks)
+
 def overlay_random_sprite_on_background(
     sprite_folder,
     background_folder,
     output_folder,
     metadata_file,
-    num_images=10000
+    num_images=10000,
+    workers=None,
+    seed=0,
+    compress_level=6,
+    chunk_size=64
 ):
-    metadata = []
-
-    sprite_paths = [os.path.join(sprite_folder, f) for f in os.listdir(sprite_folder) if f.lower().endswith('png')]
-    background_paths = [os.path.join(background_folder, f) for f in os.listdir(background_folder) if f.lower().endswith(('png'))]
-
-    assert sprite_paths, "No sprite images found!"
-    assert background_paths, "No background images found!"
-
-    for i in tqdm(range(num_images), desc="Generating composite images"):
-        bg_path = random.choice(background_paths)
-        sprite_path = random.choice(sprite_paths)
-
-        bg = Image.open(bg_path).convert("RGBA")
-        sprite = Image.open(sprite_path).convert("RGBA")
-        bg_w, bg_h = bg.size
-
-        new_w = bg_w // 2
-        new_h = bg_h // 2
-        sprite = sprite.resize((new_w, new_h), Image.LANCZOS)
-
-        max_x = bg_w - new_w
-        max_y = bg_h - new_h
-        x = random.randint(0, max_x)
-        y = random.randint(0, max_y)
-
-        bg_copy = bg.copy()
-        bg_copy.paste(sprite, (x, y), sprite)
-
-        filename = f"composite_{i:05}.png"
-        output_path = os.path.join(output_folder, filename)
-        bg_copy.save(output_path)
-
-        bbox = {
-            "image": filename,
-            "sprite_source": os.path.basename(sprite_path),
-            "background_source": os.path.basename(bg_path),
-            "bbox": [x, y, x + new_w, y + new_h]
-        }
-        metadata.append(bbox)
-
-    with open(metadata_file, "w") as f:
-        json.dump(metadata, f, indent=2)
+    """
+    Pastes random sprites onto random backgrounds, num_images times, across `workers` processes.
+    The same seed gives the same images for any number of workers; metadata is written as JSON lines.
+    """
+    chunks = _plan(_asset_paths(sprite_folder), _asset_paths(background_folder), num_images, seed, chunk_size)
+    render = partial(_render, sprite_folder, background_folder, output_folder, compress_level=compress_level)
+
+    with open(metadata_file, "w") as f, tqdm(total=num_images, desc="Generating composite images") as progress:
+        for records in _render_all(render, chunks, workers):
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            progress.update(len(records))
 
     print(f"Done! {num_images} images saved to '{output_folder}', metadata in '{metadata_file}'.")
 
+def read_metadata(metadata_file):
+    """overlay_random_sprite_on_background's metadata: JSON lines, or the single JSON list older versions wrote."""
+    with open(metadata_file) as f:
+        if f.read(1) == "[":
+            f.seek(0)
+            return json.load(f)
+        f.seek(0)
+        return [json.loads(line) for line in f if line.strip()]
+
+def remove_white(data, threshold=220):
+    # makes near-white pixels of an RGBA array transparent, in place
+    white_mask = (data[..., :3] > threshold).all(axis=-1)
+    data[..., 3][white_mask] = 0
+    return data
+
 def preprocess_fk_sprites(image_path, output_path, threshold=220):
     img = Image.open(image_path).convert("RGBA")
-    data = np.array(img)
-    r, g, b, a = data[..., 0], data[..., 1], data[..., 2], data[..., 3]
-    white_mask = (r > threshold) & (g > threshold) & (b > threshold)
-    data[..., 3][white_mask] = 0
+    data = remove_white(np.array(img), threshold)
     Image.fromarray(data).save(output_path)
 
 
@@ -84,28 +147,31 @@ def process_folder(input_folder, output_folder, threshold=220):
     print("Done processing all images.")
 
 
+def _yolo_label(item, img_w, img_h, class_id=0):
+    x_min, y_min, x_max, y_max = item['bbox']
+    x_center = (x_min + x_max) / 2 / img_w
+    y_center = (y_min + y_max) / 2 / img_h
+    width = (x_max - x_min) / img_w
+    height = (y_max - y_min) / img_h
+    return f"{class_id} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n"
+
 def convert_to_yolo(json_file, label_output_dir, image_dir, class_id=0):
 
-    with open(json_file, "r") as f:
-        data = json.load(f)
+    data = read_metadata(json_file)
 
     for item in tqdm(data, desc="Converting to YOLO"):
         img_path = os.path.join(image_dir, item['image'])
         if not os.path.exists(img_path):
             continue 
-        from PIL import Image
-        img = Image.open(img_path)
-        img_w, img_h = img.size
-        x_min, y_min, x_max, y_max = item['bbox']
-        x_center = (x_min + x_max) / 2 / img_w
-        y_center = (y_min + y_max) / 2 / img_h
-        width = (x_max - x_min) / img_w
-        height = (y_max - y_min) / img_h
+        if 'size' in item:
+            img_w, img_h = item['size'] # known since generation, no need to open the image
+        else:
+            img_w, img_h = _image_size(img_path)
         label_filename = os.path.splitext(item['image'])[0] + '.txt'
         label_path = os.path.join(label_output_dir, label_filename)
 
         with open(label_path, "w") as out_f:
-            out_f.write(f"{class_id} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n")
+            out_f.write(_yolo_label(item, img_w, img_h, class_id))
 
     print(f"YOLO labels saved to: {label_output_dir}")
 
@@ -128,3 +194,150 @@ def split_dataset(images_dir, labels_dir, output_dir, split_ratio=0.8):
         shutil.copy(os.path.join(labels_dir, f.replace('.png', '.txt')), os.path.join(output_dir, "labels/val", f.replace('.png', '.txt')))
 
     print("Dataset split into train/val")
+
+
+# one-pass, incremental version of generate -> convert_to_yolo -> split_dataset.
+# output_dir ends up with generated/ (the images themselves), images/{train,val} (links into
+# generated/), labels/{train,val}, dataset.yaml for Ultralytics, and manifest.jsonl, which
+# remembers what each image was made from so a re-run only redoes what changed.
+
+LINK_MODES = ('hardlink', 'symlink', 'copy')
+_SPLITS = ('train', 'val')
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _split_of(image, seed, split_ratio):
+    # stable per image: growing the dataset or re-running doesn't move anything between splits
+    h = int.from_bytes(hashlib.sha1(f"{seed}:{image}".encode()).digest()[:8], "big")
+    return "train" if h / 2**64 < split_ratio else "val"
+
+def _link(src, dst, link):
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if link == "hardlink":
+        try:
+            os.link(src, dst)
+            return
+        except OSError: # e.g. a different filesystem
+            link = "symlink"
+    if link == "symlink":
+        os.symlink(os.path.relpath(src, os.path.dirname(dst)), dst)
+    else:
+        shutil.copy2(src, dst)
+
+def _remove(*paths):
+    for path in paths:
+        if os.path.lexists(path):
+            os.remove(path)
+
+def _read_manifest(path):
+    # later lines win, so an interrupted build leaves a usable manifest
+    manifest = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError: # cut off mid-write
+                    continue
+                manifest[entry["image"]] = entry
+    return manifest
+
+def build_dataset(
+    sprite_folder,
+    background_folder,
+    output_dir,
+    num_images=10000,
+    split_ratio=0.8,
+    seed=0,
+    workers=None,
+    compress_level=6,
+    link="hardlink",
+    class_id=0,
+    chunk_size=64
+):
+    """
+    Builds a YOLO dataset of num_images composites in output_dir, incrementally (only missing or stale images are redrawn).
+    Returns counts of what happened.
+    """
+    generated = os.path.join(output_dir, "generated")
+    for folder in [generated] + [os.path.join(output_dir, kind, split) for kind in ("images", "labels") for split in _SPLITS]:
+        os.makedirs(folder, exist_ok=True)
+    manifest_path = os.path.join(output_dir, "manifest.jsonl")
+    manifest = _read_manifest(manifest_path)
+
+    sprite_paths = _asset_paths(sprite_folder)
+    background_paths = _asset_paths(background_folder)
+    asset_hashes = {os.path.basename(path): _file_hash(path) for path in sprite_paths + background_paths}
+    chunks = _plan(sprite_paths, background_paths, num_images, seed, chunk_size)
+
+    def key_of(record):
+        inputs = [asset_hashes[record["sprite_source"]], asset_hashes[record["background_source"]], record["bbox"], record["size"], compress_level]
+        return hashlib.sha1(json.dumps(inputs).encode()).hexdigest()
+
+    def split_paths(image, split):
+        return os.path.join(output_dir, "images", split, image), os.path.join(output_dir, "labels", split, os.path.splitext(image)[0] + ".txt")
+
+    counts = {"generated": 0, "relinked": 0, "unchanged": 0, "removed": 0}
+    stale_chunks = []
+    with open(manifest_path, "a") as manifest_file:
+        def finish(record, key, split):
+            # label and link for a drawn image, out of the other split if it moved, then note it down
+            image = record["image"]
+            image_path, label_path = split_paths(image, split)
+            _remove(*split_paths(image, "val" if split == "train" else "train"))
+            with open(label_path, "w") as f:
+                f.write(_yolo_label(record, *record["size"], class_id))
+            _link(os.path.join(generated, image), image_path, link)
+            entry = {"image": image, "key": key, "split": split, "class_id": class_id}
+            manifest_file.write(json.dumps(entry) + "\n")
+            manifest[image] = entry
+
+        for records in chunks:
+            stale = []
+            for record in records:
+                key, split = key_of(record), _split_of(record["image"], seed, split_ratio)
+                entry = manifest.get(record["image"])
+                if entry is None or entry["key"] != key or not os.path.exists(os.path.join(generated, record["image"])):
+                    stale.append(record)
+                elif entry["split"] != split or entry.get("class_id") != class_id or not all(os.path.lexists(path) for path in split_paths(record["image"], split)):
+                    finish(record, key, split)
+                    counts["relinked"] += 1
+                else:
+                    counts["unchanged"] += 1
+            if stale:
+                stale_chunks.append(stale)
+
+        # draw what's stale across the pool, finishing each chunk as it comes back
+        render = partial(_render, sprite_folder, background_folder, generated, compress_level=compress_level)
+        with tqdm(total=sum(map(len, stale_chunks)), desc="Generating composite images") as progress:
+            for records in _render_all(render, stale_chunks, workers):
+                for record in records:
+                    finish(record, key_of(record), _split_of(record["image"], seed, split_ratio))
+                manifest_file.flush()
+                counts["generated"] += len(records)
+                progress.update(len(records))
+
+    # images from a bigger earlier build
+    planned = {record["image"] for records in chunks for record in records}
+    for image in [image for image in manifest if image not in planned]:
+        _remove(os.path.join(generated, image), *(path for split in _SPLITS for path in split_paths(image, split)))
+        del manifest[image]
+        counts["removed"] += 1
+
+    # compact the manifest to one line per image
+    with open(manifest_path + ".tmp", "w") as f:
+        for entry in manifest.values():
+            f.write(json.dumps(entry) + "\n")
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    with open(os.path.join(output_dir, "dataset.yaml"), "w") as f:
+        f.write(f"path: {os.path.abspath(output_dir)}\ntrain: images/train\nval: images/val\nnames:\n  {class_id}: false_knight\n")
+
+    print(f"Dataset in '{output_dir}': {counts['generated']} generated, {counts['relinked']} relinked, {counts['unchanged']} unchanged, {counts['removed']} removed.")
+    return counts
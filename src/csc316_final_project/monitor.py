@@ -5,9 +5,10 @@ from rich.layout import Layout
 from rich.panel import Panel
 from rich.console import Console
 from datetime import datetime, timedelta
-from time import sleep
+from time import sleep, monotonic
+import atexit
+import selectors
 import socket
-import pickle
 import os
 import struct
 import threading
@@ -20,14 +21,23 @@ from pathlib import Path
 action_keys = ['left', 'right', 'up', 'down', 'jump', 'attack', 'focus']
 
 class Monitor:
-    def __init__(self):
+    def __init__(self, run_id=None):
+        self.run_id = run_id
+        self.connections = 0 # trainers currently connected as this run
+        self.disconnected_at = None
         self.episode = 0
         self.reward = 0
         self.spawn_time = datetime.now().replace(microsecond=0)
         self.start_time = datetime.now().replace(microsecond=0)
         self.controller_input = {i: False for i in action_keys}
         self.obs_status = 0 # 0 = unknown, 1 = recording, 2 = not recording, 3 = not connected
+        self.profile = None # see profiling, only sent while profiling
         self.create_layout()
+
+    def apply(self, state: dict):
+        # fields from a decoded message
+        for name, value in state.items():
+            setattr(self, name, value)
     
     def create_layout(self):
         layout = Layout()
@@ -53,7 +63,12 @@ class Monitor:
         run_time = datetime.now().replace(microsecond=0) - self.start_time
         layout["start_clock"].update(f"[cyan]{run_time}[/cyan]")
         layout["controller_input"].update(self.controller_input_text)
-        layout["body"].update(f"[yellow]Episode: {self.episode}[/yellow] | Score: [green]{round(self.reward, 2)}[/green]")
+        run = f"[bold]{self.run_id}[/bold] | " if self.run_id is not None else ""
+        profile = ""
+        if self.profile is not None:
+            steps_per_sec, _, p95, _ = self.profile
+            profile = f" | [blue]{steps_per_sec:.0f} Hz, p95 {p95:.0f} ms[/blue]"
+        layout["body"].update(f"{run}[yellow]Episode: {self.episode}[/yellow] | Score: [green]{round(self.reward, 2)}[/green]{profile}")
         layout["recording_status"].update(self.obs_status_str)
         return layout
     
@@ -77,123 +92,296 @@ class Monitor:
         main_text.append("♥", style="bold red" if self.controller_input["focus"] else "dim")
         return main_text
 
+REFRESH_RATE = 10 # panel redraws per second; the client doesn't send any faster than this
+
+def default_socket_path():
+    return os.path.join(os.environ.get("XDG_RUNTIME_DIR", "/tmp"), f"csc316-monitor-{os.getuid()}.sock")
+
+# wire format: each message is a 2 byte big-endian length, then any number of fields, each a
+# 1 byte tag, 1 byte length and the value. unknown tags get skipped, so older panels keep working.
+def _pack_time(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return struct.pack("!d", value.timestamp())
+
+def _unpack_time(data):
+    return datetime.fromtimestamp(struct.unpack("!d", data)[0]).replace(microsecond=0)
+
+def _pack_keys(controls):
+    mask = 0
+    for i, key in enumerate(action_keys):
+        if controls.get(key):
+            mask |= 1 << i
+    return bytes([mask])
+
+def _unpack_keys(data):
+    return {key: bool(data[0] >> i & 1) for i, key in enumerate(action_keys)}
+
+# name -> (tag, encode, decode)
+FIELDS = {
+    "episode": (1, lambda v: struct.pack("!i", v), lambda b: struct.unpack("!i", b)[0]),
+    "reward": (2, lambda v: struct.pack("!d", v), lambda b: struct.unpack("!d", b)[0]),
+    "obs_status": (3, lambda v: bytes([v]), lambda b: b[0]),
+    "controller_input": (4, _pack_keys, _unpack_keys),
+    "spawn_time": (5, _pack_time, _unpack_time),
+    "start_time": (6, _pack_time, _unpack_time),
+    "run_id": (7, lambda v: str(v).encode()[:255], lambda b: b.decode(errors="replace")),
+    "profile": (8, lambda v: struct.pack("!4f", *v), lambda b: struct.unpack("!4f", b)), # steps/sec, step p50/p95/p99 ms
+}
+_BY_TAG = {tag: (name, decode) for name, (tag, _, decode) in FIELDS.items()}
+
+def encode_message(state: dict) -> bytes:
+    body = bytearray()
+    for name, value in state.items():
+        if name not in FIELDS:
+            continue
+        tag, encode, _ = FIELDS[name]
+        data = encode(value)
+        body += bytes([tag, len(data)]) + data
+    return struct.pack("!H", len(body)) + body
+
+class MessageReader:
+    """Splits a byte stream back into messages, however it was chunked."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data) -> list[dict]:
+        self.buffer += data
+        messages = []
+        offset = 0
+        with memoryview(self.buffer) as view:
+            while len(view) - offset >= 2:
+                length = struct.unpack_from("!H", view, offset)[0]
+                if len(view) - offset < 2 + length:
+                    break
+                messages.append(decode_message(view[offset + 2:offset + 2 + length]))
+                offset += 2 + length
+        if offset:
+            del self.buffer[:offset] # once per read, not per message
+        return messages
+
+def decode_message(body) -> dict:
+    """The fields of one message (without its length prefix)."""
+    state = {}
+    i = 0
+    while i + 2 <= len(body):
+        tag, length = body[i], body[i + 1]
+        data = bytes(body[i + 2:i + 2 + length])
+        i += 2 + length
+        if tag in _BY_TAG and len(data) == length:
+            name, decode = _BY_TAG[tag]
+            try:
+                state[name] = decode(data)
+            except (struct.error, ValueError, OverflowError, OSError):
+                pass
+    return state
+
 def spawn_kitty_panel():
     """
     Spawns a kitty terminal panel for monitoring!
 
     Returns the subprocess.Popen object for the kitty terminal.
     """
-    socket_path = os.path.join(os.environ.get("XDG_RUNTIME_DIR", "/tmp"), f"csc316-monitor-{os.getuid()}.sock")
+    socket_path = default_socket_path()
     print(["kitten", "panel", "--lines=1", "--edge=bottom", "/home/luna/.local/bin/uv", "run", "python3", "-u", "-m", "csc316_final_project.monitor", "--panel", "--socket", socket_path])
     # do nothing, im spawning it myself
     # return subprocess.Popen(["kitten", "panel", "--lines=1", "--edge=bottom", "/home/luna/.local/bin/uv", "run", "python3", "-u", "-m", "csc316_final_project.monitor", "--panel", "--socket", socket_path], cwd=Path(__file__).parent)
 
+class MonitorClient:
+    """
+    Sends state to the monitor panel over one long-lived connection, from a background thread.
+    `publish()` is cheap enough to call every step; `run_id` names this trainer's row.
+    """
+
+    def __init__(self, socket_path=None, run_id=None, rate=REFRESH_RATE, reconnect_interval=1.0, send_timeout=0.5):
+        self.socket_path = socket_path or default_socket_path()
+        self.run_id = str(run_id) if run_id is not None else f"run-{os.getpid()}"
+        self.interval = 1 / rate
+        self.reconnect_interval = reconnect_interval
+        self.send_timeout = send_timeout
+        self.state = {'run_id': self.run_id} # everything published so far, for catching up a new panel
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.sock = None
+        self.last_attempt = None
+        self.messages_sent = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="monitor-client", daemon=True)
+        self._thread.start()
+
+    def publish(self, state: dict) -> None:
+        with self.lock:
+            self.pending.update(state)
+
+    __call__ = publish
+
+    def _connect(self):
+        now = monotonic()
+        if self.last_attempt is not None and now - self.last_attempt < self.reconnect_interval:
+            return False
+        self.last_attempt = now
+        if not os.path.exists(self.socket_path):
+            return False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.send_timeout)
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            return False
+        self.sock = sock
+        return True
+
+    def _disconnect(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def flush(self) -> None:
+        """Send whatever's pending now (normally the background thread does this)."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        self.state.update(pending)
+        if self.sock is None:
+            if not self._connect():
+                return
+            pending = self.state # a new connection, maybe a new panel: send it everything
+        if not pending:
+            return
+        try:
+            self.sock.sendall(encode_message(pending))
+            self.messages_sent += 1
+        except OSError:
+            # panel went away (or stopped reading); try again with everything later
+            self._disconnect()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._stop.set()
+            self._thread.join()
+            self.flush()
+        self._disconnect()
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def default_client(**kwargs) -> MonitorClient:
+    """The client send_info uses. kwargs (see MonitorClient) only count if it doesn't exist yet."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = MonitorClient(**kwargs)
+            atexit.register(_default_client.close) # get the last update out
+        return _default_client
+
 def send_info(state: dict) -> None:
     """
     Send state info to the monitor panel if running. This is a helper
     function you can call from anywhere in your code to update the monitor.
     """
-    socket_path = os.path.join(os.environ.get("XDG_RUNTIME_DIR", "/tmp"), f"csc316-monitor-{os.getuid()}.sock")
-    if not os.path.exists(socket_path):
-        return
-    try:
-        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        client.connect(socket_path)
-        payload = pickle.dumps(state)
-        prefix = struct.pack("!I", len(payload))
-        client.sendall(prefix + payload)
-        client.close()
-    except Exception:
-        pass
-
-def run_panel(socket_path: str) -> None:
-    """Run inside the kitten panel process: connect to the unix socket and
+    default_client().publish(state)
+
+def run_panel(socket_path: str, stale_after=60.0) -> None:
+    """Run inside the kitten panel process: listen on the unix socket and
     render the Monitor UI using received state updates.
     """
     if os.path.exists(socket_path):
         os.unlink(socket_path)
-    
+
     server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    selector = selectors.DefaultSelector()
+    runs = {} # run_id -> Monitor
+    idle = Monitor() # shown until someone connects
+    read_buffer = bytearray(65536)
+    read_view = memoryview(read_buffer)
+
+    def close(client_sock, conn):
+        selector.unregister(client_sock)
+        client_sock.close()
+        if conn['monitor'] is not None:
+            conn['monitor'].connections -= 1
+            if conn['monitor'].connections == 0:
+                conn['monitor'].disconnected_at = monotonic()
+
+    def read(client_sock, conn):
+        try:
+            n = client_sock.recv_into(read_buffer)
+        except BlockingIOError:
+            return False
+        except OSError:
+            n = 0
+        if n == 0:
+            close(client_sock, conn)
+            return True
+        for state in conn['reader'].feed(read_view[:n]):
+            if conn['monitor'] is None:
+                run_id = state.get('run_id', f"#{client_sock.fileno()}")
+                if run_id not in runs:
+                    runs[run_id] = Monitor(run_id)
+                monitor = conn['monitor'] = runs[run_id]
+                monitor.connections += 1
+                monitor.disconnected_at = None
+            state.pop('run_id', None)
+            conn['monitor'].apply(state)
+        return True
+
+    def render():
+        now = monotonic()
+        for run_id, monitor in list(runs.items()):
+            if monitor.connections == 0 and now - monitor.disconnected_at > stale_after:
+                del runs[run_id]
+        rows = list(runs.values()) or [idle]
+        if len(rows) == 1:
+            return rows[0].update()
+        layout = Layout()
+        layout.split_column(*(Layout(monitor.update(), size=1) for monitor in rows))
+        return layout
+
     try:
         server.bind(socket_path)
-        server.listen(5)  # Allow multiple pending connections
-        server.settimeout(0.1)  # Non-blocking accept with timeout
+        server.listen(16)
+        server.setblocking(False)
         os.chmod(socket_path, 0o666) # allow other users to connect
+        selector.register(server, selectors.EVENT_READ)
 
-        with Live(refresh_per_second=10) as live:
-            monitor = Monitor()
-            
+        with Live(render(), auto_refresh=False) as live:
+            dirty = False
+            last_render = monotonic()
             while True:
-                # Try to accept new connections
-                try:
-                    client, _ = server.accept()
-                    # Handle this client connection in a separate thread
-                    def handle_client(client_sock):
+                next_render = last_render + (1 / REFRESH_RATE if dirty else 1.0)
+                for key, _ in selector.select(timeout=max(0.0, next_render - monotonic())):
+                    if key.fileobj is server:
                         try:
-                            client_sock.setblocking(True)
-                            buffer = b""
-                            
-                            # Read length-prefixed message
-                            while len(buffer) < 4:
-                                chunk = client_sock.recv(4096)
-                                if not chunk:
-                                    return
-                                buffer += chunk
-                            length = struct.unpack("!I", buffer[:4])[0]
-                            buffer = buffer[4:]
-                            while len(buffer) < length:
-                                chunk = client_sock.recv(4096)
-                                if not chunk:
-                                    return
-                                buffer += chunk
-                            payload = buffer[:length]
-                            
-                            try:
-                                state = pickle.loads(payload)
-                                # Update monitor state
-                                monitor.controller_input = state.get("controller_input", monitor.controller_input)
-                                monitor.obs_status = state.get("obs_status", monitor.obs_status)
-                                spawn_iso = state.get("spawn_time")
-                                if spawn_iso:
-                                    try:
-                                        monitor.spawn_time = datetime.fromisoformat(spawn_iso)
-                                    except Exception:
-                                        pass
-                                monitor.reward = state.get("reward", monitor.reward)
-                                monitor.episode = state.get("episode", monitor.episode)
-                                start_iso = state.get("start_time")
-                                if start_iso:
-                                    try:
-                                        monitor.start_time = datetime.fromisoformat(start_iso)
-                                    except Exception:
-                                        pass
-                            except Exception:
-                                pass
-                        finally:
-                            client_sock.close()
-                    
-                    # Start thread to handle this client
-                    thread = threading.Thread(target=handle_client, args=(client,), daemon=True)
-                    thread.start()
-                    
-                except socket.timeout:
-                    pass  # No new connection, continue
-                except Exception:
-                    pass  # Handle other socket errors gracefully
-                
-                # Update the Live display with the monitor
-                live.update(monitor.update())
-                sleep(0.05)
+                            client_sock, _ = server.accept()
+                        except OSError:
+                            continue
+                        client_sock.setblocking(False)
+                        selector.register(client_sock, selectors.EVENT_READ, {'reader': MessageReader(), 'monitor': None})
+                    else:
+                        dirty |= read(key.fileobj, key.data)
+                now = monotonic()
+                if now - last_render >= (1 / REFRESH_RATE if dirty else 1.0):
+                    live.update(render(), refresh=True)
+                    dirty = False
+                    last_render = now
     finally:
         # Clean up socket file when done
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+        selector.close()
+        server.close()
         if os.path.exists(socket_path):
             os.unlink(socket_path)
-        server.close()
 
 
 def run_monitor() -> None:
     """Run the monitor in standalone mode - just display the UI without socket communication."""
-    with Live(refresh_per_second=10) as live:
+    with Live(refresh_per_second=REFRESH_RATE) as live:
         monitor = Monitor()
         try:
             while True:
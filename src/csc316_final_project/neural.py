@@ -1,22 +1,23 @@
-from time import sleep
+from time import perf_counter
 import torch
 import torch.nn as nn
 import torch.optim as optim
 import numpy as np
-from datetime import datetime, timedelta
-from PIL import Image, ImageGrab
-from functools import cache
+from datetime import datetime
 
-from csc316_final_project.cv import get_player_health
-from csc316_final_project.keyboard_emulation import HollowKnightController
 from csc316_final_project.monitor import send_info
-from csc316_final_project.object_detection import detect_fk_hit
-from csc316_final_project.util import get_coords_of_active_window
+from csc316_final_project.perception import FrameStack
+from csc316_final_project.profiling import TARGET_HZ, profiler, write_summary
+from csc316_final_project.replay import ReplayBuffer
+
+# HollowNN's outputs, in order: one multi-hot action per key (see keyboard_emulation)
+ACTION_KEYS = ['left', 'right', 'up', 'down', 'jump', 'attack', 'focus']
 
 class HollowNN(nn.Module):
     def __init__(self, input_shape, num_actions=7):
         # 7 (num_actions) corresponds to: left, right, up, down, jump, attack, focus
         super().__init__()
+        self.input_shape = tuple(input_shape)
         c, h, w = input_shape
         conv = nn.Sequential(
             nn.Conv2d(c, 32, kernel_size=8, stride=4), nn.ReLU(),
@@ -37,6 +38,52 @@ class HollowNN(nn.Module):
     def forward(self, x):
         return self.net(x) # how's that for a one-liner?
 
+def save_model(model: HollowNN, path, frame_stack=1):
+    # checkpoints record how the model sees the game, so it can be loaded without being told
+    torch.save({'state_dict': model.state_dict(), 'input_shape': model.input_shape, 'frame_stack': frame_stack}, path)
+
+def load_model(path, map_location=None):
+    # returns (model, frame_stack); also reads bare state dicts from before checkpoints had metadata
+    return model_from_checkpoint(torch.load(str(path), map_location=map_location))
+
+def model_from_checkpoint(checkpoint):
+    # same, for a checkpoint that's already loaded (e.g. a checkpoint.CheckpointManager one)
+    if 'state_dict' not in checkpoint:
+        checkpoint = {'state_dict': checkpoint, 'input_shape': (3, 84, 84), 'frame_stack': 1}
+    model = HollowNN(tuple(checkpoint['input_shape']))
+    model.load_state_dict(checkpoint['state_dict'])
+    return model, checkpoint['frame_stack']
+
+def to_tensor(screens, device):
+    # uint8 screen(s), [C, H, W] or [B, C, H, W] -> float tensor in [0, 1], [B, C, H, W]
+    tensor = torch.from_numpy(np.ascontiguousarray(screens)).to(device)
+    if tensor.dim() == 3:
+        tensor = tensor.unsqueeze(0)
+    return tensor.float().div_(255.0)  # Normalize to [0, 1]
+
+def action_loss(q_values, actions, rewards):
+    # Use binary cross-entropy for multi-label classification, with target actions based on reward feedback:
+    # nudge towards the actions taken if they were rewarded (+0.1), away from them if punished (-0.1)
+    # actions: [B, num_actions] bools, rewards: [B]
+    target_actions = torch.clamp(actions.float() + 0.1 * torch.sign(rewards).unsqueeze(1), 0, 1)
+    action_probs = torch.sigmoid(q_values)
+    return torch.nn.functional.binary_cross_entropy(action_probs, target_actions)
+
+def replay_update(model, optimizer, replay: ReplayBuffer, batch_size, device):
+    # one optimizer step on a random minibatch from the replay buffer
+    return batch_update(model, optimizer, replay.sample(batch_size), device)
+
+def batch_update(model, optimizer, batch, device):
+    # one optimizer step on a minibatch, as returned by ReplayBuffer.sample
+    q_values = model(to_tensor(batch['obs'], device))
+    actions = torch.from_numpy(batch['actions']).to(device)
+    rewards = torch.from_numpy(batch['rewards']).to(device)
+    loss = action_loss(q_values, actions, rewards)
+    optimizer.zero_grad()
+    loss.backward()
+    optimizer.step()
+    return loss.item()
+
 def reward_function(state, prev_state):
     # reward for dealing damage or healing,
     # punish for taking damage, and a small punish for time
@@ -52,115 +99,205 @@ def reward_function(state, prev_state):
     reward -= 0.005  # (really) small time penalty to encourage faster completion
     return reward
 
-def get_screen_and_state(fk_detect_model):
-    # take a screenshot and process it into the state representation
-    window_bbox = get_coords_of_active_window()
-    screenshot = ImageGrab.grab(bbox=window_bbox)
+def train_model(model: HollowNN, env, obs_manager, episodes=1000, start_episode=0, gamma=0.99, lr=1e-4, epsilon=0.05, action_threshold=0.5, replay: ReplayBuffer | None = None, batch_size=32, learning_starts=1000, async_learner=False, sync_every=50, frame_stack=1, recorder=None, profile_log=None, actor_backend='eager', checkpoints=None, checkpoint_every=10, checkpoint_replay=True, resume_state=None):
+    # env is an env.HollowKnightEnv, live or replayed
+    # with profiling.profiler enabled, per-stage timings go to the monitor and (if given) profile_log
+    # checkpoints (a checkpoint.CheckpointManager) get the whole training state every checkpoint_every
+    # episodes, and resume_state (one of its checkpoints) picks up where it left off
+    device = torch.accelerator.current_accelerator().type if torch.accelerator.is_available() else "cpu"
+    model = model.to(device)
+    print(f"Using {device} device")
+
+    learner = None
+    if async_learner:
+        # backprop happens on the learner's thread; we act with its periodically synced copy of the model
+        from csc316_final_project.learner import Learner
+        learner = Learner(model, device, lr=lr, replay=replay, batch_size=batch_size, learning_starts=learning_starts, sync_every=sync_every, actor_backend=actor_backend)
+        optimizer = learner.optimizer
+    else:
+        optimizer = optim.Adam(model.parameters(), lr=lr)
+    if resume_state is not None:
+        from csc316_final_project.checkpoint import restore
+        start_episode = restore(resume_state, optimizer, replay)
+        print(f"Resuming at episode {start_episode + 1}")
+    if learner is not None:
+        learner.start()
 
-    screen = screenshot.resize((84, 84)).convert('RGB')
-    screen = np.array(screen).transpose((2, 0, 1)) / 255.0  # Normalize to [0, 1]
+    def save_checkpoint(next_episode):
+        # snapshot where nothing's changing under us: here, or on the learner's thread between updates
+        snapshot = lambda: checkpoints.save(model, optimizer, next_episode, frame_stack, replay if checkpoint_replay else None)
+        if learner is None:
+            snapshot()
+        elif not learner.call(snapshot):
+            print("Learner queue full, skipping this checkpoint")
+    action_keys = ACTION_KEYS
+    num_actions = len(action_keys)
+    send_info({'spawn_time': datetime.now()})
+    stack = FrameStack(frame_stack)
+    if replay is not None:
+        print(f"Training from replay: {replay.capacity} transitions, {replay.nbytes / 2**20:.0f} MiB, batch size {batch_size}")
+
+    episode = start_episode
+    try:
+        for episode in range(start_episode, episodes):
+            if obs_manager:
+                obs_manager.start_record(episode_num=episode)
+            send_info({'episode': episode, 'reward': 0, 'obs_status': obs_manager.status if obs_manager else 3, 'controller_input': {k: False for k in action_keys}, 'start_time': datetime.now()})
+
+            frame, state = env.reset()
+            screen = stack.reset(frame) # the model sees the last frame_stack frames
+            if recorder is not None:
+                recorder.start_episode(frame, state)
+            if learner is not None:
+                learner.start_episode(frame)
+            elif replay is not None:
+                replay.start_episode(frame)
+            done = False
+            total_reward = 0
+            steps = decisions = 0
+            last_controls = None
+            episode_start = perf_counter()
+            step_end = last_publish = episode_start
+
+            while not done:
+                with profiler.stage('forward'):
+                    if learner is not None:
+                        learner.sync_actor()
+                        q_values = learner.act(screen)  # [1, num_actions]
+                    else:
+                        # prepare tensors
+                        state_tensor = to_tensor(screen, device)  # [1, C, H, W]
+                        if replay is not None:
+                            with torch.inference_mode(): # only acting here, the gradient comes from the minibatch
+                                q_values = model(state_tensor)  # [1, num_actions]
+                        else:
+                            q_values = model(state_tensor)  # [1, num_actions]
+
+                # convert to probabilities (independent per-action) and choose multi-action (multi-hot)
+                probs = torch.sigmoid(q_values).detach().cpu().numpy()[0]  # [num_actions]
+                actions = probs > action_threshold  # greedy multi-label decision
+
+                # epsilon exploration: with prob epsilon flip each action to a random boolean
+                for i in range(num_actions):
+                    if np.random.rand() < epsilon:
+                        actions[i] = np.random.rand() < 0.5
 
-    state = {
-        'player_health': get_player_health(screenshot),
-        'enemy_damaged': detect_fk_hit(screenshot, fk_detect_model)
-    }
+                # ensure at least one action (optional)
+                # if not actions.any():
+                #     actions[int(np.argmax(probs))] = True
 
-    return screen, state
+                # map multi-hot actions to controller outputs
+                controls = dict(zip(action_keys, actions.tolist()))
+                if controls != last_controls: # the panel already shows these otherwise
+                    with profiler.stage('monitor'):
+                        send_info({'controller_input': controls})
+                    last_controls = controls
 
-def train_model(model: HollowNN, controller: HollowKnightController, obs_manager, fk_detect_model, episodes=1000, start_episode=0, gamma=0.99, lr=1e-4, max_episode_time=timedelta(minutes=5), epsilon=0.05, action_threshold=0.5):
+                # hold the decision for `repeat` steps (action repeat); the model sees where it ended up
+                # and learns from what it got along the way
+                reward = 0
+                for _ in range(env.controller.repeat): # can change between decisions, see pacing.RateScheduler
+                    next_frame, step_reward, done, next_state = env.step(controls)
+                    steps += 1
+                    reward += step_reward
+                    if profiler.enabled:
+                        now = perf_counter()
+                        profiler.record('step', now - step_end)
+                        step_end = now
+                        if steps % TARGET_HZ == 0: # about once a second, if we're keeping up
+                            send_info({'profile': (TARGET_HZ / (now - last_publish), *profiler.step_summary())})
+                            last_publish = now
+                    if done:
+                        break
+                decisions += 1
+                total_reward += reward
+                with profiler.stage('monitor'):
+                    send_info({'reward': total_reward})
+
+                if recorder is not None:
+                    recorder.add(actions, reward, done, next_frame, next_state)
+                with profiler.stage('backward'):
+                    if learner is not None:
+                        learner.submit(actions, reward, done, next_frame, obs=None if replay is not None else screen.copy())
+                    elif replay is not None:
+                        replay.add(actions, reward, done, next_frame)
+                        if len(replay) >= max(batch_size, learning_starts):
+                            replay_update(model, optimizer, replay, batch_size, device)
+                    else:
+                        # online: learn from just this step
+                        loss = action_loss(q_values, torch.from_numpy(actions).unsqueeze(0).to(device), torch.tensor([reward], device=device))
+                        optimizer.zero_grad()
+                        loss.backward()
+                        optimizer.step()
+
+                # advance to next step
+                screen, state = stack.push(next_frame), next_state
+
+            episode_time = perf_counter() - episode_start
+            steps_per_sec = steps / episode_time
+            pacing = env.pacing_stats()
+            if profiler.enabled:
+                profile = profiler.summary(steps, episode_time)
+                stages = profile['stages']
+                slowest = sorted((name for name in stages if name not in ('step', 'perception')), key=lambda name: -stages[name]['p95_ms'])[:3]
+                print(f"  {steps_per_sec:.1f}/{TARGET_HZ} Hz, step p95 {stages['step']['p95_ms']:.1f} ms, slowest stages (p95): " + ", ".join(f"{name} {stages[name]['p95_ms']:.1f} ms" for name in slowest))
+                if profile_log:
+                    write_summary(profile_log, profile, episode=episode, time=datetime.now().isoformat(), pacing=pacing)
+            if pacing is not None:
+                print(f"  pacing: {pacing['achieved_hz']:.1f}/{pacing['target_hz']} Hz (now {pacing['hz']:.1f}), jitter {pacing['jitter_ms']:.1f} ms, {pacing['overruns']} overruns ({pacing['skipped']} slots skipped), frame skip {pacing['frame_skip']}")
+            yolo_stats = env.end_episode()
+            print(f"Episode {episode+1}/{episodes}, Total Reward: {total_reward:.2f}, {steps} steps ({steps_per_sec:.1f}/s{f', {decisions} decisions' if decisions != steps else ''}), YOLO calls: {yolo_stats['yolo_calls']} ({yolo_stats['yolo_skipped']} skipped by tracking)")
+            if learner is not None:
+                learner_stats = learner.stats()
+                print(f"  actor: {learner_stats['actor_steps_per_sec']:.1f} steps/s, learner: {learner_stats['learner_updates_per_sec']:.1f} updates/s, queue depth: {learner_stats['queue_depth']} ({learner_stats['dropped']} dropped{f", {learner_stats['broken_episodes']} episodes cut short" if learner_stats['broken_episodes'] else ''})")
+            send_info({'episode': episode, 'reward': total_reward, 'obs_status': obs_manager.status if obs_manager else 3, 'controller_input': {k: False for k in action_keys}})
+            if (episode + 1) % checkpoint_every == 0:
+                if checkpoints is not None:
+                    save_checkpoint(episode + 1)
+                elif learner is not None:
+                    with learner.lock:
+                        save_model(model, f"hollow_nn_episode_{episode+1}.pth", frame_stack)
+                else:
+                    save_model(model, f"hollow_nn_episode_{episode+1}.pth", frame_stack)
+            if obs_manager:
+                # sleep(0.5)
+                obs_manager.stop_record()
+    except BaseException:
+        # crashed or interrupted mid-episode: keep what's been learned so far, and redo this episode on resume
+        if checkpoints is not None:
+            if learner is not None:
+                try:
+                    learner.stop()
+                except Exception:
+                    pass # it's what crashed; save what it got to
+            checkpoints.save(model, optimizer, episode, frame_stack, replay if checkpoint_replay else None)
+            checkpoints.flush()
+            print(f"Saved a checkpoint to resume episode {episode+1} from")
+        raise
+    if learner is not None:
+        learner.stop()
+        learner = None # nothing's training any more, so save_checkpoint can snapshot right here
+    if recorder is not None:
+        recorder.close()
+    if checkpoints is not None:
+        if episodes % checkpoint_every:
+            save_checkpoint(episodes) # otherwise the loop just did
+        checkpoints.flush()
+    save_model(model, f"hollow_nn_final_eps_{episodes}.pth", frame_stack)
+
+def train_offline(model: HollowNN, dataset, steps, batch_size=32, lr=1e-4, frame_stack=1, save_every=1000, output_prefix="hollow_nn_offline"):
+    # train on recorded play (dataset.OfflineDataset), no game needed
     device = torch.accelerator.current_accelerator().type if torch.accelerator.is_available() else "cpu"
     model = model.to(device)
-    print(f"Using {device} device")
+    print(f"Using {device} device, {len(dataset)} recorded transitions")
 
     optimizer = optim.Adam(model.parameters(), lr=lr)
-    action_keys = ['left', 'right', 'up', 'down', 'jump', 'attack', 'focus']
-    num_actions = len(action_keys)
-    send_info({'spawn_time': datetime.now().isoformat()})
-
-    for episode in range(start_episode, episodes):
-        if obs_manager:
-            obs_manager.start_record(episode_num=episode)
-        controller.press_key('load')
-        send_info({'episode': episode, 'reward': 0, 'obs_status': obs_manager.status if obs_manager else 3, 'controller_input': {k: False for k in action_keys}, 'start_time': datetime.now().isoformat()})
-        sleep(1)
-
-        screen, state = get_screen_and_state(fk_detect_model)
-        done = False
-        total_reward = 0
-        start_time = datetime.now()
-
-        while not done:
-            # prepare tensors
-            state_tensor = torch.from_numpy(screen).unsqueeze(0).float().to(device)  # [1, C, H, W]
-            q_values = model(state_tensor)  # [1, num_actions]
-
-            # convert to probabilities (independent per-action) and choose multi-action (multi-hot)
-            probs = torch.sigmoid(q_values).detach().cpu().numpy()[0]  # [num_actions]
-            actions = probs > action_threshold  # greedy multi-label decision
-
-            # epsilon exploration: with prob epsilon flip each action to a random boolean
-            for i in range(num_actions):
-                if np.random.rand() < epsilon:
-                    actions[i] = np.random.rand() < 0.5
-
-            # ensure at least one action (optional)
-            # if not actions.any():
-            #     actions[int(np.argmax(probs))] = True
-
-            # map multi-hot actions to controller outputs
-            controls = {k: False for k in action_keys}
-            for i, key in enumerate(action_keys):
-                if actions[i]:
-                    controls[key] = True
-
-            controller.output(controls)
-            send_info({'controller_input': controls})
-
-            # give the game a short time to update, then observe next state
-            sleep(1/35)
-            next_screen, next_state = get_screen_and_state(fk_detect_model)
-
-            # fix: if we're in the first 5 seconds, don't punish for health loss (to avoid spawn invincibility issues and ui lag)
-            if datetime.now() - start_time < timedelta(seconds=5):
-                next_state['player_health'] = 5
-
-            # check terminal conditions
-            if datetime.now() - start_time > max_episode_time or next_state.get('player_health', 1) <= 0:
-                done = True
-
-            reward = reward_function(next_state, state)
-            total_reward += reward
-            send_info({'reward': total_reward})
-
-            # Fixed approach: Use binary cross-entropy for multi-label classification
-            # Create target actions based on reward feedback
-            target_actions = torch.tensor(actions, dtype=torch.float32).unsqueeze(0).to(device)
-            
-            # Adjust targets based on reward
-            if reward > 0:
-                target_actions = torch.clamp(target_actions + 0.1, 0, 1)  # Encourage actions taken
-            elif reward < 0:
-                target_actions = torch.clamp(target_actions - 0.1, 0, 1)  # Discourage actions taken
-            # If reward == 0, keep original targets
-            
-            # Use sigmoid activation and binary cross-entropy loss
-            action_probs = torch.sigmoid(q_values)
-            loss = torch.nn.functional.binary_cross_entropy(action_probs, target_actions)
-
-            optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
-
-            # advance to next step
-            screen, state = next_screen, next_state
-
-        print(f"Episode {episode+1}/{episodes}, Total Reward: {total_reward:.2f}")
-        controller.release_all()
-        send_info({'episode': episode, 'reward': total_reward, 'obs_status': obs_manager.status if obs_manager else 3, 'controller_input': {k: False for k in action_keys}})
-        if (episode + 1) % 10 == 0:
-            torch.save(model.state_dict(), f"hollow_nn_episode_{episode+1}.pth")
-        sleep(5) # wait for the dying animation to finish
-        if obs_manager:
-            # sleep(0.5)
-            obs_manager.stop_record()
-    torch.save(model.state_dict(), f"hollow_nn_final_eps_{episodes}.pth")
+    running_loss = None
+    for step, batch in enumerate(dataset.minibatches(batch_size, steps)):
+        loss = batch_update(model, optimizer, batch, device)
+        running_loss = loss if running_loss is None else 0.99 * running_loss + 0.01 * loss
+        if (step + 1) % 100 == 0:
+            print(f"Step {step+1}/{steps}, loss: {running_loss:.4f}")
+        if (step + 1) % save_every == 0:
+            save_model(model, f"{output_prefix}_step_{step+1}.pth", frame_stack)
+    save_model(model, f"{output_prefix}_final_steps_{steps}.pth", frame_stack)
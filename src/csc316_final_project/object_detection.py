@@ -1,9 +1,11 @@
 import numpy as np
-from ultralytics import YOLO
 import cv2
+from functools import cache
 from importlib import resources
 from PIL import Image
 
+from csc316_final_project.profiling import profiler
+
 def detect_flash(crop, white_thresh=220, flash_pixel_ratio=0.05):
     hsv = cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)
     h, s, v = cv2.split(hsv)
@@ -15,6 +17,8 @@ def detect_flash(crop, white_thresh=220, flash_pixel_ratio=0.05):
     return white_ratio
 
 def find_false_knight(frame, model):
+    if hasattr(model, 'find'): # one of detector's single-box detectors
+        return model.find(frame)
     results = model.predict(frame, stream=True, verbose=False)
     for r in results:
         for box in r.boxes:
@@ -28,29 +32,135 @@ def detect_fk_hit(frame, model):
     if isinstance(frame, Image.Image):
         frame = np.array(frame)
     bbox = find_false_knight(frame, model)
+    return _crop_flashes(frame, bbox)
+
+def _crop_flashes(frame, bbox, flash_threshold=0.05):
     if not bbox:
         return False
-    x, y, w, h = bbox
-    crop = frame[y:y+h, x:x+w]
+    x, y, w, h = map(int, bbox)
+    crop = frame[max(y, 0):y+h, max(x, 0):x+w]
     if crop.size == 0 or crop.shape[0] == 0 or crop.shape[1] == 0:
         return False
     white_ratio = detect_flash(crop)
-    return white_ratio > 0.05  # threshold for hit detection
+    return white_ratio > flash_threshold  # threshold for hit detection
+
+@cache
+def _tracker_factory():
+    # CSRT lives in opencv-contrib (and has moved around between versions); the plain opencv-python
+    # we depend on only has MIL. None means no tracker at all, so YOLO runs on every frame
+    if hasattr(cv2, 'TrackerCSRT_create'):
+        return cv2.TrackerCSRT_create
+    if hasattr(cv2, 'TrackerCSRT'):
+        return cv2.TrackerCSRT.create
+    if hasattr(cv2, 'legacy') and hasattr(cv2.legacy, 'TrackerCSRT_create'):
+        return cv2.legacy.TrackerCSRT_create
+    return getattr(cv2, 'TrackerMIL_create', None)
+
+class FalseKnightTracker:
+    """
+    Finds False Knight with YOLO every `detect_every_n` frames, and with an OpenCV tracker (CSRT, or MIL without contrib) in between.
+    Re-detects early when the tracker loses him; see `episode_stats()` for call counts.
+    """
+
+    def __init__(self, model, detect_every_n=5, max_missed_frames=10, max_scale_change=0.5, flash_threshold=0.05):
+        self.model = model
+        self.detect_every_n = max(1, detect_every_n)
+        self.max_missed_frames = max_missed_frames
+        self.max_scale_change = max_scale_change
+        self.flash_threshold = flash_threshold
+        self.reset()
+        self.yolo_calls = 0
+        self.yolo_skipped = 0
+        self.tracker_losses = 0
+
+    def reset(self):
+        """Forget where he was (e.g. at the start of an episode)."""
+        self.tracker = None
+        self.tracking_box = None
+        self.detected_size = None
+        self.frames_since_attempt = 0 # frames since we last ran YOLO
+        self.missed_frames = 0 # frames since YOLO last found him
+
+    def _tracker_lost(self, frame, success, bbox):
+        if not success:
+            return True
+        x, y, w, h = bbox
+        frame_h, frame_w = frame.shape[:2]
+        if w <= 0 or h <= 0 or x + w <= 0 or y + h <= 0 or x >= frame_w or y >= frame_h:
+            return True
+        det_w, det_h = self.detected_size
+        return abs(w * h / (det_w * det_h) - 1) > self.max_scale_change
+
+    def _detect(self, frame):
+        self.yolo_calls += 1
+        self.frames_since_attempt = 0
+        with profiler.stage('yolo'):
+            bbox = find_false_knight(frame, self.model)
+        if bbox is not None:
+            factory = _tracker_factory()
+            if factory is not None:
+                self.tracker = factory()
+                self.tracker.init(frame, tuple(map(int, bbox)))
+            self.tracking_box = bbox
+            self.detected_size = (max(bbox[2], 1), max(bbox[3], 1))
+            self.missed_frames = 0
+            return True
+        return False
+
+    def locate(self, frame):
+        """Returns False Knight's (x, y, w, h) in this frame, or None."""
+        if isinstance(frame, Image.Image):
+            frame = np.array(frame)
+        self.frames_since_attempt += 1
+        ran_yolo = False
+        if self.tracker is None or self.frames_since_attempt >= self.detect_every_n:
+            ran_yolo = True
+            if self._detect(frame):
+                return self.tracking_box
+            if self.tracker is None:
+                return None
+
+        with profiler.stage('tracking'):
+            success, bbox = self.tracker.update(frame)
+        bbox = tuple(map(int, bbox))
+        self.missed_frames += 1
+        if self.missed_frames > self.max_missed_frames or self._tracker_lost(frame, success, bbox):
+            self.tracker_losses += 1
+            self.reset()
+            # give YOLO a chance to find him again right away, rather than reporting a stale box
+            if not ran_yolo and self._detect(frame):
+                return self.tracking_box
+            return None
+        if not ran_yolo:
+            self.yolo_skipped += 1
+        self.tracking_box = bbox
+        return bbox
+
+    def detect_hit(self, frame):
+        """Like detect_fk_hit, but looks for the flash in the tracked box."""
+        if isinstance(frame, Image.Image):
+            frame = np.array(frame)
+        return _crop_flashes(frame, self.locate(frame), self.flash_threshold)
+
+    def episode_stats(self):
+        """Returns this episode's YOLO call counts, and resets them (and the tracker) for the next one."""
+        stats = {'yolo_calls': self.yolo_calls, 'yolo_skipped': self.yolo_skipped, 'tracker_losses': self.tracker_losses}
+        self.yolo_calls = self.yolo_skipped = self.tracker_losses = 0
+        self.reset()
+        return stats
 
 def load_yolo_model():
     # simply so we don't have to complicate things!
+    from ultralytics import YOLO # slow to import, so only when there's a model to load
     with resources.path('csc316_final_project', 'best.pt') as path_to_model:
         model = YOLO(path_to_model)
         return model
 
 def test_model(path_to_model, gameplay_source): #path_to_model should be the best.pt file and the gameplay source can be an obs virtual camera
 
+    from ultralytics import YOLO
     model = YOLO(path_to_model)
-
-    tracker = None
-    tracking_box = None
-    missed_frames = 0
-    MAX_MISSED_FRAMES = 10
+    fk_tracker = FalseKnightTracker(model)
 
     cap = cv2.VideoCapture(gameplay_source)
 
@@ -59,50 +169,12 @@ def test_model(path_to_model, gameplay_source): #path_to_model should be the bes
         if not ret:
             break
 
-        use_tracking = False
-        results = model.predict(frame, stream=True, verbose=False)
-
-        detection_found = False
-        for r in results:
-            for box in r.boxes:
-                conf = box.conf[0].item()
-                if conf > 0.5:
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    bbox = (x1, y1, x2 - x1, y2 - y1)  
-                    detection_found = True
-
-                    tracker = cv2.TrackerCSRT_create()
-                    tracker.init(frame, bbox)
-                    tracking_box = bbox
-                    missed_frames = 0
-                    break
-
-        if not detection_found and tracker:
-            success, bbox = tracker.update(frame)
-            if success:
-                tracking_box = bbox
-                missed_frames += 1
-                use_tracking = True
-            else:
-                tracker = None
-                tracking_box = None
-
+        tracking_box = fk_tracker.locate(frame)
         if tracking_box:
             x, y, w, h = map(int, tracking_box)
-            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-
-            crop = frame[y:y+h, x:x+w]
-            if crop.size == 0 or crop.shape[0] == 0 or crop.shape[1] == 0:
-                print("Empty crop detected, skipping...")
-                continue
-            white_ratio = detect_flash(crop)
-            if white_ratio > 0.05:
+            if _crop_flashes(frame, tracking_box):
                 print("White flash detected!") #detects both armour hits and actual hits on the false knight with like 80% accuracy, should ignore the wave attacks
-
-        if missed_frames > MAX_MISSED_FRAMES:
-            tracker = None
-            tracking_box = None
-            missed_frames = 0
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
 
         cv2.imshow("Smooth Tracking", frame)
         if cv2.waitKey(1) & 0xFF == ord("q"):
@@ -1,36 +1,135 @@
+import logging
+import queue
+import threading
+from time import monotonic
+
 import obsws_python as obs
+from obsws_python.error import OBSSDKRequestError
+
+# obsws-python logs a traceback for every failed connection attempt; we say it once ourselves
+logging.getLogger('obsws_python').setLevel(logging.CRITICAL)
 
 class OBSBridge:
-    def __init__(self, host='localhost', port=4455, password='password', record_every_n=5):
-        self.client = obs.ReqClient(host=host, port=port, password=password)
+    """Records every `record_every_n`th episode with OBS; status comes from OBS's events and commands go through a background thread."""
+
+    def __init__(self, host='localhost', port=4455, password='password', record_every_n=5, timeout=3.0, retry_interval=10.0):
+        self.host = host
+        self.port = port
+        self.password = password
         self.record_every_n = record_every_n
-    
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.client = None
+        self.events = None
+        self.recording = None # None until we're connected and know
+        self.requested = False # sent StartRecord, maybe before OBS has said it's started
+        self.commands = queue.Queue()
+        self.lock = threading.Lock() # one request at a time on the client's socket
+        self.last_attempt = None
+        self._thread = threading.Thread(target=self._run, name="obs-bridge", daemon=True)
+        self._thread.start()
+
     def start_record(self, episode_num=None):
-        if episode_num is not None and (episode_num+1) % self.record_every_n == 0 and not self.is_recording:
-            self.client.start_record()
-    
+        if episode_num is not None and (episode_num+1) % self.record_every_n == 0:
+            self.commands.put('start')
+
     def stop_record(self):
-        if self.is_recording:
-            self.client.stop_record()
-    
+        self.commands.put('stop')
+
     @property
     def get_record_directory(self):
-        settings = self.client.get_record_directory()
-        return settings.record_directory
-    
+        # a round trip, unlike everything else here
+        with self.lock:
+            if self.client is None:
+                return None
+            return self.client.get_record_directory().record_directory
+
+    @property
+    def connected(self):
+        return self.recording is not None
+
     @property
     def status(self):
-        try:
-            status = self.client.get_record_status()
-            if status.output_active:
-                return 1 # recording
-            else:
-                return 2 # not recording
-        except Exception:
+        if self.recording is None:
             return 3 # not connected
-    
+        return 1 if self.recording else 2 # recording / not recording
+
     @property
     def is_recording(self):
-        status = self.client.get_record_status()
-        return status.output_active
+        return bool(self.recording)
+
+    def on_record_state_changed(self, data):
+        # called on the EventClient's thread (obsws-python finds it by name)
+        self.recording = data.output_active
+
+    def on_exit_started(self, data):
+        self.recording = None # the connection's about to go too; the worker tidies up
+
+    def _connect(self):
+        now = monotonic()
+        if self.last_attempt is not None and now - self.last_attempt < self.retry_interval:
+            return False
+        first = self.last_attempt is None
+        self.last_attempt = now
+        try:
+            self.client = obs.ReqClient(host=self.host, port=self.port, password=self.password, timeout=self.timeout)
+            self.events = obs.EventClient(host=self.host, port=self.port, password=self.password, timeout=self.timeout, subs=obs.Subs.GENERAL | obs.Subs.OUTPUTS)
+            self.events.callback.register([self.on_record_state_changed, self.on_exit_started])
+            self.recording = self.client.get_record_status().output_active # events only say what changes
+        except Exception as e:
+            self._disconnect(f"can't connect to OBS at {self.host}:{self.port} ({type(e).__name__}: {e})" if first else None)
+            return False
+        print(f"Connected to OBS at {self.host}:{self.port}")
+        return True
+
+    def _disconnect(self, reason=None):
+        self.recording = None
+        for client in (self.events, self.client):
+            if client is not None:
+                try:
+                    client.base_client.ws.close()
+                except Exception:
+                    pass
+        self.client = self.events = None
+        if reason:
+            print(f"OBS not connected: {reason}; will keep trying every {self.retry_interval:.0f}s")
+
+    def _send(self, command):
+        with self.lock:
+            self._request(command)
+
+    def _request(self, command):
+        if command == 'start' and not self.recording:
+            self.requested = True
+            self.client.start_record()
+        elif command == 'stop' and (self.recording or self.requested):
+            self.requested = False
+            self.client.stop_record()
+
+    def _run(self):
+        self._connect()
+        while True:
+            try:
+                command = self.commands.get(timeout=self.retry_interval)
+            except queue.Empty:
+                command = None
+            if command == 'close':
+                return
+            if self.events is not None and not self.events.worker.is_alive():
+                self._disconnect("lost the connection")
+            if self.client is None and not self._connect():
+                continue # dropped: recording is best effort
+            if command is not None:
+                try:
+                    self._send(command)
+                except OBSSDKRequestError as e:
+                    if e.code not in (500, 501): # OutputRunning / OutputNotRunning: already how we want it
+                        print(f"OBS didn't {command} recording: {e}")
+                except Exception as e:
+                    self._disconnect(f"lost the connection ({type(e).__name__}: {e})")
 
+    def close(self):
+        """Stop the background thread (after any commands still queued) and disconnect."""
+        self.commands.put('close')
+        self._thread.join(timeout=self.timeout + 1)
+        self._disconnect()
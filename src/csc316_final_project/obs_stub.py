@@ -0,0 +1,220 @@
+import argparse
+import base64
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+# a stand-in for OBS, for trying OBSBridge without it: just enough of obs-websocket v5 (the
+# handshake, record requests and RecordStateChanged events) for obsws-python to talk to, on
+# nothing but the standard library. `python -m csc316_final_project.obs_stub` runs one.
+
+_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11" # from the websocket RFC
+OUTPUTS = 1 << 6 # the event subscription RecordStateChanged belongs to
+
+def _auth(password, salt, challenge):
+    secret = base64.b64encode(hashlib.sha256((password + salt).encode()).digest())
+    return base64.b64encode(hashlib.sha256(secret + challenge.encode()).digest()).decode()
+
+class _Connection(socketserver.BaseRequestHandler):
+    # one websocket client: handshake, then a frame at a time until it goes away
+
+    def setup(self):
+        self.send_lock = threading.Lock()
+        self.subscriptions = 0
+        self.identified = False
+
+    def _read_exactly(self, n):
+        data = b""
+        while len(data) < n:
+            chunk = self.request.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("client went away")
+            data += chunk
+        return data
+
+    def _handshake(self):
+        data = b""
+        while b"\r\n\r\n" not in data:
+            chunk = self.request.recv(4096)
+            if not chunk:
+                raise ConnectionError("client went away")
+            data += chunk
+        headers = {}
+        for line in data.decode().split("\r\n")[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        accept = base64.b64encode(hashlib.sha1(headers["sec-websocket-key"].encode() + _GUID).digest()).decode()
+        self.request.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                              f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+
+    def _read_frame(self):
+        first, second = self._read_exactly(2)
+        opcode, length = first & 0x0F, second & 0x7F
+        if length == 126:
+            length, = struct.unpack(">H", self._read_exactly(2))
+        elif length == 127:
+            length, = struct.unpack(">Q", self._read_exactly(8))
+        mask = self._read_exactly(4) if second & 0x80 else None
+        payload = self._read_exactly(length)
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return opcode, payload
+
+    def send_frame(self, payload, opcode=0x1):
+        header = bytes([0x80 | opcode])
+        if len(payload) < 126:
+            header += bytes([len(payload)])
+        elif len(payload) < 1 << 16:
+            header += bytes([126]) + struct.pack(">H", len(payload))
+        else:
+            header += bytes([127]) + struct.pack(">Q", len(payload))
+        with self.send_lock:
+            self.request.sendall(header + payload)
+
+    def send_json(self, op, d):
+        self.send_frame(json.dumps({"op": op, "d": d}).encode())
+
+    def close(self, code=1000):
+        try:
+            self.send_frame(struct.pack(">H", code), opcode=0x8)
+        except OSError:
+            pass
+
+    def handle(self):
+        server = self.server.stub
+        try:
+            self._handshake()
+            hello = {"obsWebSocketVersion": "5.0.0-stub", "rpcVersion": 1}
+            if server.password:
+                hello["authentication"] = {"challenge": base64.b64encode(os.urandom(16)).decode(), "salt": base64.b64encode(os.urandom(16)).decode()}
+            self.send_json(0, hello)
+            server.connections.add(self)
+            while True:
+                opcode, payload = self._read_frame()
+                if opcode == 0x8: # close
+                    self.close()
+                    return
+                if opcode == 0x9: # ping
+                    self.send_frame(payload, opcode=0xA)
+                    continue
+                if opcode != 0x1:
+                    continue
+                message = json.loads(payload)
+                if message["op"] == 1: # Identify
+                    d = message["d"]
+                    if server.password and d.get("authentication") != _auth(server.password, hello["authentication"]["salt"], hello["authentication"]["challenge"]):
+                        self.close(4009) # AuthenticationFailed
+                        return
+                    self.subscriptions = d.get("eventSubscriptions", 0)
+                    self.identified = True
+                    self.send_json(2, {"negotiatedRpcVersion": 1})
+                elif message["op"] == 6 and self.identified: # Request
+                    self.send_json(7, server.request(message["d"]))
+        except (ConnectionError, OSError, ValueError, KeyError):
+            pass
+        finally:
+            server.connections.discard(self)
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class StubOBS:
+    """A fake OBS on host:port for the record requests and events OBSBridge uses. port=0 picks a free port."""
+
+    def __init__(self, host="localhost", port=0, password="password", delay=0.0, record_directory="/tmp"):
+        self.password = password
+        self.delay = delay
+        self.record_directory = record_directory
+        self.recording = False
+        self.requests = []
+        self.connections = set()
+        self.lock = threading.Lock()
+        self.server = _Server((host, port), _Connection)
+        self.server.stub = self
+        self.host, self.port = self.server.server_address[:2]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="obs-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        for connection in list(self.connections):
+            connection.close(1001) # going away
+            try:
+                connection.request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _event(self, event_type, data):
+        for connection in list(self.connections):
+            if connection.identified and connection.subscriptions & OUTPUTS:
+                try:
+                    connection.send_json(5, {"eventType": event_type, "eventIntent": OUTPUTS, "eventData": data})
+                except OSError:
+                    pass
+
+    def _record_state(self, active, state):
+        path = os.path.join(self.record_directory, "stub-recording.mkv")
+        self._event("RecordStateChanged", {"outputActive": active, "outputState": state, "outputPath": path if state.endswith(("STARTED", "STOPPED")) else None})
+
+    def request(self, d):
+        request_type = d["requestType"]
+        response = {"requestType": request_type, "requestId": d["requestId"], "requestStatus": {"result": True, "code": 100}}
+        with self.lock:
+            self.requests.append(request_type)
+            if self.delay:
+                time.sleep(self.delay)
+            if request_type == "GetRecordStatus":
+                response["responseData"] = {"outputActive": self.recording, "outputPaused": False, "outputTimecode": "00:00:00.000", "outputDuration": 0, "outputBytes": 0}
+            elif request_type == "GetRecordDirectory":
+                response["responseData"] = {"recordDirectory": self.record_directory}
+            elif request_type == "GetVersion":
+                response["responseData"] = {"obsVersion": "stub", "obsWebSocketVersion": "5.0.0-stub", "rpcVersion": 1, "availableRequests": ["GetRecordStatus", "StartRecord", "StopRecord", "GetRecordDirectory", "GetVersion"]}
+            elif request_type in ("StartRecord", "StopRecord"):
+                start = request_type == "StartRecord"
+                if self.recording == start:
+                    response["requestStatus"] = {"result": False, "code": 500, "comment": "Output is already running."} if start else {"result": False, "code": 501, "comment": "Output is not running."}
+                else:
+                    self.recording = start
+                    if start:
+                        self._record_state(False, "OBS_WEBSOCKET_OUTPUT_STARTING")
+                        self._record_state(True, "OBS_WEBSOCKET_OUTPUT_STARTED")
+                    else:
+                        self._record_state(True, "OBS_WEBSOCKET_OUTPUT_STOPPING")
+                        self._record_state(False, "OBS_WEBSOCKET_OUTPUT_STOPPED")
+                        response["responseData"] = {"outputPath": os.path.join(self.record_directory, "stub-recording.mkv")}
+            else:
+                response["requestStatus"] = {"result": False, "code": 204, "comment": "Your request type is not valid."}
+        return response
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="A fake OBS websocket server, for trying --obs without OBS.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=4455)
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds every request takes")
+    args = parser.parse_args()
+    stub = StubOBS(args.host, args.port, args.password, args.delay).start()
+    print(f"Fake OBS listening on ws://{stub.host}:{stub.port}, Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stub.stop()
@@ -0,0 +1,120 @@
+import math
+from time import monotonic, sleep
+
+from csc316_final_project.profiling import TARGET_HZ
+
+# what to do when steps take longer than their slots:
+#   skip       drop the slots we fell behind on, rather than rushing through short steps to catch up
+#   downshift  skip, and if it keeps happening lower the rate (back up once it stops)
+#   frameskip  skip, and if it keeps happening ask for more action repeat (see keyboard_emulation.ActionScheduler),
+#              so the model runs on fewer of the steps
+OVERRUN_POLICIES = ('skip', 'downshift', 'frameskip')
+
+class RateScheduler:
+    """Paces a loop to `hz` with deadlines on the monotonic clock; `policy` (see OVERRUN_POLICIES) handles overruns."""
+
+    def __init__(self, hz=TARGET_HZ, policy='skip', min_hz=None, max_frame_skip=4, overrun_limit=0.1, downshift=0.8, recover_after=5, window=None, clock=monotonic, sleep=sleep):
+        if policy not in OVERRUN_POLICIES:
+            raise ValueError(f"unknown overrun policy '{policy}'")
+        self.target_hz = hz
+        self.policy = policy
+        self.min_hz = min_hz or hz / 2
+        self.max_frame_skip = max_frame_skip
+        self.overrun_limit = overrun_limit
+        self.downshift = downshift
+        self.recover_after = recover_after
+        self.window = window or max(1, round(hz))
+        self.clock = clock
+        self.sleep = sleep
+        self.hz = hz
+        self.frame_skip = 0 # extra action repeat asked for by the frameskip policy
+        self.start()
+
+    @property
+    def period(self):
+        return 1 / self.hz
+
+    def start(self):
+        """Start (or restart) the grid from now, e.g. at the start of an episode, and reset the stats (not the rate or frame_skip)."""
+        now = self.clock()
+        self.started = self.last_tick = now
+        self.deadline = now + self.period
+        self.ticks = self.overruns = self.skipped = 0
+        self.period_sum = self.period_sq_sum = 0.0
+        self.max_period = 0.0
+        self._window_ticks = self._window_skipped = self._clean_windows = 0
+        self._window_busy = 0.0
+
+    def wait(self):
+        """Sleep until the next slot (or not at all, if we're already late). Returns whether this step overran."""
+        now = self.clock()
+        self._window_busy = max(self._window_busy, now - self.last_tick)
+        remaining = self.deadline - now
+        overran = remaining < 0
+        if overran:
+            self.overruns += 1
+            missed = math.floor(-remaining / self.period)
+            if missed:
+                self.skipped += missed
+                self._window_skipped += missed
+                self.deadline = now + self.period
+            else:
+                self.deadline += self.period
+        else:
+            self.sleep(remaining)
+            now = self.clock()
+            self.deadline += self.period
+
+        period = now - self.last_tick
+        self.last_tick = now
+        self.ticks += 1
+        self.period_sum += period
+        self.period_sq_sum += period * period
+        self.max_period = max(self.max_period, period)
+
+        self._window_ticks += 1
+        if self._window_ticks >= self.window:
+            self._adapt(now)
+            self._window_ticks = self._window_skipped = 0
+            self._window_busy = 0.0
+        return overran
+
+    def _adapt(self, now):
+        if self.policy == 'skip':
+            return
+        hz, frame_skip = self.hz, self.frame_skip
+        if self._window_skipped > self.overrun_limit * self._window_ticks:
+            self._clean_windows = 0
+            if self.policy == 'downshift':
+                self.hz = max(self.min_hz, self.hz * self.downshift)
+            else:
+                self.frame_skip = min(self.max_frame_skip, self.frame_skip + 1)
+        elif self._window_skipped == 0:
+            self._clean_windows += 1
+            if self._clean_windows >= self.recover_after:
+                faster = min(self.target_hz, self.hz / self.downshift) if self.policy == 'downshift' else self.hz
+                if self._window_busy < 1 / faster:
+                    self._clean_windows = 0
+                    if self.policy == 'downshift':
+                        self.hz = faster
+                    else:
+                        self.frame_skip = max(0, self.frame_skip - 1)
+        if (hz, frame_skip) != (self.hz, self.frame_skip):
+            self.deadline = now + self.period # new grid for the new pace
+
+    def stats(self):
+        """Achieved rate, jitter (standard deviation of the step period) and overruns since start()."""
+        elapsed = self.last_tick - self.started
+        mean = self.period_sum / self.ticks if self.ticks else 0.0
+        variance = max(0.0, self.period_sq_sum / self.ticks - mean * mean) if self.ticks else 0.0
+        return {
+            'target_hz': self.target_hz,
+            'hz': self.hz,
+            'achieved_hz': self.ticks / elapsed if elapsed > 0 else 0.0,
+            'jitter_ms': math.sqrt(variance) * 1000,
+            'max_period_ms': self.max_period * 1000,
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'frame_skip': self.frame_skip,
+        }
@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from csc316_final_project.cv import HealthDetector, get_player_health
+from csc316_final_project.object_detection import FalseKnightTracker
+from csc316_final_project.profiling import profiler
+
+def preprocess_frame(frame: np.ndarray) -> np.ndarray:
+    # shrink the window down to what HollowNN sees, channels first, as uint8
+    with profiler.stage('preprocess'):
+        screen = cv2.resize(frame, (84, 84), interpolation=cv2.INTER_AREA) # antialiased, like the PIL resize models were trained on
+        return np.ascontiguousarray(screen.transpose((2, 0, 1))) # stays uint8, see neural.to_tensor
+
+class FrameStack:
+    """
+    The last k preprocessed frames as one (k * C, H, W) observation, oldest first.
+    The view is only good until the next `push`/`reset`; copy it to keep it.
+    """
+
+    def __init__(self, k: int, frame_shape=(3, 84, 84), dtype=np.uint8):
+        assert k >= 1
+        self.k = k
+        self.frame_shape = tuple(frame_shape)
+        self.buffer = np.zeros((2 * k, *frame_shape), dtype=dtype)
+        self.index = 0 # slot of the oldest frame in the current stack
+
+    @property
+    def obs_shape(self):
+        c, h, w = self.frame_shape
+        return (self.k * c, h, w)
+
+    def reset(self, frame):
+        """Start a new episode: the stack is k copies of this frame."""
+        self.buffer[:] = frame
+        self.index = 0
+        return self.view()
+
+    def push(self, frame):
+        self.buffer[self.index] = frame
+        self.buffer[self.index + self.k] = frame
+        self.index = (self.index + 1) % self.k
+        return self.view()
+
+    def view(self):
+        return self.buffer[self.index:self.index + self.k].reshape(self.obs_shape)
+
+class Perception:
+    """Turns a frame into HollowNN's (screen, state) pair, running its stages on `workers` threads."""
+
+    def __init__(self, fk_tracker: FalseKnightTracker | None, health_detector: HealthDetector | None = None, workers=3):
+        self.fk_tracker = fk_tracker
+        self.health_detector = health_detector if health_detector is not None else get_player_health
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="perception") if workers > 1 else None
+
+    def _detect_hit(self, frame):
+        return self.fk_tracker.detect_hit(frame) if self.fk_tracker is not None else False
+
+    def _player_health(self, frame):
+        with profiler.stage('health'):
+            return self.health_detector(frame)
+
+    def episode_stats(self):
+        if self.fk_tracker is None:
+            return {'yolo_calls': 0, 'yolo_skipped': 0, 'tracker_losses': 0}
+        return self.fk_tracker.episode_stats()
+
+    def process(self, frame):
+        with profiler.stage('perception'):
+            if self.pool is None:
+                screen = preprocess_frame(frame)
+                player_health = self._player_health(frame)
+                enemy_damaged = self._detect_hit(frame)
+            else:
+                # boss detection first, it's usually the slowest
+                enemy_damaged = self.pool.submit(self._detect_hit, frame)
+                player_health = self.pool.submit(self._player_health, frame)
+                screen = self.pool.submit(preprocess_frame, frame)
+                screen, player_health, enemy_damaged = screen.result(), player_health.result(), enemy_damaged.result()
+
+        state = {
+            'player_health': player_health,
+            'enemy_damaged': enemy_damaged
+        }
+        return screen, state
+
+    __call__ = process
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,140 @@
+import json
+import math
+import threading
+from time import perf_counter
+
+TARGET_HZ = 35 # the game's input rate, what a step should keep up with
+
+class LatencyHistogram:
+    """
+    Counts durations in fixed, log-spaced bins (1 us to 10 s, ~5% apart), so memory stays the
+    same however long it runs and percentiles come out to within a bin's width.
+    """
+
+    def __init__(self, low=1e-6, high=10.0, bins_per_decade=48):
+        self.low = low
+        self.scale = bins_per_decade / math.log(10)
+        self.num_bins = math.ceil(math.log(high / low) * self.scale) + 1
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * self.num_bins
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+
+    def record(self, seconds):
+        i = int(math.log(seconds / self.low) * self.scale) if seconds > self.low else 0
+        with self.lock:
+            self.counts[min(i, self.num_bins - 1)] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentiles(self, *qs):
+        """Upper edges of the bins the q-th percentiles fall in, in seconds."""
+        with self.lock:
+            counts, count = list(self.counts), self.count
+        if count == 0:
+            return [0.0] * len(qs)
+        results = []
+        for q in qs:
+            target = q / 100 * count
+            seen = 0
+            for i, n in enumerate(counts):
+                seen += n
+                if n and seen >= target:
+                    break
+            results.append(min(self.low * math.exp((i + 1) / self.scale), self.max))
+        return results
+
+    def summary(self):
+        p50, p95, p99 = self.percentiles(50, 95, 99)
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'p50_ms': p50 * 1000,
+            'p95_ms': p95 * 1000,
+            'p99_ms': p99 * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+class _Stage:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.record(perf_counter() - self.start)
+
+class _NullStage:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+class Profiler:
+    """Per-stage latency histograms for the control loop: wrap a stage in `with profiler.stage(name):`."""
+
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+        return self
+
+    def _histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self._histogram(name))
+
+    def record(self, name, seconds):
+        # for spans that don't fit in a with block
+        if self.enabled:
+            self._histogram(name).record(seconds)
+
+    def step_summary(self):
+        # p50/p95/p99 of whole steps, for the monitor panel
+        histogram = self.histograms.get('step')
+        return tuple(p * 1000 for p in histogram.percentiles(50, 95, 99)) if histogram else (0.0, 0.0, 0.0)
+
+    def summary(self, steps, elapsed, reset=True):
+        """Every stage's latency summary, plus achieved steps/sec against TARGET_HZ."""
+        steps_per_sec = steps / elapsed if elapsed > 0 else 0.0
+        result = {
+            'steps': steps,
+            'steps_per_sec': steps_per_sec,
+            'target_hz': TARGET_HZ,
+            'target_ratio': steps_per_sec / TARGET_HZ,
+            'stages': {name: histogram.summary() for name, histogram in sorted(list(self.histograms.items()))},
+        }
+        if reset:
+            for histogram in self.histograms.values():
+                histogram.reset()
+        return result
+
+profiler = Profiler()
+
+def write_summary(path, summary, **extra):
+    """Append a summary as one line of JSON."""
+    with open(path, 'a') as f:
+        f.write(json.dumps({**extra, **summary}) + '\n')
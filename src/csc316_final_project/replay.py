@@ -0,0 +1,140 @@
+import numpy as np
+
+def pack_actions(actions) -> int:
+    """Multi-hot action array -> bit mask (bit i = action i)."""
+    mask = 0
+    for i, pressed in enumerate(actions):
+        if pressed:
+            mask |= 1 << i
+    return mask
+
+def unpack_actions(masks: np.ndarray, num_actions: int) -> np.ndarray:
+    """Bit masks, shape (batch,) -> multi-hot bool array, shape (batch, num_actions)."""
+    return ((masks[:, None] >> np.arange(num_actions)) & 1).astype(bool)
+
+REPLAY_ARRAYS = ('obs', 'actions', 'rewards', 'dones', 'valid', 'first')
+
+class ReplayBuffer:
+    """
+    Fixed-capacity experience replay of uint8 frames; transition i goes from obs[i] to obs[i + 1].
+    Usage: `start_episode(first_obs)`, then `add(...)` every step.
+    """
+
+    def __init__(self, capacity: int, obs_shape=(3, 84, 84), num_actions=7, frame_stack=1):
+        assert num_actions <= 8, "actions are packed into one byte"
+        assert capacity >= 2
+        self.capacity = capacity
+        self.num_actions = num_actions
+        self.frame_stack = frame_stack
+        self.obs = np.zeros((capacity, *obs_shape), dtype=np.uint8)
+        self.actions = np.zeros(capacity, dtype=np.uint8)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=np.bool_)
+        self.valid = np.zeros(capacity, dtype=np.bool_) # slot holds a complete transition
+        self.first = np.zeros(capacity, dtype=np.bool_) # slot holds the first frame of an episode
+        self.dirty = np.zeros(capacity, dtype=np.bool_) # slot changed since the last state_dict(changed_only=True)
+        self.pos = 0 # slot holding the current (not yet acted on) observation
+        self.size = 0 # number of valid transitions
+        self.filled = 0 # slots written so far (stops growing once we wrap around)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.obs, self.actions, self.rewards, self.dones, self.valid, self.first))
+
+    def __len__(self):
+        return self.size
+
+    def _write_obs(self, obs):
+        if self.valid[self.pos]:
+            # overwriting the oldest transition
+            self.valid[self.pos] = False
+            self.size -= 1
+        self.obs[self.pos] = obs
+        self.first[self.pos] = False
+        self.dirty[self.pos] = True
+        self.filled = max(self.filled, self.pos + 1)
+
+    def start_episode(self, obs):
+        if self.valid[(self.pos - 1) % self.capacity]:
+            # leave the previous episode's final observation where it is (it's the last transition's next obs),
+            # whether that episode ended with done or got cut short
+            self.pos = (self.pos + 1) % self.capacity
+        self._write_obs(obs)
+        self.first[self.pos] = True
+
+    def add(self, actions, reward: float, done: bool, next_obs):
+        i = self.pos
+        self.actions[i] = pack_actions(actions)
+        self.rewards[i] = reward
+        self.dones[i] = done
+        self.valid[i] = True
+        self.dirty[i] = True
+        self.size += 1
+        self.pos = (i + 1) % self.capacity
+        self._write_obs(next_obs)
+
+    def state_dict(self, changed_only=False):
+        """A copy of the written slots, for checkpoints; with changed_only, just the slots changed since the last such call."""
+        filled = self.filled
+        if changed_only:
+            indices = np.flatnonzero(self.dirty)
+            self.dirty[:] = False
+            arrays = {name: getattr(self, name)[indices] for name in REPLAY_ARRAYS}
+        else:
+            indices = None
+            arrays = {name: getattr(self, name)[:filled].copy() for name in REPLAY_ARRAYS}
+        return {
+            'capacity': self.capacity,
+            'obs_shape': self.obs.shape[1:],
+            'arrays': arrays,
+            'indices': indices,
+            'pos': self.pos,
+            'size': self.size,
+            'filled': filled,
+        }
+
+    def load_state_dict(self, state):
+        if state['capacity'] != self.capacity or tuple(state['obs_shape']) != self.obs.shape[1:]:
+            raise ValueError(f"saved buffer holds {state['capacity']} x {tuple(state['obs_shape'])}, this one {self.capacity} x {self.obs.shape[1:]}")
+        filled = state['filled']
+        for name, array in state['arrays'].items():
+            getattr(self, name)[:filled] = array
+        self.dirty[:] = False # whatever it came from already has all of it
+        self.pos, self.size, self.filled = state['pos'], state['size'], filled
+
+    def sample(self, batch_size: int, rng: np.random.Generator | None = None):
+        """
+        Returns a random minibatch as a dict of arrays: obs/next_obs (uint8), actions (bool multi-hot),
+        rewards, dones.
+        """
+        assert self.size > 0, "nothing to sample yet"
+        rng = rng if rng is not None else np.random.default_rng()
+        indices = rng.integers(0, self.filled, size=batch_size)
+        # redraw the few slots that don't hold a transition (still empty, pending, or episode-end padding)
+        invalid = ~self.valid[indices]
+        while invalid.any():
+            indices[invalid] = rng.integers(0, self.filled, size=int(invalid.sum()))
+            invalid = ~self.valid[indices]
+        next_indices = (indices + 1) % self.capacity
+        return {
+            'obs': self._gather(indices),
+            'actions': unpack_actions(self.actions[indices], self.num_actions),
+            'rewards': self.rewards[indices],
+            'dones': self.dones[indices],
+            'next_obs': self._gather(next_indices),
+        }
+
+    def _gather(self, indices):
+        if self.frame_stack == 1:
+            return self.obs[indices]
+        # walk back from each index, staying put at an episode's first frame (or at the oldest
+        # frame still in the buffer, rather than wrapping around onto the newest ones)
+        stack = [indices]
+        current = indices
+        for _ in range(self.frame_stack - 1):
+            previous = (current - 1) % self.capacity
+            stop = self.first[current] | (previous == self.pos) | (previous >= self.filled)
+            current = np.where(stop, current, previous)
+            stack.append(current)
+        frames = self.obs[np.stack(stack[::-1], axis=1)] # [batch, k, C, H, W], oldest first
+        return frames.reshape(len(indices), -1, *self.obs.shape[2:])
@@ -0,0 +1,132 @@
+import os
+import random
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset
+
+from csc316_final_project.detector import letterbox
+from csc316_final_project.model_training import remove_white
+
+# the composite images from model_training, made in memory as the detector trains instead of
+# written to disk first: sprites pasted onto backgrounds, already letterboxed to the training
+# size, with their YOLO labels. see train_detector for plugging it into Ultralytics.
+
+def _load(folder, mode):
+    return [np.array(Image.open(os.path.join(folder, f)).convert(mode)) for f in sorted(os.listdir(folder)) if f.lower().endswith('png')]
+
+class SyntheticDetectionDataset(Dataset):
+    """
+    `length` Ultralytics-style samples of a random sprite on a random background, made in memory.
+    With a seed, sample i is always the same image.
+    """
+
+    def __init__(self, sprite_folder, background_folder, imgsz=640, length=10000, seed=None, scale=(0.5, 0.5), flip=0.5, white_threshold=220, class_id=0):
+        self.sprites = [remove_white(sprite, white_threshold) for sprite in _load(sprite_folder, "RGBA")]
+        self.backgrounds = _load(background_folder, "RGB")
+        assert self.sprites, "No sprite images found!"
+        assert self.backgrounds, "No background images found!"
+        self.imgsz = imgsz
+        self.length = length
+        self.seed = seed
+        self.scale = scale
+        self.flip = flip
+        self.class_id = class_id
+        self.rng = None
+        self._letterboxed = {}
+        self._resized = {}
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def labels(self):
+        # what Ultralytics looks at before training (objects per image, classes): one boss each
+        return [{"cls": np.full((1, 1), self.class_id, dtype=np.float32)}] * self.length
+
+    def _background(self, i):
+        if i not in self._letterboxed:
+            self._letterboxed[i] = letterbox(self.backgrounds[i], self.imgsz)
+        return self._letterboxed[i]
+
+    def _sprite(self, i, size, flipped):
+        key = (i, size, flipped)
+        if key not in self._resized:
+            if len(self._resized) >= 512: # only grows with random scales
+                self._resized.clear()
+            sprite = cv2.resize(self.sprites[i], size, interpolation=cv2.INTER_AREA)
+            self._resized[key] = np.ascontiguousarray(sprite[:, ::-1]) if flipped else sprite
+        return self._resized[key]
+
+    def _rng(self, index):
+        if self.seed is not None:
+            return random.Random(self.seed * 1_000_003 + index)
+        if self.rng is None:
+            # first draw in this process: every loader worker gets its own torch seed, so its own stream
+            self.rng = random.Random(torch.initial_seed())
+        return self.rng
+
+    def __getitem__(self, index):
+        rng = self._rng(index)
+        bg_index = rng.randrange(len(self.backgrounds))
+        sprite_index = rng.randrange(len(self.sprites))
+        square, scale, (pad_x, pad_y) = self._background(bg_index)
+        bg_h, bg_w = self.backgrounds[bg_index].shape[:2]
+        content_w, content_h = round(bg_w * scale), round(bg_h * scale)
+
+        s = round(rng.uniform(*self.scale) * 20) / 20 # in 5% steps, so the resized sprites get reused
+        w, h = max(1, round(content_w * s)), max(1, round(content_h * s))
+        sprite = self._sprite(sprite_index, (w, h), rng.random() < self.flip)
+        x = pad_x + rng.randint(0, content_w - w)
+        y = pad_y + rng.randint(0, content_h - h)
+
+        img = square.copy()
+        region = img[y:y + h, x:x + w]
+        alpha = sprite[..., 3:].astype(np.uint16)
+        region[:] = ((sprite[..., :3] * alpha + region * (255 - alpha) + 127) // 255).astype(np.uint8)
+
+        return {
+            "img": torch.from_numpy(np.ascontiguousarray(img.transpose(2, 0, 1))),
+            "cls": torch.full((1, 1), float(self.class_id)),
+            "bboxes": torch.tensor([[(x + w / 2) / self.imgsz, (y + h / 2) / self.imgsz, w / self.imgsz, h / self.imgsz]]),
+            "batch_idx": torch.zeros(1),
+            "im_file": f"synthetic_{index}",
+            "ori_shape": (self.imgsz, self.imgsz),
+            "resized_shape": (self.imgsz, self.imgsz),
+        }
+
+    @staticmethod
+    def collate_fn(batch):
+        # same layout as Ultralytics' YOLODataset batches
+        return {
+            "img": torch.stack([sample["img"] for sample in batch]),
+            "cls": torch.cat([sample["cls"] for sample in batch]),
+            "bboxes": torch.cat([sample["bboxes"] for sample in batch]),
+            "batch_idx": torch.cat([sample["batch_idx"] + i for i, sample in enumerate(batch)]),
+            "im_file": [sample["im_file"] for sample in batch],
+            "ori_shape": [sample["ori_shape"] for sample in batch],
+            "resized_shape": [sample["resized_shape"] for sample in batch],
+        }
+
+    def yolo_label(self, sample):
+        """A sample's label as a line of a YOLO .txt file."""
+        cx, cy, w, h = sample["bboxes"][0].tolist()
+        return f"{self.class_id} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}\n"
+
+def train_detector(data, dataset: SyntheticDetectionDataset, model="yolov8n.pt", **train_args):
+    """Trains a YOLO model on `dataset` instead of the train split of `data` (whose val split is still used)."""
+    from ultralytics import YOLO
+    from ultralytics.models.yolo.detect import DetectionTrainer
+
+    class SyntheticTrainer(DetectionTrainer):
+        def build_dataset(self, img_path, mode="train", batch=None):
+            if mode == "train":
+                return dataset
+            return super().build_dataset(img_path, mode, batch)
+
+        def plot_training_labels(self):
+            pass # there's no fixed set of labels to plot
+
+    return YOLO(model).train(data=data, trainer=SyntheticTrainer, imgsz=dataset.imgsz, **train_args)
@@ -1,6 +1,11 @@
 from platform import system
+from functools import cache
 import subprocess
+import threading
+import socket
+import shutil
 import json
+import os
 
 def acquire_idle_lock():
     """
@@ -20,25 +25,42 @@ def acquire_idle_lock():
             print("Sleep lock not supported on this OS.")
             return None
 
+@cache
+def _hyprctl_path():
+    return shutil.which("hyprctl")
+
+def _hyprctl_json(*args):
+    hyprctl = _hyprctl_path()
+    if hyprctl is None:
+        raise RuntimeError("hyprctl not found in PATH; if you are not using Hyprland, this function is not implemented for your window manager. sorry!")
+    result = subprocess.run([hyprctl, *args, "-j"], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"hyprctl failed: {result.stderr.strip()}")
+    try:
+        return json.loads(result.stdout)
+    except json.JSONDecodeError as e:
+        raise RuntimeError(f"Failed to parse hyprctl output: {e}")
+
+def _hyprland_bbox(data):
+    return (data["at"][0], data["at"][1], data["size"][0], data["size"][1])
+
+def _osascript(script):
+    result = subprocess.run(["osascript", "-e", script], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"osascript failed: {result.stderr.strip()}")
+    return result.stdout.strip()
+
+def _osascript_bbox(output):
+    try:
+        x, y, w, h = map(int, output.split(", "))
+        return (x, y, w, h)
+    except ValueError as e:
+        raise RuntimeError(f"Failed to parse osascript output: {e}")
+
 def get_coords_of_active_window():
     match system():
         case "Linux":
-            # hyprctl
-            if subprocess.run(["which", "hyprctl"], capture_output=True).returncode == 0:
-                result = subprocess.run(["hyprctl", "activewindow", "-j"], capture_output=True, text=True)
-                if result.returncode != 0:
-                    raise RuntimeError(f"hyprctl failed: {result.stderr.strip()}")
-                try:
-                    data = json.loads(result.stdout)
-                    x = data["at"][0]
-                    y = data["at"][1]
-                    width = data["size"][0]
-                    height = data["size"][1]
-                    return (x, y, width, height)
-                except json.JSONDecodeError as e:
-                    raise RuntimeError(f"Failed to parse hyprctl output: {e}")
-            else:
-                raise RuntimeError("hyprctl not found in PATH; if you are not using Hyprland, this function is not implemented for your window manager. sorry!")
+            return _hyprland_bbox(_hyprctl_json("activewindow"))
         case "Darwin":
             # AppleScript
             script = '''
@@ -52,17 +74,199 @@ def get_coords_of_active_window():
                 end tell
             end tell
             '''
-            result = subprocess.run(["osascript", "-e", script], capture_output=True, text=True)
-            if result.returncode != 0:
-                raise RuntimeError(f"osascript failed: {result.stderr.strip()}")
-            try:
-                x, y, w, h = map(int, result.stdout.strip().split(", "))
-                return (x, y, w, h)
-            except ValueError as e:
-                raise RuntimeError(f"Failed to parse osascript output: {e}")
+            return _osascript_bbox(_osascript(script))
+        case _:
+            raise NotImplementedError("Active window coordinates not supported on this OS.")
+
+class WindowProvider:
+    """Finds one specific window (the game): `resolve()` pins it down, `query()` returns its (x, y, width, height)."""
+
+    def resolve(self) -> None:
+        pass
+
+    def query(self) -> tuple[int, int, int, int]:
+        raise NotImplementedError
+
+    def watch(self, on_change, stop: threading.Event) -> bool:
+        """Call `on_change()` whenever the window may have moved, until `stop` is set. Returns False if unsupported."""
+        return False
+
+class HyprlandProvider(WindowProvider):
+    # events after which the game window might be somewhere else
+    INVALIDATING_EVENTS = {
+        "movewindow", "movewindowv2", "resizewindow", "fullscreen", "changefloatingmode",
+        "monitoradded", "monitoraddedv2", "monitorremoved", "workspace", "workspacev2", "closewindow", "configreloaded",
+    }
+
+    def __init__(self):
+        self.address = None
+
+    def resolve(self):
+        self.address = _hyprctl_json("activewindow")["address"]
+
+    def query(self):
+        if self.address is None:
+            self.resolve()
+        for client in _hyprctl_json("clients"):
+            if client["address"] == self.address:
+                return _hyprland_bbox(client)
+        raise RuntimeError(f"window {self.address} is gone")
+
+    @staticmethod
+    def event_socket_path():
+        signature = os.environ.get("HYPRLAND_INSTANCE_SIGNATURE")
+        if not signature:
+            return None
+        return os.path.join(os.environ.get("XDG_RUNTIME_DIR", "/tmp"), "hypr", signature, ".socket2.sock")
+
+    def watch(self, on_change, stop):
+        path = self.event_socket_path()
+        if path is None or not os.path.exists(path):
+            return False
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+            sock.settimeout(0.5) # so we notice `stop`
+            pending = b""
+            while not stop.is_set():
+                try:
+                    chunk = sock.recv(4096)
+                except socket.timeout:
+                    continue
+                if not chunk:
+                    break # hyprland went away
+                pending += chunk
+                *lines, pending = pending.split(b"\n")
+                # events look like `movewindowv2>>address,workspaceid,workspacename`
+                if any(line.split(b">>", 1)[0].decode(errors="replace") in self.INVALIDATING_EVENTS for line in lines):
+                    on_change()
+        return True
+
+class MacOSProvider(WindowProvider):
+    def __init__(self):
+        self.app_name = None
+
+    def resolve(self):
+        self.app_name = _osascript('tell application "System Events" to get name of first application process whose frontmost is true')
+
+    def query(self):
+        if self.app_name is None:
+            self.resolve()
+        script = f'''
+        tell application "System Events"
+            tell application process "{self.app_name}"
+                set win to front window
+                set {{x, y}} to position of win
+                set {{w, h}} to size of win
+                return {{x, y, w, h}}
+            end tell
+        end tell
+        '''
+        return _osascript_bbox(_osascript(script))
+
+class StaticWindowProvider(WindowProvider):
+    """A fake window, for tests and headless runs. Counts how often it gets asked."""
+
+    def __init__(self, bbox=(0, 0, 1920, 1080)):
+        self.bbox = tuple(bbox)
+        self.queries = 0
+
+    def move(self, bbox):
+        self.bbox = tuple(bbox)
+
+    def query(self):
+        self.queries += 1
+        return self.bbox
+
+def default_window_provider() -> WindowProvider:
+    match system():
+        case "Linux":
+            return HyprlandProvider()
+        case "Darwin":
+            return MacOSProvider()
         case _:
             raise NotImplementedError("Active window coordinates not supported on this OS.")
 
+class WindowTracker:
+    """Caches the game window's bbox, refreshed on window manager events and every `poll_interval` seconds."""
+
+    def __init__(self, provider: WindowProvider | None = None, poll_interval=None, watch_events=True):
+        self.provider = provider if provider is not None else default_window_provider()
+        self.poll_interval = poll_interval
+        self.watch_events = watch_events
+        self.refreshes = 0
+        self._bbox = None
+        self._generation = 0 # bumped by invalidate(), so a refresh racing with it doesn't win
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Resolve the window (so call this once the game is focused) and start the invalidation threads."""
+        self.provider.resolve()
+        self.refresh()
+        self._stop.clear()
+        if self.watch_events:
+            self._spawn(self._watch, "window-events")
+        if self.poll_interval:
+            self._spawn(self._poll, "window-poll")
+        return self
+
+    def _spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _watch(self):
+        try:
+            self.provider.watch(self._refresh_quietly, self._stop)
+        except OSError:
+            pass # no event stream; polling/explicit refresh still work
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_interval):
+            self._refresh_quietly()
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+        except Exception:
+            self.invalidate() # let the control loop see the error on its next get()
+
+    def invalidate(self):
+        with self._lock:
+            self._bbox = None
+            self._generation += 1
+
+    def refresh(self):
+        with self._lock:
+            generation = self._generation
+        bbox = tuple(self.provider.query())
+        with self._lock:
+            if generation == self._generation:
+                self._bbox = bbox
+            self.refreshes += 1
+        return bbox
+
+    def get(self):
+        bbox = self._bbox
+        if bbox is None:
+            bbox = self.refresh()
+        return bbox
+
+    __call__ = get
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self._threads.clear()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
 class IdleLock:
     def __init__(self):
         self.process = None
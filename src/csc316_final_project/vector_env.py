@@ -0,0 +1,170 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import numpy as np
+import torch
+
+from csc316_final_project.neural import ACTION_KEYS, to_tensor
+from csc316_final_project.perception import FrameStack
+
+# several HollowKnightEnvs driven as one: their observations go through HollowNN as a single
+# batch, and each row of the output goes back to its own env's controller. without several copies
+# of the game this is mostly for replay/simulated envs (see scaling_report).
+
+VECTOR_MODES = ('sync', 'thread')
+
+class VectorEnv:
+    """
+    N envs stepped together, in lockstep ('sync') or each on its own thread ('thread'), with batched observations.
+    Finished envs reset straight away; the observation they ended on is in `final_obs`.
+    """
+
+    def __init__(self, envs, mode='sync', frame_stack=1):
+        if mode not in VECTOR_MODES:
+            raise ValueError(f"unknown vector env mode '{mode}'")
+        assert envs, "need at least one env"
+        self.envs = list(envs)
+        self.mode = mode
+        self.frame_stack = frame_stack
+        self.pool = ThreadPoolExecutor(max_workers=len(self.envs), thread_name_prefix="vector-env") if mode == 'thread' else None
+        self.stacks = [FrameStack(frame_stack) for _ in self.envs]
+        self.obs = np.zeros((len(self.envs), *self.stacks[0].obs_shape), dtype=np.uint8)
+        self.final_obs = [None] * len(self.envs)
+        self.returns = np.zeros(len(self.envs), dtype=np.float32)
+        self.lengths = np.zeros(len(self.envs), dtype=np.int64)
+        self.episodes = []
+        self.steps = 0
+        self._pending = None
+
+    @property
+    def num_envs(self):
+        return len(self.envs)
+
+    def _map(self, fn, *args):
+        if self.pool is None:
+            return list(map(fn, *args))
+        return list(self.pool.map(fn, *args))
+
+    def _reset_one(self, i):
+        frame, state = self.envs[i].reset()
+        self.obs[i] = self.stacks[i].reset(frame)
+        return state
+
+    def reset(self):
+        """Start an episode in every env. Returns (obs [N, k*C, H, W], states)."""
+        states = self._map(self._reset_one, range(self.num_envs))
+        self.returns[:] = 0
+        self.lengths[:] = 0
+        return self.obs.copy(), states
+
+    def _step_one(self, i, controls):
+        env = self.envs[i]
+        frame, reward, done, state = env.step(controls)
+        self.obs[i] = self.stacks[i].push(frame)
+        self.returns[i] += reward
+        self.lengths[i] += 1
+        self.final_obs[i] = None
+        if done:
+            self.final_obs[i] = self.obs[i].copy()
+            self.episodes.append((i, float(self.returns[i]), int(self.lengths[i])))
+            self.returns[i] = 0
+            self.lengths[i] = 0
+            env.end_episode()
+            self._reset_one(i)
+        return reward, done, state
+
+    def step_async(self, controls):
+        """Start stepping every env with its controls (a list of N {action: bool} dicts)."""
+        assert len(controls) == self.num_envs
+        assert self._pending is None, "step_wait() first"
+        if self.pool is None:
+            self._pending = [self._step_one(i, c) for i, c in enumerate(controls)]
+        else:
+            self._pending = [self.pool.submit(self._step_one, i, c) for i, c in enumerate(controls)]
+
+    def step_wait(self):
+        """Returns (obs [N, k*C, H, W], rewards [N], dones [N], states) for the step started with step_async."""
+        results = [r if self.pool is None else r.result() for r in self._pending]
+        self._pending = None
+        self.steps += self.num_envs
+        rewards = np.array([r for r, _, _ in results], dtype=np.float32)
+        dones = np.array([d for _, d, _ in results], dtype=np.bool_)
+        return self.obs.copy(), rewards, dones, [s for _, _, s in results]
+
+    def step(self, controls):
+        self.step_async(controls)
+        return self.step_wait()
+
+    def close(self):
+        for env in self.envs:
+            env.controller.stop()
+            env.perception.close()
+        if self.pool is not None:
+            self.pool.shutdown()
+
+def act(model, obs, device, action_threshold=0.5, epsilon=0.05, rng=None):
+    """One forward pass for a batch of uint8 observations: [N, num_actions] multi-hot actions, like train_model picks them."""
+    rng = rng if rng is not None else np.random.default_rng()
+    with torch.inference_mode():
+        probs = torch.sigmoid(model(to_tensor(obs, device))).cpu().numpy()
+    actions = probs > action_threshold
+    explore = rng.random(actions.shape) < epsilon
+    return np.where(explore, rng.random(actions.shape) < 0.5, actions)
+
+def to_controls(actions, action_keys=ACTION_KEYS):
+    """[N, num_actions] multi-hot actions -> one controls dict per env."""
+    return [dict(zip(action_keys, row)) for row in actions.tolist()]
+
+def _synthetic_frames():
+    # the same noisy frame every step, like bench's; enough for perception and the model to chew on
+    from csc316_final_project.bench import synthetic_frame
+    frame = synthetic_frame(1280, 720)
+    return lambda: frame
+
+def make_envs(n, source=None, fk_tracker=None, max_episode_steps=None):
+    """n headless envs: replaying `source` (a video or frame directory), or synthetic frames without one."""
+    from csc316_final_project.env import HollowKnightEnv, replay_env
+    from csc316_final_project.keyboard_emulation import NullController
+    from csc316_final_project.perception import Perception
+    envs = []
+    for _ in range(n):
+        # one perception thread per env: the envs themselves are what runs side by side
+        perception = Perception(fk_tracker, workers=1)
+        if source is not None:
+            envs.append(replay_env(source, perception, max_episode_steps=max_episode_steps))
+        else:
+            envs.append(HollowKnightEnv(perception, NullController(), _synthetic_frames(), step_hz=0, reset_delay=0, end_delay=0, grace_period=0, max_episode_steps=max_episode_steps))
+    return envs
+
+def scaling_report(counts=(1, 2, 4, 8, 16), source=None, mode='sync', steps=100, model=None, device='cpu', max_episode_steps=None):
+    """Aggregate env steps/sec for each number of envs in `counts`, acting with batched inference."""
+    from csc316_final_project.neural import HollowNN
+    if model is None:
+        torch.manual_seed(0)
+        model = HollowNN((3, 84, 84))
+    model = model.to(device).eval()
+    rng = np.random.default_rng(0)
+    report = []
+    for n in counts:
+        vec = VectorEnv(make_envs(n, source, max_episode_steps=max_episode_steps), mode=mode)
+        try:
+            obs, _ = vec.reset()
+            for _ in range(3):
+                obs, *_ = vec.step(to_controls(act(model, obs, device, rng=rng)))
+            forward = env_time = 0.0
+            start = perf_counter()
+            for _ in range(steps):
+                t0 = perf_counter()
+                controls = to_controls(act(model, obs, device, rng=rng))
+                t1 = perf_counter()
+                obs, *_ = vec.step(controls)
+                env_time += perf_counter() - t1
+                forward += t1 - t0
+            elapsed = perf_counter() - start
+        finally:
+            vec.close()
+        result = {'envs': n, 'steps_per_sec': steps * n / elapsed, 'forward_ms': forward / steps * 1000, 'env_ms': env_time / steps * 1000}
+        result['speedup'] = result['steps_per_sec'] / report[0]['steps_per_sec'] if report else 1.0
+        report.append(result)
+        print(f"{n:>3} envs: {result['steps_per_sec']:8.1f} steps/s ({result['speedup']:4.2f}x), forward {result['forward_ms']:6.2f} ms/batch ({result['forward_ms'] / n:5.2f} per env), envs {result['env_ms']:7.2f} ms/step")
+    return report
@@ -0,0 +1,99 @@
+import importlib.util
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from csc316_final_project.capture import CaptureBackend, FrameGrabber, FrameRing, ReplayBackend, X11Backend, make_backend
+
+def frame(value, shape=(4, 6, 3)):
+    return np.full(shape, value, dtype=np.uint8)
+
+class CountingBackend(CaptureBackend):
+    # frame i is filled with i; fails once it runs out if `limit` is set
+
+    def __init__(self, limit=None, shape=(4, 6, 3)):
+        self.count = 0
+        self.limit = limit
+        self.shape = shape
+        self.bboxes = []
+        self.closed = False
+
+    def grab(self, bbox=None):
+        if self.limit is not None and self.count >= self.limit:
+            raise OSError("screen went away")
+        self.bboxes.append(bbox)
+        self.count += 1
+        return frame(self.count % 256, self.shape)
+
+    def close(self):
+        self.closed = True
+
+def test_ring_hands_out_copies_of_the_newest():
+    ring = FrameRing(slots=2)
+    for i in range(1, 6):
+        ring.write(frame(i))
+    frame_id, latest = ring.latest()
+    assert frame_id == 5 and (latest == 5).all()
+    ring.write(frame(6)) # the copy we got doesn't change under us
+    assert (latest == 5).all()
+    out = np.empty((4, 6, 3), dtype=np.uint8)
+    frame_id, again = ring.latest(after=5, out=out)
+    assert frame_id == 6 and again is out and (out == 6).all()
+
+def test_ring_times_out_without_a_newer_frame():
+    ring = FrameRing()
+    assert ring.latest(timeout=0.01) == (0, None)
+    ring.write(frame(1))
+    assert ring.latest(after=1, timeout=0.01) == (1, None)
+
+def test_ring_resize_never_hands_out_an_empty_slot():
+    ring = FrameRing()
+    ring.write(frame(1))
+    with ring.cond:
+        ring._allocate((8, 8, 3)) # as write() does, before the first frame of the new size is in
+    assert ring.latest(timeout=0.01)[1] is None
+    ring.write(frame(2, (8, 8, 3)))
+    frame_id, latest = ring.latest(after=1)
+    assert frame_id == 2 and latest.shape == (8, 8, 3) and (latest == 2).all()
+
+def test_ring_wakes_waiting_readers():
+    ring = FrameRing()
+    results = []
+    reader = threading.Thread(target=lambda: results.append(ring.latest(timeout=5)))
+    reader.start()
+    ring.write(frame(7))
+    reader.join(5)
+    assert results[0][0] == 1 and (results[0][1] == 7).all()
+
+def test_grabber_never_repeats_a_frame():
+    backend = CountingBackend()
+    with FrameGrabber(backend, bbox_fn=lambda: (1, 2, 6, 4), max_fps=200) as grabber: # slow enough not to wrap past 255
+        seen = [int(grabber.latest()[0, 0, 0]) for _ in range(5)]
+    assert seen == sorted(set(seen))
+    assert backend.bboxes[0] == (1, 2, 6, 4)
+    assert backend.closed
+
+def test_grabber_reports_the_capture_error():
+    with FrameGrabber(CountingBackend(limit=1), bbox_fn=None) as grabber:
+        grabber.latest()
+        with pytest.raises(RuntimeError, match="died") as error:
+            grabber.latest(timeout=5)
+    assert isinstance(error.value.__cause__, OSError)
+
+def test_replay_backend_loops_over_a_directory(tmp_path):
+    for i in range(3):
+        cv2.imwrite(str(tmp_path / f'{i:03}.png'), frame(i * 10)[..., ::-1])
+    backend = make_backend('replay', source=tmp_path)
+    assert [int(backend.grab()[0, 0, 0]) for _ in range(4)] == [0, 10, 20, 0]
+    once = ReplayBackend(tmp_path, loop=False)
+    for _ in range(3):
+        once.grab()
+    with pytest.raises(EOFError):
+        once.grab()
+
+@pytest.mark.skipif(importlib.util.find_spec('mss') is not None, reason="mss is installed")
+def test_x11_backend_without_mss():
+    with pytest.raises(RuntimeError, match="extra x11"):
+        X11Backend()
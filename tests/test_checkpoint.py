@@ -0,0 +1,171 @@
+import os
+
+import numpy as np
+import pytest
+import torch
+
+from csc316_final_project.checkpoint import CheckpointManager, restore, snapshot_state
+from csc316_final_project.replay import REPLAY_ARRAYS, ReplayBuffer
+
+def make_model():
+    model = torch.nn.Linear(4, 2)
+    model.input_shape = (4,)
+    return model
+
+def train_step(model, optimizer):
+    optimizer.zero_grad()
+    model(torch.ones(1, 4)).sum().backward()
+    optimizer.step()
+
+def fill(buffer, start, steps):
+    buffer.start_episode(np.full((1, 2, 2), start, dtype=np.uint8))
+    for t in range(1, steps + 1):
+        buffer.add([1, 0], float(t), t == steps, np.full((1, 2, 2), start + t, dtype=np.uint8))
+
+def assert_same_buffer(a, b):
+    for name in REPLAY_ARRAYS:
+        assert (getattr(a, name) == getattr(b, name)).all(), name
+    assert (a.pos, a.size, a.filled) == (b.pos, b.size, b.filled)
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = CheckpointManager(tmp_path / 'checkpoints', keep=2)
+    yield manager
+    manager.close()
+
+def test_write_and_rotate(manager):
+    model = make_model()
+    optimizer = torch.optim.Adam(model.parameters())
+    for episode in range(1, 5):
+        manager.save(model, optimizer, episode)
+        manager.flush()
+    assert [os.path.basename(p) for p in manager.checkpoints()] == ['checkpoint_000003.pt', 'checkpoint_000004.pt']
+    assert not [name for name in os.listdir(manager.directory) if name.endswith('.tmp')]
+    assert manager.load()['episode'] == 4
+    assert manager.saved == 4
+
+def test_round_trip(manager):
+    model = make_model()
+    optimizer = torch.optim.Adam(model.parameters())
+    buffer = ReplayBuffer(16, obs_shape=(1, 2, 2), num_actions=2)
+    fill(buffer, 0, 5)
+    train_step(model, optimizer)
+    manager.save(model, optimizer, 1, replay=buffer)
+    manager.flush()
+    fill(buffer, 20, 3) # the next checkpoint only writes these
+    train_step(model, optimizer)
+    np.random.seed(123)
+    manager.save(model, optimizer, 2, replay=buffer)
+    manager.flush()
+    expected_draw = np.random.rand()
+
+    state = CheckpointManager(manager.directory).load()
+    new_model = make_model()
+    new_model.load_state_dict(state['state_dict'])
+    new_optimizer = torch.optim.Adam(new_model.parameters())
+    new_buffer = ReplayBuffer(16, obs_shape=(1, 2, 2), num_actions=2)
+    assert restore(state, new_optimizer, new_buffer) == 2
+    assert np.random.rand() == expected_draw
+    assert_same_buffer(new_buffer, buffer)
+    for a, b in zip(model.parameters(), new_model.parameters()):
+        assert torch.equal(a, b)
+    assert torch.equal(new_optimizer.state_dict()['state'][0]['exp_avg'], optimizer.state_dict()['state'][0]['exp_avg'])
+
+def test_unwritten_snapshots_are_merged(manager):
+    model = make_model()
+    optimizer = torch.optim.Adam(model.parameters())
+    buffer = ReplayBuffer(8, obs_shape=(1, 2, 2), num_actions=2)
+    with manager.condition: # the writer can't take either until we let go
+        fill(buffer, 0, 4)
+        manager.save(model, optimizer, 1, replay=buffer)
+        fill(buffer, 10, 4) # wraps around over some of the first episode
+        manager.save(model, optimizer, 2, replay=buffer)
+    manager.flush()
+    assert manager.saved == 1
+    new_buffer = ReplayBuffer(8, obs_shape=(1, 2, 2), num_actions=2)
+    restore(manager.load(), optimizer, new_buffer)
+    assert_same_buffer(new_buffer, buffer)
+
+def test_missing_replay_is_dropped(manager, tmp_path):
+    model = make_model()
+    optimizer = torch.optim.Adam(model.parameters())
+    buffer = ReplayBuffer(8, obs_shape=(1, 2, 2), num_actions=2)
+    fill(buffer, 0, 3)
+    manager.submit(snapshot_state(model, optimizer, 1, replay=buffer))
+    manager.flush()
+    for name in REPLAY_ARRAYS:
+        os.remove(os.path.join(manager.directory, 'replay', f'{name}.npy'))
+    state = manager.load()
+    assert 'replay' not in state
+    assert state['episode'] == 1
+
+def test_rotation_goes_by_write_order(manager):
+    model = make_model()
+    optimizer = torch.optim.Adam(model.parameters())
+    for episode in (40, 50):
+        manager.save(model, optimizer, episode)
+        manager.flush()
+    again = CheckpointManager(manager.directory, keep=2)
+    again.save(model, optimizer, 10)
+    again.close()
+    assert [os.path.basename(p) for p in again.checkpoints()] == ['checkpoint_000010.pt', 'checkpoint_000050.pt']
+
+def test_only_the_newest_checkpoint_has_the_replay_buffer(manager):
+    model = make_model()
+    optimizer = torch.optim.Adam(model.parameters())
+    buffer = ReplayBuffer(16, obs_shape=(1, 2, 2), num_actions=2)
+    fill(buffer, 0, 3)
+    manager.save(model, optimizer, 1, replay=buffer)
+    manager.flush()
+    fill(buffer, 10, 3)
+    manager.save(model, optimizer, 2, replay=buffer)
+    manager.flush()
+    older, newest = manager.checkpoints()
+    assert 'replay' not in manager.load(older)
+    assert 'replay' in manager.load(newest)
+
+def test_crash_before_the_replay_is_updated(manager):
+    model = make_model()
+    optimizer = torch.optim.Adam(model.parameters())
+    buffer = ReplayBuffer(16, obs_shape=(1, 2, 2), num_actions=2)
+    fill(buffer, 0, 3)
+    manager.save(model, optimizer, 1, replay=buffer)
+    manager.flush()
+    manager._apply_delta = lambda replay: None # dies after the .pt went in, before replay/ caught up
+    fill(buffer, 10, 3)
+    manager.save(model, optimizer, 2, replay=buffer)
+    manager.flush()
+
+    new_buffer = ReplayBuffer(16, obs_shape=(1, 2, 2), num_actions=2)
+    restore(CheckpointManager(manager.directory).load(), optimizer, new_buffer)
+    assert_same_buffer(new_buffer, buffer)
+
+def test_crash_before_the_checkpoint_is_written(manager):
+    model = make_model()
+    optimizer = torch.optim.Adam(model.parameters())
+    buffer = ReplayBuffer(16, obs_shape=(1, 2, 2), num_actions=2)
+    fill(buffer, 0, 3)
+    manager.save(model, optimizer, 1, replay=buffer)
+    manager.flush()
+    saved = ReplayBuffer(16, obs_shape=(1, 2, 2), num_actions=2)
+    saved.load_state_dict(buffer.state_dict())
+    fill(buffer, 10, 3)
+    manager._write_delta(buffer.state_dict(changed_only=True), 'checkpoint_000002') # and then no .pt
+
+    again = CheckpointManager(manager.directory)
+    assert not [name for name in os.listdir(again.replay_dir) if 'delta' in name]
+    new_buffer = ReplayBuffer(16, obs_shape=(1, 2, 2), num_actions=2)
+    restore(again.load(), optimizer, new_buffer)
+    assert_same_buffer(new_buffer, saved)
+
+def test_final_checkpoint_with_the_async_learner(manager, tmp_path, monkeypatch):
+    from csc316_final_project.neural import HollowNN, train_model
+    from csc316_final_project.vector_env import make_envs
+    monkeypatch.chdir(tmp_path) # train_model saves the final model to the working directory
+    env = make_envs(1, max_episode_steps=3)[0]
+    try:
+        train_model(HollowNN((3, 84, 84)), env, None, episodes=3, replay=ReplayBuffer(64), async_learner=True, learning_starts=10_000, checkpoints=manager, checkpoint_every=2)
+    finally:
+        env.perception.close()
+    assert [os.path.basename(p) for p in manager.checkpoints()] == ['checkpoint_000002.pt', 'checkpoint_000003.pt']
+    assert len(manager.load()['replay']['arrays']['obs']) == 3 * 4
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+SRC = str(Path(__file__).resolve().parent.parent / 'src')
+
+def run_cli(*args):
+    env = {**os.environ, 'PYTHONPATH': SRC}
+    return subprocess.run([sys.executable, '-c', 'from csc316_final_project import cli; cli()', *args], capture_output=True, text=True, env=env, timeout=120)
+
+@pytest.mark.parametrize('args', [('--import-time', '--help'), ('--import-time', 'train', '--help')])
+def test_import_time_report_covers_help(args):
+    result = run_cli(*args)
+    assert result.returncode == 0
+    assert 'Usage:' in result.stdout
+    assert 'Import time:' in result.stderr
+
+def test_help_stays_light():
+    # the heavy imports only happen inside the commands that need them
+    result = run_cli('--import-time', 'train', '--help')
+    packages = {line.split()[0] for line in result.stderr.splitlines() if line.startswith('  ')}
+    assert not packages & {'torch', 'ultralytics', 'cv2', 'pynput', 'obsws_python'}
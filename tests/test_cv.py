@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from csc316_final_project.cv import HealthDetector, _get_player_health_full_frame, get_player_health
+
+def hud_frame(masks, width=1280, height=720, seed=0):
+    # a dim noisy frame with `masks` health masks in a row at the top left, where the game draws them
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 40, (height, width, 3), dtype=np.uint8)
+    template = HealthDetector().template
+    h, w = template.shape
+    for i in range(masks):
+        x, y = width // 10 + i * (w + 4), height // 12
+        frame[y:y + h, x:x + w] = template[..., None]
+    return frame
+
+@pytest.mark.parametrize('masks', [0, 1, 3, 5, 9])
+def test_counts_masks(masks):
+    assert get_player_health(hud_frame(masks)) == masks
+
+@pytest.mark.parametrize('size', [(1280, 720), (1920, 1080), (800, 600)])
+def test_matches_the_full_frame_version(size):
+    for masks, seed in [(0, 1), (2, 2), (5, 3), (8, 4)]:
+        frame = hud_frame(masks, *size, seed=seed)
+        assert HealthDetector().count(frame) == _get_player_health_full_frame(frame) == masks
+
+def test_ignores_masks_outside_the_hud():
+    frame = hud_frame(2)
+    template = HealthDetector().template
+    h, w = template.shape
+    frame[500:500 + h, 900:900 + w] = template[..., None] # lower right, outside the ROI
+    assert get_player_health(frame) == 2
+    assert _get_player_health_full_frame(frame) == 3
+
+def test_tiny_window():
+    assert HealthDetector().count(np.zeros((20, 20, 3), dtype=np.uint8)) == 0
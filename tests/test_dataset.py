@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from csc316_final_project.dataset import EpisodeRecorder, OfflineDataset
+
+SHAPE = (3, 4, 4)
+
+def frame(value):
+    return np.full(SHAPE, value % 256, dtype=np.uint8)
+
+def state(value):
+    return {'player_health': value % 5, 'enemy_damaged': value % 2 == 0}
+
+def record(recorder, start, steps, done=True):
+    recorder.start_episode(frame(start), state(start))
+    for t in range(1, steps + 1):
+        recorder.add([t % 2, 1, 0], float(start + t), done and t == steps, frame(start + t), state(start + t))
+
+def values(obs):
+    return obs.reshape(len(obs), -1).astype(int)
+
+def test_round_trip_across_chunks(tmp_path):
+    recorder = EpisodeRecorder(tmp_path, chunk_size=4, frame_shape=SHAPE, flush_every=2)
+    record(recorder, 0, 5)
+    record(recorder, 100, 3)
+    recorder.close()
+    assert sorted(p.name for p in tmp_path.iterdir()) == [f'chunk_{i:05}' for i in range(3)] # 10 rows, 4 to a chunk
+
+    dataset = OfflineDataset(tmp_path, num_actions=3)
+    assert len(dataset) == 8
+    assert dataset.rewards[dataset.transitions].tolist() == [1, 2, 3, 4, 5, 101, 102, 103]
+    batch = dataset.sample(200, np.random.default_rng(0))
+    obs, next_obs = values(batch['obs'])[:, 0], values(batch['next_obs'])[:, 0]
+    assert (next_obs == obs + 1).all()
+    assert (batch['rewards'] == next_obs).all()
+    assert (batch['dones'] == np.isin(next_obs, [5, 103])).all()
+    assert (batch['actions'][:, 0] == next_obs % 2).all() and batch['actions'][:, 1].all()
+
+def test_episode_without_done(tmp_path):
+    recorder = EpisodeRecorder(tmp_path, chunk_size=16, frame_shape=SHAPE)
+    record(recorder, 0, 3, done=False)
+    record(recorder, 50, 2)
+    recorder.close()
+    dataset = OfflineDataset(tmp_path, num_actions=3)
+    assert len(dataset) == 5
+    batch = dataset.sample(100, np.random.default_rng(0))
+    assert (values(batch['next_obs']) == values(batch['obs']) + 1).all()
+
+def test_frame_stacks_stay_in_their_episode(tmp_path):
+    recorder = EpisodeRecorder(tmp_path, chunk_size=3, frame_shape=SHAPE)
+    record(recorder, 0, 4)
+    record(recorder, 10, 4)
+    recorder.close()
+    dataset = OfflineDataset(tmp_path, frame_stack=3, num_actions=3)
+    batch = dataset.sample(200, np.random.default_rng(0))
+    for stack in values(batch['obs'])[:, ::SHAPE[1] * SHAPE[2] * SHAPE[0]]:
+        newest = stack[-1]
+        start = 10 if newest >= 10 else 0
+        assert stack.tolist() == [max(start, newest - 2), max(start, newest - 1), newest]
+
+def test_new_recorder_appends_new_chunks(tmp_path):
+    for start in (0, 20):
+        recorder = EpisodeRecorder(tmp_path, chunk_size=64, frame_shape=SHAPE)
+        record(recorder, start, 2)
+        recorder.close()
+    assert len(OfflineDataset(tmp_path, num_actions=3)) == 4
+
+def test_minibatches(tmp_path):
+    recorder = EpisodeRecorder(tmp_path, chunk_size=8, frame_shape=SHAPE)
+    record(recorder, 0, 10)
+    recorder.close()
+    dataset = OfflineDataset(tmp_path, num_actions=3)
+    batches = list(dataset.minibatches(4, 5, prefetch=2, seed=0))
+    assert len(batches) == 5 and all(len(batch['obs']) == 4 for batch in batches)
+    # stopping early doesn't leave the reader stuck
+    for _ in dataset.minibatches(4, 100, prefetch=1, seed=0):
+        break
+
+def test_empty_directory(tmp_path):
+    with pytest.raises(RuntimeError, match="no recorded chunks"):
+        OfflineDataset(tmp_path)
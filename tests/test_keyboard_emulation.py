@@ -0,0 +1,73 @@
+import pytest
+
+from csc316_final_project.keyboard_emulation import ActionScheduler, NullController
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make(**kwargs):
+    clock = FakeClock()
+    controller = NullController(record=True, clock=clock)
+    return ActionScheduler(controller, clock=clock, **kwargs), controller, clock
+
+def controls(*pressed):
+    return {action: action in pressed for action in ('left', 'right', 'jump', 'attack')}
+
+def events(controller):
+    return [(kind, action) for _, kind, action in controller.events]
+
+def test_only_changes_reach_the_controller():
+    scheduler, controller, _ = make()
+    assert scheduler.output(controls('left', 'jump'))
+    assert not scheduler.output(controls('left', 'jump'))
+    assert scheduler.output(controls('left', 'attack'))
+    assert events(controller) == [('press', 'left'), ('press', 'jump'), ('release', 'jump'), ('press', 'attack')]
+    assert scheduler.outputs == 3 and scheduler.key_events == 4
+
+def test_releases_go_first():
+    scheduler, controller, _ = make()
+    scheduler.output(controls('left'))
+    controller.events.clear()
+    scheduler.output(controls('right'))
+    assert events(controller) == [('release', 'left'), ('press', 'right')]
+
+def test_min_hold():
+    scheduler, controller, clock = make(min_hold={'jump': 0.2})
+    scheduler.output(controls('jump'))
+    clock.now = 0.1
+    assert not scheduler.output(controls()) # too soon to let go
+    assert controller.pressed_keys == {'jump'}
+    clock.now = 0.15
+    assert not scheduler.output(controls()) # same controls, but still held back
+    clock.now = 0.2
+    assert scheduler.output(controls())
+    assert controller.pressed_keys == set()
+    assert events(controller) == [('press', 'jump'), ('release', 'jump')]
+    assert [t for t, _, _ in controller.events] == [0.0, 0.2]
+
+def test_held_back_key_pressed_again():
+    scheduler, controller, clock = make(min_hold={'jump': 0.2})
+    scheduler.output(controls('jump'))
+    clock.now = 0.1
+    scheduler.output(controls())
+    assert not scheduler.output(controls('jump')) # never went up, nothing to do
+    clock.now = 0.5
+    assert not scheduler.output(controls('jump'))
+    assert events(controller) == [('press', 'jump')]
+
+def test_release_all_ignores_min_hold():
+    scheduler, controller, _ = make(min_hold={'jump': 10})
+    scheduler.output(controls('jump', 'left'))
+    scheduler.release_all()
+    assert controller.pressed_keys == set()
+    assert scheduler.output(controls('jump')) # starts from scratch
+    scheduler.stop()
+    assert not scheduler.running and controller.pressed_keys == set()
+
+def test_repeat_has_to_be_positive():
+    with pytest.raises(ValueError):
+        ActionScheduler(NullController(), repeat=0)
@@ -0,0 +1,88 @@
+import threading
+
+import numpy as np
+import torch
+
+from csc316_final_project.learner import Learner
+from csc316_final_project.neural import HollowNN
+from csc316_final_project.replay import ReplayBuffer
+
+SHAPE = (3, 84, 84)
+
+def frame(value):
+    return np.full(SHAPE, value, dtype=np.uint8)
+
+def make_learner(queue_size=4096, **kwargs):
+    torch.manual_seed(0)
+    replay = ReplayBuffer(64, SHAPE)
+    # learning_starts out of reach: these tests are about what reaches the buffer, not training
+    return Learner(HollowNN(SHAPE), 'cpu', replay=replay, learning_starts=10_000, queue_size=queue_size, **kwargs), replay
+
+def play(learner, start, steps):
+    learner.start_episode(frame(start))
+    for t in range(1, steps + 1):
+        learner.submit([1, 0, 0, 0, 0, 0, 0], 1.0, t == steps, frame(start + t))
+
+def linked(replay):
+    # every transition in the buffer goes from frame v to frame v + 1
+    indices = np.flatnonzero(replay.valid)
+    obs = replay.obs[indices, 0, 0, 0].astype(int)
+    next_obs = replay.obs[(indices + 1) % replay.capacity, 0, 0, 0].astype(int)
+    return (next_obs == obs + 1).all()
+
+def test_transitions_reach_the_buffer():
+    learner, replay = make_learner()
+    learner.start()
+    play(learner, 0, 5)
+    play(learner, 100, 5)
+    learner.stop()
+    assert len(replay) == 10
+    assert linked(replay)
+
+def test_full_queue_drops_the_rest_of_the_episode():
+    learner, replay = make_learner(queue_size=4)
+    play(learner, 0, 6) # not started yet, so only the first four items fit
+    play(learner, 100, 2)
+    assert learner.dropped == 3 + 3
+    assert learner.broken_episodes == 2
+    learner.start()
+    play(learner, 200, 3)
+    learner.stop()
+    assert linked(replay)
+    assert len(replay) == 3 + 3
+    assert learner.stats()['broken_episodes'] == 2
+
+def test_call_runs_on_the_learner_thread_in_order():
+    learner, replay = make_learner()
+    learner.start()
+    play(learner, 0, 3)
+    seen = []
+    assert learner.call(lambda: seen.append((threading.current_thread().name, len(replay))))
+    learner.stop()
+    assert seen == [('learner', 3)]
+
+def test_sync_actor_picks_up_published_weights():
+    learner, _ = make_learner()
+    assert not learner.sync_actor()
+    with torch.no_grad():
+        next(learner.model.parameters()).add_(1.0)
+    with learner.lock:
+        learner._publish()
+    assert learner.sync_actor()
+    assert not learner.sync_actor()
+    for a, b in zip(learner.model.parameters(), learner.actor.module.parameters()):
+        assert torch.equal(a, b)
+
+def test_stop_with_a_full_queue_and_a_dead_thread():
+    learner, _ = make_learner(queue_size=2)
+    learner.start()
+    learner.call(lambda: 1 / 0)
+    learner._thread.join(5)
+    learner.queue.put_nowait(('start', frame(0)))
+    learner.queue.put_nowait(('start', frame(0)))
+    try:
+        learner.stop()
+    except RuntimeError as e:
+        assert isinstance(e.__cause__, ZeroDivisionError)
+    else:
+        assert False, "stop() should report the learner's error"
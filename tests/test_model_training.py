@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from csc316_final_project.model_training import build_dataset
+
+def make_assets(tmp_path):
+    sprites, backgrounds = tmp_path / 'sprites', tmp_path / 'backgrounds'
+    sprites.mkdir()
+    backgrounds.mkdir()
+    rng = np.random.default_rng(0)
+    for i in range(2):
+        sprite = rng.integers(0, 255, (24, 16, 4), dtype=np.uint8)
+        sprite[..., 3] = 255
+        Image.fromarray(sprite, 'RGBA').save(sprites / f'sprite_{i}.png')
+        Image.fromarray(rng.integers(0, 255, (96, 128, 3), dtype=np.uint8)).save(backgrounds / f'background_{i}.png')
+    return sprites, backgrounds
+
+def build(tmp_path, sprites, backgrounds, **kwargs):
+    kwargs = {'num_images': 12, 'workers': 1, 'chunk_size': 4, **kwargs}
+    return build_dataset(str(sprites), str(backgrounds), str(tmp_path / 'dataset'), **kwargs)
+
+def images(tmp_path):
+    return {split: sorted(os.listdir(tmp_path / 'dataset' / 'images' / split)) for split in ('train', 'val')}
+
+def test_rebuild_only_redoes_what_changed(tmp_path):
+    sprites, backgrounds = make_assets(tmp_path)
+    assert build(tmp_path, sprites, backgrounds) == {'generated': 12, 'relinked': 0, 'unchanged': 0, 'removed': 0}
+    first = images(tmp_path)
+    assert sum(map(len, first.values())) == 12
+    assert len(os.listdir(tmp_path / 'dataset' / 'labels' / 'train')) == len(first['train'])
+
+    assert build(tmp_path, sprites, backgrounds) == {'generated': 0, 'relinked': 0, 'unchanged': 12, 'removed': 0}
+    assert images(tmp_path) == first
+
+    counts = build(tmp_path, sprites, backgrounds, split_ratio=0.5)
+    assert counts['generated'] == 0 and counts['relinked'] > 0
+    assert sum(map(len, images(tmp_path).values())) == 12
+
+    assert build(tmp_path, sprites, backgrounds, num_images=8, split_ratio=0.5)['removed'] == 4
+    assert sum(map(len, images(tmp_path).values())) == 8
+
+def test_changed_asset_is_redrawn(tmp_path):
+    sprites, backgrounds = make_assets(tmp_path)
+    build(tmp_path, sprites, backgrounds)
+    Image.new('RGB', (128, 96), 'black').save(backgrounds / 'background_0.png')
+    counts = build(tmp_path, sprites, backgrounds)
+    assert 0 < counts['generated'] < 12
+    assert counts['generated'] + counts['unchanged'] == 12
@@ -0,0 +1,52 @@
+import random
+
+from csc316_final_project.monitor import MessageReader, action_keys, decode_message, encode_message
+
+STATES = [
+    {'episode': 1, 'reward': 0.5},
+    {'run_id': 'trainer-2', 'obs_status': 1},
+    {'controller_input': {key: key in ('left', 'jump') for key in action_keys}},
+    {},
+    {'episode': 2, 'reward': -3.25, 'profile': (30.0, 20.0, 40.0, 60.0)},
+]
+
+def stream():
+    return b''.join(encode_message(state) for state in STATES)
+
+def test_one_message():
+    for state in STATES:
+        assert MessageReader().feed(encode_message(state)) == [state]
+
+def test_byte_at_a_time():
+    reader = MessageReader()
+    messages = []
+    for byte in stream():
+        messages += reader.feed(bytes([byte]))
+    assert messages == STATES
+    assert not reader.buffer
+
+def test_random_chunks():
+    data = stream()
+    rng = random.Random(0)
+    for _ in range(50):
+        reader = MessageReader()
+        messages = []
+        i = 0
+        while i < len(data):
+            n = rng.randint(1, 12)
+            messages += reader.feed(data[i:i + n])
+            i += n
+        assert messages == STATES
+
+def test_partial_message_waits():
+    data = encode_message(STATES[0])
+    reader = MessageReader()
+    assert reader.feed(data[:1]) == []
+    assert reader.feed(data[1:-1]) == []
+    assert reader.feed(data[-1:] + data[:3]) == [STATES[0]]
+    assert reader.feed(data[3:]) == [STATES[0]]
+
+def test_unknown_fields_are_skipped():
+    body = bytes([99, 3, 1, 2, 3]) + encode_message({'episode': 7})[2:]
+    assert decode_message(body) == {'episode': 7}
+    assert encode_message({'episode': 7, 'not_a_field': 1}) == encode_message({'episode': 7})
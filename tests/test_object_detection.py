@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from csc316_final_project import object_detection
+from csc316_final_project.object_detection import FalseKnightTracker
+
+BOX = (60, 50, 40, 60)
+
+def boss_frame(t, flash=False):
+    # a textured box drifting right over a dark background
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 30, (240, 320, 3), dtype=np.uint8)
+    x, y, w, h = BOX
+    x += 2 * t
+    if flash:
+        frame[y:y + h, x:x + w] = 255
+    else:
+        frame[y:y + h, x:x + w] = (np.arange(h)[:, None, None] * 2 + np.array([60, 40, 20])).astype(np.uint8)
+        frame[y + 10:y + 30, x + 10:x + 30] = (200, 200, 80)
+    return frame
+
+class FakeDetector:
+    # stands in for YOLO: knows where the box is, and counts how often it's asked
+
+    def __init__(self):
+        self.t = 0
+        self.calls = 0
+        self.found = True
+
+    def find(self, frame):
+        self.calls += 1
+        if not self.found:
+            return None
+        x, y, w, h = BOX
+        return (x + 2 * self.t, y, w, h)
+
+def run(tracker, detector, frames):
+    boxes = []
+    for t in range(frames):
+        detector.t = t
+        boxes.append(tracker.locate(boss_frame(t)))
+    return boxes
+
+def test_tracks_between_detections():
+    # with whatever opencv is installed: CSRT with contrib, MIL without
+    assert object_detection._tracker_factory() is not None
+    detector = FakeDetector()
+    tracker = FalseKnightTracker(detector, detect_every_n=5)
+    boxes = run(tracker, detector, 20)
+    assert detector.calls == 4
+    assert all(box is not None for box in boxes)
+    for t, (x, y, w, h) in enumerate(boxes):
+        assert abs(x - (BOX[0] + 2 * t)) <= 10 and abs(y - BOX[1]) <= 10
+    assert tracker.episode_stats() == {'yolo_calls': 4, 'yolo_skipped': 16, 'tracker_losses': 0}
+
+def test_without_a_tracker_detects_every_frame(monkeypatch):
+    monkeypatch.setattr(object_detection, '_tracker_factory', lambda: None)
+    detector = FakeDetector()
+    tracker = FalseKnightTracker(detector, detect_every_n=5)
+    boxes = run(tracker, detector, 10)
+    assert detector.calls == 10
+    assert boxes[-1] == (BOX[0] + 18, *BOX[1:])
+
+def test_gives_up_after_max_missed_frames():
+    detector = FakeDetector()
+    tracker = FalseKnightTracker(detector, detect_every_n=3, max_missed_frames=4)
+    run(tracker, detector, 1)
+    detector.found = False
+    boxes = run(tracker, detector, 8)
+    assert boxes[-1] is None
+    assert tracker.tracker_losses >= 1
+
+@pytest.mark.parametrize('flash', [False, True])
+def test_detect_hit(flash):
+    detector = FakeDetector()
+    tracker = FalseKnightTracker(detector)
+    assert tracker.detect_hit(boss_frame(0, flash=flash)) == flash
@@ -0,0 +1,82 @@
+import socket
+import time
+
+import pytest
+
+from csc316_final_project.obs import OBSBridge
+from csc316_final_project.obs_stub import StubOBS
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+@pytest.fixture
+def stub():
+    with StubOBS(password='secret') as stub:
+        yield stub
+
+@pytest.fixture
+def bridge(stub):
+    bridge = OBSBridge(stub.host, stub.port, 'secret', record_every_n=2, timeout=2.0, retry_interval=0.2)
+    wait_until(lambda: bridge.connected)
+    yield bridge
+    bridge.close()
+
+def test_records_every_nth_episode(stub, bridge):
+    assert bridge.status == 2
+    bridge.start_record(0) # not a recorded episode
+    bridge.stop_record()
+    bridge.start_record(1)
+    wait_until(lambda: bridge.is_recording)
+    assert bridge.status == 1
+    bridge.stop_record()
+    wait_until(lambda: not bridge.is_recording)
+    assert stub.requests.count('StartRecord') == 1
+    assert stub.requests.count('StopRecord') == 1 # the first stop had nothing to stop
+
+def test_status_comes_from_events(stub, bridge):
+    requests = len(stub.requests)
+    for _ in range(100):
+        bridge.status, bridge.is_recording, bridge.connected
+    assert len(stub.requests) == requests
+    assert bridge.get_record_directory == stub.record_directory
+
+def test_commands_dont_wait_for_obs(stub, bridge):
+    stub.delay = 0.5
+    started = time.monotonic()
+    bridge.start_record(1)
+    bridge.stop_record()
+    assert time.monotonic() - started < 0.1
+    wait_until(lambda: stub.requests.count('StopRecord') == 1 and not stub.recording)
+    wait_until(lambda: not bridge.is_recording)
+
+def test_picks_up_recording_already_running(stub):
+    stub.recording = True
+    bridge = OBSBridge(stub.host, stub.port, 'secret', timeout=2.0)
+    try:
+        wait_until(lambda: bridge.connected)
+        assert bridge.is_recording
+    finally:
+        bridge.close()
+
+def test_without_obs(capsys):
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        port = sock.getsockname()[1] # nothing listens here once it's closed
+    bridge = OBSBridge('localhost', port, timeout=0.5, retry_interval=60)
+    try:
+        bridge.start_record(4)
+        bridge.stop_record()
+        wait_until(lambda: "OBS not connected" in capsys.readouterr().out)
+        assert bridge.status == 3 and not bridge.is_recording
+        assert bridge.get_record_directory is None
+    finally:
+        bridge.close()
+
+def test_notices_obs_going_away(stub, bridge):
+    stub.stop()
+    bridge.start_record(1)
+    wait_until(lambda: not bridge.connected)
+    assert bridge.status == 3
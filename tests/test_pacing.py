@@ -0,0 +1,63 @@
+import pytest
+
+from csc316_final_project.pacing import RateScheduler
+
+class FakeClock:
+    # time only moves when the loop "works" or the scheduler sleeps
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+def run(scheduler, clock, step_times):
+    for busy in step_times:
+        clock.now += busy
+        scheduler.wait()
+
+def make(policy='skip', hz=10, **kwargs):
+    clock = FakeClock()
+    return RateScheduler(hz, policy, clock=clock, sleep=clock.sleep, **kwargs), clock
+
+def test_keeps_to_the_grid():
+    scheduler, clock = make()
+    run(scheduler, clock, [0.03] * 20)
+    stats = scheduler.stats()
+    assert clock.now == pytest.approx(2.0)
+    assert stats['achieved_hz'] == pytest.approx(10)
+    assert stats['overruns'] == stats['skipped'] == 0
+    assert stats['jitter_ms'] == pytest.approx(0, abs=1e-6)
+
+def test_skip_drops_missed_slots():
+    scheduler, clock = make()
+    run(scheduler, clock, [0.05, 0.35, 0.05])
+    stats = scheduler.stats()
+    assert stats['overruns'] == 1
+    assert stats['skipped'] == 2 # the 0.3 and 0.4 slots; the 0.2 one just ran late
+    # back on a grid from where we caught up, not rushing through the missed slots
+    assert clock.now == pytest.approx(0.1 + 0.35 + 0.1)
+
+def test_downshift_and_recover():
+    scheduler, clock = make('downshift', window=5, recover_after=2)
+    run(scheduler, clock, [0.25] * 5)
+    assert scheduler.hz == pytest.approx(8)
+    run(scheduler, clock, [0.25] * 20)
+    assert scheduler.hz == pytest.approx(5) # min_hz: half the target
+    run(scheduler, clock, [0.01] * 50)
+    assert scheduler.hz == pytest.approx(10)
+
+def test_frameskip():
+    scheduler, clock = make('frameskip', window=5, recover_after=1, max_frame_skip=2)
+    run(scheduler, clock, [0.25] * 15)
+    assert scheduler.frame_skip == 2
+    assert scheduler.hz == 10
+    run(scheduler, clock, [0.01] * 10)
+    assert scheduler.frame_skip == 0
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        RateScheduler(10, 'rush')
@@ -0,0 +1,59 @@
+from collections import deque
+
+import numpy as np
+
+from csc316_final_project.perception import FrameStack
+from csc316_final_project.replay import ReplayBuffer
+
+SHAPE = (3, 4, 4)
+
+def frame(value):
+    return np.full(SHAPE, value, dtype=np.uint8)
+
+def test_reset_repeats_the_first_frame():
+    stack = FrameStack(3, SHAPE)
+    obs = stack.reset(frame(7))
+    assert stack.obs_shape == obs.shape == (9, 4, 4)
+    assert (obs == 7).all()
+
+def test_matches_a_deque_of_frames():
+    k = 4
+    stack = FrameStack(k, SHAPE)
+    frames = deque([frame(0)] * k, maxlen=k)
+    stack.reset(frame(0))
+    for t in range(1, 20):
+        frames.append(frame(t))
+        obs = stack.push(frame(t))
+        assert (obs == np.concatenate(frames)).all(), t
+        assert obs[::3, 0, 0].tolist() == [max(0, t - 3), max(0, t - 2), max(0, t - 1), t] # oldest first
+
+def test_view_is_zero_copy():
+    stack = FrameStack(3, SHAPE)
+    obs = stack.reset(frame(1))
+    assert np.shares_memory(obs, stack.buffer)
+    obs = stack.push(frame(2))
+    assert obs.base is not None and np.shares_memory(obs, stack.buffer)
+
+def test_single_frame():
+    stack = FrameStack(1, SHAPE)
+    stack.reset(frame(1))
+    assert (stack.push(frame(2)) == frame(2)).all()
+
+def test_agrees_with_the_replay_buffer():
+    # what the model sees while acting is what it trains on later
+    k = 3
+    stack = FrameStack(k, SHAPE)
+    buffer = ReplayBuffer(32, SHAPE, num_actions=1, frame_stack=k)
+    acted = []
+    for start in (0, 100):
+        acted.append(stack.reset(frame(start)).copy())
+        buffer.start_episode(frame(start))
+        for t in range(1, 6):
+            obs = stack.push(frame(start + t))
+            buffer.add([0], 0.0, t == 5, frame(start + t))
+            if t < 5:
+                acted.append(obs.copy())
+    indices = np.flatnonzero(buffer.valid)
+    assert len(indices) == len(acted)
+    for index, obs in zip(indices, buffer._gather(indices)):
+        assert (obs == acted.pop(0)).all(), index
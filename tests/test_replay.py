@@ -0,0 +1,102 @@
+import numpy as np
+
+from csc316_final_project.replay import ReplayBuffer, pack_actions, unpack_actions
+
+# every observation is a single pixel holding a step number, so a sampled frame says which slot it came from
+
+def frame(value):
+    return np.full((1, 1, 1), value, dtype=np.uint8)
+
+def play(buffer, start, steps, done=True):
+    # one episode: observations start, start + 1, ..., start + steps
+    buffer.start_episode(frame(start))
+    for t in range(1, steps + 1):
+        buffer.add([t % 2, 0, 1], reward=float(start + t), done=done and t == steps, next_obs=frame(start + t))
+
+def values(obs):
+    return obs.reshape(len(obs), -1).astype(int)
+
+def test_pack_actions_round_trip():
+    actions = [1, 0, 1, 1, 0, 0, 1]
+    assert pack_actions(actions) == 0b1001101
+    assert unpack_actions(np.array([pack_actions(actions)], dtype=np.uint8), 7).tolist() == [[bool(a) for a in actions]]
+
+def test_next_obs_is_the_following_slot():
+    buffer = ReplayBuffer(16, obs_shape=(1, 1, 1), num_actions=3)
+    play(buffer, 0, 5)
+    assert len(buffer) == 5
+    batch = buffer.sample(200, np.random.default_rng(0))
+    obs, next_obs = values(batch['obs'])[:, 0], values(batch['next_obs'])[:, 0]
+    assert (next_obs == obs + 1).all()
+    assert (batch['rewards'] == next_obs).all()
+    assert (batch['dones'] == (next_obs == 5)).all()
+    assert (batch['actions'][:, 0] == next_obs % 2).all()
+
+def test_episode_end_leaves_a_padding_slot():
+    buffer = ReplayBuffer(16, obs_shape=(1, 1, 1), num_actions=3)
+    play(buffer, 0, 3)
+    play(buffer, 10, 3)
+    # slot 3 holds episode one's final observation: a next_obs, never a transition of its own
+    assert buffer.valid[:8].tolist() == [True, True, True, False, True, True, True, False]
+    assert buffer.first[:8].tolist() == [True, False, False, False, True, False, False, False]
+    batch = buffer.sample(500, np.random.default_rng(0))
+    obs, next_obs = values(batch['obs'])[:, 0], values(batch['next_obs'])[:, 0]
+    assert 3 not in obs and 13 not in obs
+    assert (next_obs == obs + 1).all()
+
+def test_cut_short_episode_keeps_its_last_next_obs():
+    buffer = ReplayBuffer(16, obs_shape=(1, 1, 1), num_actions=3)
+    play(buffer, 0, 3, done=False) # e.g. a crash, or a step the learner had to drop
+    play(buffer, 10, 2)
+    assert buffer.obs[:4].ravel().tolist() == [0, 1, 2, 3]
+    batch = buffer.sample(200, np.random.default_rng(0))
+    assert (values(batch['next_obs']) == values(batch['obs']) + 1).all()
+
+def test_episode_without_steps_is_overwritten():
+    buffer = ReplayBuffer(16, obs_shape=(1, 1, 1), num_actions=3)
+    buffer.start_episode(frame(0))
+    play(buffer, 10, 2)
+    assert buffer.obs[:3].ravel().tolist() == [10, 11, 12]
+
+def test_frame_stack_stops_at_the_episode_start():
+    buffer = ReplayBuffer(16, obs_shape=(1, 1, 1), num_actions=3, frame_stack=3)
+    play(buffer, 0, 4)
+    play(buffer, 10, 4)
+    batch = buffer.sample(500, np.random.default_rng(0))
+    for stack, next_stack in zip(values(batch['obs']), values(batch['next_obs'])):
+        start = 10 if stack[-1] >= 10 else 0
+        newest = stack[-1]
+        assert stack.tolist() == [max(start, newest - 2), max(start, newest - 1), newest]
+        assert next_stack.tolist() == [max(start, newest - 1), newest, newest + 1]
+
+def test_wraparound_overwrites_the_oldest():
+    buffer = ReplayBuffer(4, obs_shape=(1, 1, 1), num_actions=3, frame_stack=2)
+    play(buffer, 0, 10, done=False)
+    assert buffer.filled == 4
+    assert len(buffer) == 3 # the fourth slot holds the current observation
+    batch = buffer.sample(200, np.random.default_rng(0))
+    obs, next_obs = values(batch['obs']), values(batch['next_obs'])
+    assert set(obs[:, 1].tolist()) == {7, 8, 9}
+    assert (next_obs[:, 1] == obs[:, 1] + 1).all()
+    # the oldest frame left doesn't stack onto the newest one, it repeats instead
+    assert ((obs[:, 1] - obs[:, 0]) <= 1).all() and (obs[:, 0] >= 7).all()
+
+def test_state_dict_round_trip():
+    buffer = ReplayBuffer(8, obs_shape=(1, 1, 1), num_actions=3)
+    play(buffer, 0, 3)
+    play(buffer, 10, 2, done=False)
+    copy = ReplayBuffer(8, obs_shape=(1, 1, 1), num_actions=3)
+    copy.load_state_dict(buffer.state_dict())
+    for name in ('obs', 'actions', 'rewards', 'dones', 'valid', 'first'):
+        assert (getattr(copy, name) == getattr(buffer, name)).all(), name
+    assert (copy.pos, copy.size, copy.filled) == (buffer.pos, buffer.size, buffer.filled)
+
+def test_changed_only_state_dict():
+    buffer = ReplayBuffer(8, obs_shape=(1, 1, 1), num_actions=3)
+    play(buffer, 0, 2, done=False)
+    assert buffer.state_dict(changed_only=True)['indices'].tolist() == [0, 1, 2]
+    assert buffer.state_dict(changed_only=True)['indices'].tolist() == []
+    buffer.add([0, 0, 0], 1.0, False, frame(3))
+    delta = buffer.state_dict(changed_only=True)
+    assert delta['indices'].tolist() == [2, 3]
+    assert delta['arrays']['obs'].ravel().tolist() == [2, 3]
@@ -0,0 +1,107 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import pytest
+
+from csc316_final_project.util import HyprlandProvider, StaticWindowProvider, WindowTracker
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+class EventProvider(StaticWindowProvider):
+    # a window whose moves come with a window manager event
+
+    def __init__(self, bbox=(0, 0, 1920, 1080)):
+        super().__init__(bbox)
+        self.on_change = None
+        self.watching = threading.Event()
+
+    def watch(self, on_change, stop):
+        self.on_change = on_change
+        self.watching.set()
+        stop.wait()
+        return True
+
+    def move(self, bbox):
+        super().move(bbox)
+        self.on_change()
+
+class FlakyProvider(StaticWindowProvider):
+    def __init__(self):
+        super().__init__()
+        self.fail = False
+
+    def query(self):
+        if self.fail:
+            raise RuntimeError("window is gone")
+        return super().query()
+
+def test_get_is_cached():
+    provider = StaticWindowProvider((10, 20, 640, 480))
+    with WindowTracker(provider, watch_events=False) as window:
+        assert [window() for _ in range(100)] == [(10, 20, 640, 480)] * 100
+    assert provider.queries == 1
+
+def test_invalidate_requeries_on_the_next_get():
+    provider = StaticWindowProvider()
+    with WindowTracker(provider, watch_events=False) as window:
+        provider.move((5, 5, 100, 100))
+        assert window() == (0, 0, 1920, 1080)
+        window.invalidate()
+        assert window() == (5, 5, 100, 100)
+    assert provider.queries == 2
+
+def test_events_refresh_the_cache():
+    provider = EventProvider()
+    with WindowTracker(provider) as window:
+        provider.watching.wait(5)
+        provider.move((1, 2, 3, 4))
+        assert window() == (1, 2, 3, 4)
+        assert provider.queries == 2
+
+def test_polling_refreshes_the_cache():
+    provider = StaticWindowProvider()
+    with WindowTracker(provider, poll_interval=0.01, watch_events=False) as window:
+        provider.move((7, 7, 70, 70))
+        wait_until(lambda: window() == (7, 7, 70, 70))
+
+def test_failed_background_refresh_surfaces_on_get():
+    provider = FlakyProvider()
+    with WindowTracker(provider, poll_interval=0.01, watch_events=False) as window:
+        provider.fail = True
+        wait_until(lambda: window._bbox is None)
+        with pytest.raises(RuntimeError, match="gone"):
+            window()
+
+def test_hyprland_events(monkeypatch):
+    # a fake hyprland event socket (in a short directory: unix socket paths are limited to ~100 bytes)
+    runtime = tempfile.mkdtemp(prefix='hypr-')
+    os.makedirs(os.path.join(runtime, 'hypr', 'test'))
+    monkeypatch.setenv('XDG_RUNTIME_DIR', runtime)
+    monkeypatch.setenv('HYPRLAND_INSTANCE_SIGNATURE', 'test')
+    path = HyprlandProvider.event_socket_path()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(1)
+    changes = []
+    stop = threading.Event()
+    watcher = threading.Thread(target=lambda: HyprlandProvider().watch(lambda: changes.append(1), stop))
+    watcher.start()
+    try:
+        conn, _ = server.accept()
+        conn.sendall(b"activewindow>>kitty,~\nopenlayer>>panel\nmovewin") # split mid-line
+        conn.sendall(b"dowv2>>55d0,1,1\n")
+        wait_until(lambda: changes == [1])
+        conn.sendall(b"workspacev2>>2,2\n")
+        wait_until(lambda: changes == [1, 1])
+    finally:
+        stop.set()
+        watcher.join(5)
+        server.close()
+        os.unlink(path)